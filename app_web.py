@@ -1,4 +1,6 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 import hashlib
 import pandas as pd
@@ -10,9 +12,30 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 import math
-
-
-WORKER_URL = "https://admin.bonbon-peach.com/api"
+import graphlib
+import json
+import os
+import gzip
+import bisect
+import io
+import threading
+import uuid
+import random
+import sqlite3
+import functools
+import sys
+import html
+import logging
+from contextlib import closing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Trabajo en segundo plano (compactación, cola de ventas): sin UI, al log del servidor
+log = logging.getLogger("bonbon_peach")
+
+# Se puede apuntar a un Worker local (ver worker_local.py) con el secreto WORKER_URL
+WORKER_URL = st.secrets.get("WORKER_URL", "https://admin.bonbon-peach.com/api")
 API_KEY=st.secrets["API_KEY"].strip()
 
 R2_INGREDIENTES = "ingredientes"
@@ -21,6 +44,92 @@ R2_MODIFICADORES = "modificadores"
 R2_PRECIOS = "precios"
 R2_VENTAS = "ventas"
 R2_INVENTARIO = "inventario"
+# Libro de movimientos de inventario (solo se agregan filas), un objeto por mes
+# ("inventario/movimientos/AAAA-MM"), y cortes de stock a inicio de cada mes
+R2_INVENTARIO_MOVIMIENTOS = f"{R2_INVENTARIO}/movimientos"
+R2_INVENTARIO_CORTES = f"{R2_INVENTARIO}/_cortes"
+TIPOS_MOVIMIENTO = ("compra", "venta", "ajuste")
+
+# Ventas particionadas por mes ("ventas/AAAA-MM") en modo "append": cada cobro
+# se guarda como un segmento pequeño ("ventas/AAAA-MM/<id>") y el manifiesto
+# lista particiones y segmentos pendientes de compactar.
+R2_VENTAS_MANIFIESTO = f"{R2_VENTAS}/_manifiesto"
+# Líneas cuya fecha no se puede interpretar: se guardan en su propia partición
+# ("ventas/sin-fecha") para no perderlas; ningún rango de fechas la incluye.
+PARTICION_SIN_FECHA = "sin-fecha"
+SEGMENTOS_MAX_SIN_COMPACTAR = 20
+# Resumen diario (día × producto × forma de pago), un objeto por mes
+# ("ventas_resumen/AAAA-MM") que cada cobro actualiza; el dashboard lo lee en
+# lugar de las líneas de venta.
+R2_VENTAS_RESUMEN = "ventas_resumen"
+CLAVES_RESUMEN = ["Fecha", "Particion", "Producto", "Forma Pago"]
+# Sincronización incremental (requiere que el Worker implemente "_cambios"):
+# GET ventas/_cambios?desde=N responde las líneas de los segmentos escritos
+# después de la marca N y la marca nueva en "X-Marca"; sin "desde" responde
+# solo la marca actual. La copia local se recarga completa cada cierto tiempo.
+R2_VENTAS_CAMBIOS = f"{R2_VENTAS}/_cambios"
+SYNC_VENTAS = st.secrets.get("SYNC_VENTAS", False)
+RECARGA_COMPLETA_VENTAS_MIN = 60
+# Cola local (SQLite) donde se confirma cada cobro antes de subirlo a R2
+COLA_VENTAS_DB = st.secrets.get("COLA_VENTAS_DB", "cola_ventas.sqlite3")
+INTERVALO_COLA_SEG = 5
+ESPERA_MAX_COLA_SEG = 300
+MAX_LECTURAS_PARALELAS = 8
+# Respuestas guardadas por endpoint para GET condicional (If-None-Match)
+MAX_VALIDADORES_API = 256
+
+# --- CLIENTE HTTP DEL WORKER ---
+# Escrituras condicionales (If-Match con el ETag leído; ver _actualizar_objeto)
+VERSION_NUEVA = "*"  # el objeto aún no existe: If-None-Match: *
+REINTENTOS_CONFLICTO = 16
+TIMEOUT_API = (3.05, 20)  # (conexión, lectura) en segundos
+REINTENTOS_API = 3
+# gzip en el cuerpo de los PUT: solo si el Worker descomprime "Content-Encoding: gzip"
+GZIP_ESCRITURAS = st.secrets.get("GZIP_ESCRITURAS", False)
+MIN_BYTES_GZIP = 1024
+BUCKETS_LATENCIA_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# --- TIEMPOS POR RERUN ---
+# Agregados de los tramos medidos (ver medido) en formato de texto Prometheus;
+# con METRICAS_ARCHIVO se reescriben cada INTERVALO_METRICAS_SEG (p. ej. para
+# el "textfile collector" de node_exporter)
+METRICAS_ARCHIVO = st.secrets.get("METRICAS_ARCHIVO", None)
+INTERVALO_METRICAS_SEG = 15
+
+# --- PERFILADOR ---
+# Muestreo de pilas del rerun, activado por un admin desde la barra lateral
+# para todas las sesiones; los reruns que superan el umbral se guardan aquí
+PERFILES_DIR = st.secrets.get("PERFILES_DIR", "perfiles")
+PERFILES_MAX = 30  # se borran los más viejos
+INTERVALO_MUESTREO_MS = 5
+
+# --- TRANSPORTE COLUMNAR (Parquet) ---
+# La lectura siempre negocia (Accept) y el Content-Type de la respuesta decide
+# el formato. Escribir en Parquet es opcional y requiere que el Worker lo acepte;
+# si responde 415 se vuelve a JSON.
+TIPO_JSON = "application/json"
+TIPO_PARQUET = "application/vnd.apache.parquet"
+DATASETS_COLUMNARES = {R2_VENTAS}
+FORMATO_VENTAS = st.secrets.get("FORMATO_VENTAS", "json")  # "json" | "parquet"
+COLUMNAS_NUMERICAS_VENTAS = [
+    "Cantidad", "Precio Unitario", "Total Venta Bruto", "Descuento (%)",
+    "Descuento ($)", "Costo Total", "Ganancia Bruta", "Comision ($)",
+    "Ganancia Neta", "Total Venta Neta"
+]
+# Columnas y tipos del DataFrame de ventas (ver leer_ventas_df): textos
+# repetidos como categorías, una sola fecha datetime64 y cantidades en float32;
+# los importes siguen en float64 (sumas de centavos sin error de redondeo).
+# "Linea" numera las líneas de cada venta: con "Id Venta" es la clave que
+# enlaza los modificadores (ver leer_modificadores_ventas).
+COLUMNAS_CANTIDAD_VENTAS = ["Cantidad"]
+ESQUEMA_VENTAS = {
+    "Id Venta": "category",
+    "Linea": "int32",
+    "Fecha": "datetime64[ns]",
+    "Producto": "category",
+    "Forma Pago": "category",
+    **{c: "float32" if c in COLUMNAS_CANTIDAD_VENTAS else "float64" for c in COLUMNAS_NUMERICAS_VENTAS},
+}
 
 COMISION_TARJETA = 4.0406  
 
@@ -41,6 +150,12 @@ COMISION_BASE_PORCENTAJE = 3.5
 TASA_IVA_PORCENTAJE = 16.0
 COMISION_TARJETA = COMISION_BASE_PORCENTAJE * (1 + (TASA_IVA_PORCENTAJE / 100))
 SESSION_TIMEOUT_MIN = 30 
+# Tendencia del dashboard: hasta ~3 meses por día, hasta 2 años por semana,
+# más allá por mes (ver _resolucion_tendencia)
+DIAS_MAX_TENDENCIA_DIARIA = 92
+DIAS_MAX_TENDENCIA_SEMANAL = 731
+NOMBRES_RESOLUCION = {"D": "Diario", "W": "Semanal", "M": "Mensual"}
+SEMANAS_MAX_PATRON = 12  # semanas (una traza c/u) en la comparativa día a día
 
 # --- DICCIONARIOS PARA TRADUCCIÓN DE FECHAS ---
 DIAS_ESP = {
@@ -107,41 +222,620 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+#_______________________________
+#        Tiempos por rerun
+#_______________________________
+# Cada llamada medida es un "tramo": duración, acierto/fallo de caché, bytes
+# transferidos y filas devueltas. Los tramos se anidan por hilo; los del rerun
+# en curso quedan en la sesión y los agregados son del proceso.
+_pila_tramos = threading.local()
+
+@st.cache_resource
+def _estado_tramos():
+    return {"lock": threading.Lock(), "agregados": {}, "exportado": 0.0}
+
+def _tramos_del_rerun():
+    # None fuera de una sesión (hilos de fondo, scripts de bench/). Solo lee:
+    # la lista la crea el hilo del script (_abrir_tramos_del_rerun)
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.get("_tramos_rerun")
+
+def _abrir_tramos_del_rerun():
+    # Solo desde el hilo del script, antes de lanzar hilos: main() antes de
+    # _rerun(), _ejecutar_en_paralelo antes del pool y el primer tramo de un
+    # callback (corren antes de main) o de un rerun de fragmento (sin main).
+    # Si la crearan los hilos del pool, dos podrían crear cada uno la suya.
+    if get_script_run_ctx(suppress_warning=True) is not None and "_tramos_rerun" not in st.session_state:
+        st.session_state["_tramos_rerun"] = []
+
+def _rerun_de_fragmento():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+def _cerrar_rerun(ms):
+    # El rerun terminó: sus tramos pasan al panel de admin
+    st.session_state["tramos_ultimo_rerun"] = {"ms": ms, "tramos": st.session_state.pop("_tramos_rerun", [])}
+
+def _anotar_tramo(bytes=0, cache=None):
+    pila = getattr(_pila_tramos, "pila", None)
+    if pila:
+        pila[-1]["Bytes"] += bytes
+        if cache:
+            pila[-1]["Caché"] = cache
+
+def _filas(resultado):
+    if isinstance(resultado, tuple) and resultado:
+        return _filas(resultado[0])
+    if isinstance(resultado, (pd.DataFrame, list, dict)):
+        return len(resultado)
+    return None
+
+def _cerrar_tramo(tramo, resultado, cacheada):
+    _pila_tramos.pila.pop()
+    tramo["ms"] = (time.perf_counter() - tramo["t0"]) * 1000
+    tramo["Filas"] = _filas(resultado)
+    hijos = tramo["hijos"]
+    tramo["Bytes"] += sum(h["Bytes"] for h in hijos)
+    if tramo["Caché"] is None:
+        # Sin caché propia: "miss" si algo debajo se calculó de nuevo
+        estados = {h["Caché"] for h in hijos} - {None}
+        tramo["Caché"] = "hit" if cacheada else ("miss" if "miss" in estados else ("hit" if estados else None))
+
+    if _pila_tramos.pila:
+        _pila_tramos.pila[-1]["hijos"].append(tramo)
+    else:
+        if not getattr(_pila_tramos, "en_pool", False):
+            _abrir_tramos_del_rerun()
+        lista = _tramos_del_rerun()
+        if lista is not None:
+            lista.append(tramo)
+            if tramo["Tipo"] == "fragmento" and _rerun_de_fragmento():
+                # Un rerun de fragmento no pasa por main(): lo cierra el fragmento
+                _cerrar_rerun(sum(t["ms"] for t in lista))
+
+    estado = _estado_tramos()
+    clave = (tramo["Tramo"].split(" ")[0], tramo["dataset"], tramo["Tipo"], tramo["Caché"] or "")
+    with estado["lock"]:
+        agg = estado["agregados"].setdefault(
+            clave, {"buckets": [0] * (len(BUCKETS_LATENCIA_MS) + 1), "suma_ms": 0.0, "n": 0, "bytes": 0, "filas": 0}
+        )
+        agg["buckets"][bisect.bisect_left(BUCKETS_LATENCIA_MS, tramo["ms"])] += 1
+        agg["suma_ms"] += tramo["ms"]
+        agg["n"] += 1
+        agg["bytes"] += tramo["Bytes"]
+        agg["filas"] += tramo["Filas"] or 0
+
+def medido(funcion=None, *, tipo="carga", cache=None):
+    # Decorador: cada llamada es un tramo. cache puede ser el decorador de
+    # caché de la función (p. ej. st.cache_data(ttl=120)), que se aplica por
+    # dentro: el cuerpo solo corre en un fallo y así se distingue del acierto;
+    # o True si la función ya cachea por dentro y anota sus fallos
+    # (_anotar_tramo). Con tipo="api" el primer argumento (endpoint) se
+    # muestra en el tramo. La función devuelta conserva .clear().
+    def decorar(f):
+        interna = f
+        if callable(cache):
+            @functools.wraps(f)
+            def calcular(*args, **kwargs):
+                _anotar_tramo(cache="miss")
+                return f(*args, **kwargs)
+            interna = cache(calcular)
+
+        @functools.wraps(f)
+        def envoltura(*args, **kwargs):
+            endpoint = args[0] if tipo == "api" and args else ""
+            tramo = {"Tramo": f"{f.__name__} {endpoint}".strip(), "dataset": _dataset(endpoint) if endpoint else "",
+                     "Tipo": tipo, "Caché": None, "Bytes": 0, "Filas": None, "hijos": [], "t0": time.perf_counter()}
+            if getattr(_pila_tramos, "pila", None) is None:
+                _pila_tramos.pila = []
+            _pila_tramos.pila.append(tramo)
+            resultado = None
+            try:
+                resultado = interna(*args, **kwargs)
+                return resultado
+            finally:
+                _cerrar_tramo(tramo, resultado, cache is not None)
+        if callable(cache):
+            envoltura.clear = interna.clear
+        return envoltura
+    return decorar(funcion) if funcion else decorar
+
+def tabla_tramos(tramos):
+    # Árbol de tramos de un rerun como tabla, en orden de inicio
+    filas = []
+    def agregar(lista, nivel):
+        for t in sorted(lista, key=lambda t: t["t0"]):
+            filas.append({"Tramo": "· " * nivel + t["Tramo"], "ms": round(t["ms"], 1), "Caché": t["Caché"] or "",
+                          "Bytes": t["Bytes"], "Filas": t["Filas"]})
+            agregar(t["hijos"], nivel + 1)
+    agregar(tramos, 0)
+    return pd.DataFrame(filas, columns=["Tramo", "ms", "Caché", "Bytes", "Filas"])
+
+def _etiquetas(**valores):
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in valores.items()) + "}"
+
+def _histograma_prometheus(lineas, nombre, etiquetas, h):
+    acumulado = 0
+    for limite, n in zip(BUCKETS_LATENCIA_MS + ["+Inf"], h["buckets"]):
+        acumulado += n
+        le = limite if limite == "+Inf" else f"{limite / 1000:g}"
+        lineas.append(f"{nombre}_bucket{_etiquetas(**etiquetas, le=le)} {acumulado}")
+    lineas.append(f"{nombre}_sum{_etiquetas(**etiquetas)} {h['suma_ms'] / 1000:.6f}")
+    lineas.append(f"{nombre}_count{_etiquetas(**etiquetas)} {h['n']}")
+
+def metricas_prometheus():
+    # Tramos, latencia HTTP y lecturas condicionales del proceso (formato de texto 0.0.4)
+    estado = _estado_tramos()
+    with estado["lock"]:
+        agregados = {k: dict(v, buckets=list(v["buckets"])) for k, v in estado["agregados"].items()}
+    lineas = [
+        "# HELP bonbon_tramo_duracion_segundos Duración de cargas, páginas y llamadas a la API.",
+        "# TYPE bonbon_tramo_duracion_segundos histogram",
+    ]
+    for (tramo, dataset, tipo, cache), h in sorted(agregados.items()):
+        _histograma_prometheus(lineas, "bonbon_tramo_duracion_segundos",
+                               {"tramo": tramo, "dataset": dataset, "tipo": tipo, "cache": cache}, h)
+    for metrica, campo, ayuda in [("bonbon_tramo_bytes_total", "bytes", "Bytes transferidos por el tramo."),
+                                  ("bonbon_tramo_filas_total", "filas", "Filas devueltas por el tramo.")]:
+        lineas += [f"# HELP {metrica} {ayuda}", f"# TYPE {metrica} counter"]
+        lineas += [f"{metrica}{_etiquetas(tramo=t, dataset=d, tipo=ti, cache=c)} {h[campo]}"
+                   for (t, d, ti, c), h in sorted(agregados.items())]
+
+    api = _estado_api()
+    with api["lock"]:
+        latencias = {k: dict(v, buckets=list(v["buckets"])) for k, v in api["latencias"].items()}
+        contadores = dict(api["contadores"])
+    lineas += ["# HELP bonbon_api_peticion_duracion_segundos Peticiones HTTP al Worker.",
+               "# TYPE bonbon_api_peticion_duracion_segundos histogram"]
+    for llamada, h in sorted(latencias.items()):
+        _histograma_prometheus(lineas, "bonbon_api_peticion_duracion_segundos", {"llamada": llamada}, h)
+    lineas += ["# HELP bonbon_api_lecturas_total Lecturas condicionales por resultado.",
+               "# TYPE bonbon_api_lecturas_total counter"]
+    lineas += [f"bonbon_api_lecturas_total{_etiquetas(resultado=k)} {v}" for k, v in sorted(contadores.items())]
+    return "\n".join(lineas) + "\n"
+
+def _exportar_metricas():
+    # Escritura atómica; como mucho una vez cada INTERVALO_METRICAS_SEG por proceso
+    estado = _estado_tramos()
+    with estado["lock"]:
+        if time.monotonic() - estado["exportado"] < INTERVALO_METRICAS_SEG:
+            return
+        estado["exportado"] = time.monotonic()
+    temporal = f"{METRICAS_ARCHIVO}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(metricas_prometheus())
+    os.replace(temporal, METRICAS_ARCHIVO)
+
+#_______________________________
+#           Perfilador
+#_______________________________
+# Un hilo toma la pila del hilo del script cada INTERVALO_MUESTREO_MS y
+# cuenta las pilas repetidas ("collapsed stacks", el formato de flamegraph.pl
+# y speedscope). Apagado no hay hilo ni hooks: main() solo consulta la config.
+# Las lecturas que corren en el pool de precarga aparecen como esperas.
+@st.cache_resource
+def _config_perfilador():
+    return {"activo": False, "umbral_ms": 0}
+
+def _muestrear(hilo, pilas, detener):
+    while not detener.wait(INTERVALO_MUESTREO_MS / 1000):
+        frame = sys._current_frames().get(hilo)
+        pila = []
+        # Desde _rerun hacia adentro; lo de Streamlit por encima no aporta y
+        # los envoltorios de medido se omiten
+        while frame is not None and frame.f_code is not _rerun.__code__:
+            codigo = frame.f_code
+            if codigo.co_filename != _rerun.__code__.co_filename or codigo.co_name not in ("envoltura", "calcular"):
+                pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+            frame = frame.f_back
+        if frame is None:
+            # Fuera de _rerun (antes de empezar o ya en el cierre de main): no es del rerun
+            continue
+        pila.append("_rerun")
+        clave = ";".join(reversed(pila))
+        pilas[clave] = pilas.get(clave, 0) + 1
+
+def _iniciar_muestreo():
+    pilas, detener = {}, threading.Event()
+    hilo = threading.Thread(target=_muestrear, args=(threading.get_ident(), pilas, detener), daemon=True)
+    hilo.start()
+    return pilas, detener, hilo
+
+def _guardar_perfil(pilas, ms):
+    contexto = st.session_state.get("_contexto_rerun", ("", None, None))
+    pagina, desde, hasta = contexto
+    ahora = datetime.datetime.now()
+    # El sufijo evita que dos reruns lentos en el mismo segundo se pisen
+    nombre = "_".join([f"{ahora:%Y%m%d-%H%M%S}", re.sub(r"\s+", "-", normalizar_texto(pagina).strip()) or "login",
+                       str(desde or "-"), str(hasta or "-"), uuid.uuid4().hex[:8]])
+    perfil = {"fecha": ahora.isoformat(timespec="seconds"), "pagina": pagina, "desde": str(desde), "hasta": str(hasta),
+              "usuario": st.session_state.get("usuario"), "ms": round(ms, 1),
+              "intervalo_ms": INTERVALO_MUESTREO_MS, "pilas": pilas}
+    os.makedirs(PERFILES_DIR, exist_ok=True)
+    with open(os.path.join(PERFILES_DIR, f"{nombre}.json"), "w", encoding="utf-8") as f:
+        json.dump(perfil, f, ensure_ascii=False)
+    for viejo in listar_perfiles()[PERFILES_MAX:]:
+        os.remove(os.path.join(PERFILES_DIR, viejo))
+
+def listar_perfiles():
+    # Más recientes primero (el nombre empieza con la fecha)
+    if not os.path.isdir(PERFILES_DIR):
+        return []
+    return sorted((n for n in os.listdir(PERFILES_DIR) if n.endswith(".json")), reverse=True)
+
+def leer_perfil(nombre):
+    with open(os.path.join(PERFILES_DIR, nombre), encoding="utf-8") as f:
+        return json.load(f)
+
+def pilas_colapsadas(perfil):
+    return "".join(f"{pila} {n}\n" for pila, n in sorted(perfil["pilas"].items()))
+
+def flamegraph_html(perfil):
+    # Página autocontenida: cada marco es una caja con ancho proporcional a
+    # sus muestras y sus llamadas debajo (de arriba hacia abajo)
+    arbol = {"n": 0, "hijos": {}}
+    for pila, n in perfil["pilas"].items():
+        nodo = arbol
+        nodo["n"] += n
+        for marco in pila.split(";"):
+            nodo = nodo["hijos"].setdefault(marco, {"n": 0, "hijos": {}})
+            nodo["n"] += n
+    total = max(arbol["n"], 1)
+    # El hilo de muestreo compite por el GIL: se reparte la duración medida
+    ms_muestra = perfil["ms"] / total
+
+    def caja(nombre, nodo, n_padre):
+        # Ancho relativo al padre; el resto del padre es tiempo propio
+        ms = nodo["n"] * ms_muestra
+        titulo = html.escape(f"{nombre} · {nodo['n']} muestras · ~{ms:.0f} ms · {nodo['n'] / total * 100:.1f} %")
+        hijos = "".join(caja(h, sub, nodo["n"]) for h, sub in sorted(nodo["hijos"].items(), key=lambda x: -x[1]["n"]))
+        return (f'<div class="m" style="width:{nodo["n"] / n_padre * 100:.3f}%">'
+                f'<div class="e" title="{titulo}">{html.escape(nombre)}</div><div class="h">{hijos}</div></div>')
+
+    encabezado = html.escape(f"{perfil['pagina']} · {perfil['desde']} → {perfil['hasta']} · {perfil['usuario']} · "
+                             f"{perfil['fecha']} · {perfil['ms']:.0f} ms · {total} muestras cada {perfil['intervalo_ms']} ms")
+    cuerpo = "".join(caja(h, sub, total) for h, sub in arbol["hijos"].items())
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>Perfil {html.escape(perfil['fecha'])}</title>
+<style>
+body {{ font: 12px sans-serif; margin: 12px; }}
+.h {{ display: flex; }}
+.m {{ overflow: hidden; }}
+.e {{ background: #f6b38a; border: 1px solid #fff; padding: 2px 3px; white-space: nowrap; overflow: hidden;
+      text-overflow: ellipsis; cursor: default; }}
+.e:hover {{ background: #e9864f; }}
+</style></head><body><h3>{encabezado}</h3><div class="h">{cuerpo}</div></body></html>
+"""
+
 #_______________________________
 #          Funciones de API
 #_______________________________
-@st.cache_data(ttl=60)
-def api_read(endpoint):
-    try:
-        r = requests.get(
-            f"{WORKER_URL}/{endpoint}",
-            headers={"X-API-Key": API_KEY, "User-Agent": "Streamlit-App/1.0", "Accept": "application/json"},
-            timeout=30
+HEADERS_API = {"X-API-Key": API_KEY, "User-Agent": "Streamlit-App/1.0", "Accept": "application/json"}
+
+@st.cache_resource
+def _sesion_http():
+    # Una sesión por proceso: conexiones keep-alive reutilizadas (sin un
+    # handshake TCP+TLS por llamada) y reintentos con backoff ante 5xx.
+    # El pool de urllib3 es seguro entre hilos; la sesión no se modifica tras crearse.
+    reintentos = Retry(
+        total=REINTENTOS_API,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "PUT", "DELETE"}),
+        raise_on_status=False
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=MAX_LECTURAS_PARALELAS * 2,
+        max_retries=reintentos
+    )
+    sesion = requests.Session()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    sesion.headers.update(HEADERS_API)  # incluye "Accept-Encoding: gzip" por defecto
+    return sesion
+
+def _registrar_latencia(metodo, endpoint, segundos):
+    estado = _estado_api()
+    clave = f"{metodo} {_dataset(endpoint)}"
+    ms = segundos * 1000
+    with estado["lock"]:
+        hist = estado["latencias"].setdefault(
+            clave, {"buckets": [0] * (len(BUCKETS_LATENCIA_MS) + 1), "suma_ms": 0.0, "n": 0}
         )
+        hist["buckets"][bisect.bisect_left(BUCKETS_LATENCIA_MS, ms)] += 1
+        hist["suma_ms"] += ms
+        hist["n"] += 1
+
+def histograma_latencias():
+    # Conteos por rango de latencia (ms) para cada "MÉTODO dataset"
+    estado = _estado_api()
+    etiquetas = [f"≤{b}" for b in BUCKETS_LATENCIA_MS] + [f">{BUCKETS_LATENCIA_MS[-1]}"]
+    with estado["lock"]:
+        filas = [
+            {"Llamada": clave, "N": h["n"], "Prom. ms": round(h["suma_ms"] / h["n"], 1),
+             **dict(zip(etiquetas, h["buckets"]))}
+            for clave, h in sorted(estado["latencias"].items())
+        ]
+    return pd.DataFrame(filas)
+
+def _peticion(metodo, endpoint, **kwargs):
+    inicio = time.perf_counter()
+    try:
+        return _sesion_http().request(metodo, f"{WORKER_URL}/{endpoint}", timeout=TIMEOUT_API, **kwargs)
+    finally:
+        _registrar_latencia(metodo, endpoint, time.perf_counter() - inicio)
+
+def _api_get(endpoint):
+    # Lectura sin caché ni UI: un objeto inexistente se trata como tabla vacía
+    r = _peticion("GET", endpoint)
+    if r.status_code == 404:
+        return []
+    r.raise_for_status()
+    return r.json()
+
+def _api_delete(endpoint):
+    # Un objeto que ya no existe cuenta como borrado
+    r = _peticion("DELETE", endpoint)
+    if r.status_code != 404:
         r.raise_for_status()
-        data = r.json()
-        if not isinstance(data, list): return pd.DataFrame()
-        return pd.DataFrame(data)
+
+def _es_columnar(endpoint):
+    # El manifiesto se edita como lista de dicts: siempre JSON
+    return _dataset(endpoint) in DATASETS_COLUMNARES and endpoint != R2_VENTAS_MANIFIESTO
+
+def _headers_lectura(endpoint):
+    if _es_columnar(endpoint):
+        return {"Accept": f"{TIPO_PARQUET}, {TIPO_JSON};q=0.9"}
+    return {}
+
+def _df_desde_respuesta(r):
+    if r.headers.get("Content-Type", "").startswith(TIPO_PARQUET):
+        # Columnas ya tipadas: sin parseo de JSON ni pd.to_numeric
+        df = pd.read_parquet(io.BytesIO(r.content))
+        if "Modificadores" in df.columns:
+            df["Modificadores"] = df["Modificadores"].map(lambda x: [] if x is None else list(x))
+        return df
+    data = r.json()
+    return pd.DataFrame(data) if isinstance(data, list) else pd.DataFrame()
+
+def _normalizar_modificadores(mods):
+    # Estructura fija para que Parquet infiera un solo tipo list<struct>
+    if not isinstance(mods, (list, np.ndarray)):
+        return []
+    return [{
+        "nombre": str(m.get("nombre", "")),
+        "precio": clean_and_convert_float(m.get("precio", 0)),
+        "cantidad": clean_and_convert_float(m.get("cantidad", 0)),
+        "costo": clean_and_convert_float(m.get("costo", 0)),
+    } for m in mods if isinstance(m, dict)]
+
+def _a_parquet(registros):
+    df = pd.DataFrame(registros)
+    for c in df.columns:
+        if c in COLUMNAS_NUMERICAS_VENTAS:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        elif c == "Modificadores":
+            df[c] = df[c].map(_normalizar_modificadores)
+        elif df[c].dtype == object:
+            df[c] = df[c].astype("string")
+    buf = io.BytesIO()
+    df.to_parquet(buf, index=False)
+    return buf.getvalue()
+
+def _api_get_df(endpoint):
+    # Como _api_get, pero negociando formato columnar y devolviendo DataFrame
+    r = _peticion("GET", endpoint, headers=_headers_lectura(endpoint))
+    if r.status_code == 404:
+        return pd.DataFrame()
+    r.raise_for_status()
+    return _df_desde_respuesta(r)
+
+def _headers_version(version):
+    if version is None:
+        return {}
+    if version == VERSION_NUEVA:
+        return {"If-None-Match": "*"}
+    return {"If-Match": version}
+
+def _api_put(endpoint, payload, version=None):
+    # version (ver _api_get_version): ETag leído -> If-Match; VERSION_NUEVA ->
+    # el objeto no debe existir. Si otro terminal escribió antes: HTTP 412.
+    estado = _estado_api()
+    condicion = _headers_version(version)
+    if _es_columnar(endpoint) and FORMATO_VENTAS == "parquet" and not estado["sin_columnar"]:
+        cuerpo = _a_parquet(payload)
+        _anotar_tramo(bytes=len(cuerpo))
+        r = _peticion("PUT", endpoint, data=cuerpo, headers={"Content-Type": TIPO_PARQUET, **condicion})
+        if r.status_code != 415:
+            r.raise_for_status()
+            return
+        with estado["lock"]:
+            estado["sin_columnar"] = True
+
+    cuerpo = json.dumps(payload, allow_nan=False).encode("utf-8")
+    headers = {"Content-Type": "application/json", **condicion}
+    if GZIP_ESCRITURAS and len(cuerpo) >= MIN_BYTES_GZIP:
+        cuerpo = gzip.compress(cuerpo)
+        headers["Content-Encoding"] = "gzip"
+    _anotar_tramo(bytes=len(cuerpo))
+    r = _peticion("PUT", endpoint, data=cuerpo, headers=headers)
+    r.raise_for_status()
+
+def _api_get_version(endpoint, como_df=False):
+    # Lectura para una escritura condicional. Versión: el ETag; VERSION_NUEVA
+    # si el objeto no existe; None si el Worker no versiona (sin control).
+    r = _peticion("GET", endpoint, headers=_headers_lectura(endpoint) if como_df else {})
+    if r.status_code == 404:
+        return (pd.DataFrame() if como_df else []), VERSION_NUEVA
+    r.raise_for_status()
+    return (_df_desde_respuesta(r) if como_df else r.json()), r.headers.get("ETag")
+
+def _actualizar_objeto(endpoint, fusionar, como_df=False):
+    # Lectura-fusión-escritura condicional. fusionar(actual) devuelve el
+    # payload nuevo (o None si no hay nada que escribir); si otro terminal
+    # escribió en medio se relee y se vuelve a fusionar sobre lo suyo.
+    for intento in range(REINTENTOS_CONFLICTO):
+        actual, version = _api_get_version(endpoint, como_df)
+        nuevo = fusionar(actual)
+        if nuevo is None:
+            return actual
+        try:
+            _api_put(endpoint, nuevo, version)
+            return nuevo
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 412:
+                raise
+        time.sleep(random.uniform(0, min(0.02 * 2 ** intento, 1.0)))  # backoff con jitter
+    raise RuntimeError(f"{endpoint}: conflicto de versión tras {REINTENTOS_CONFLICTO} intentos")
+
+@st.cache_resource
+def _estado_api():
+    # Compartido por todas las sesiones del proceso
+    return {
+        "lock": threading.Lock(),
+        "validadores": OrderedDict(),  # endpoint -> (etag, DataFrame ya parseado)
+        "contadores": {"304": 0, "completas": 0},
+        "versiones": {},  # dataset -> versión; forma parte de la clave de caché de api_read
+        "latencias": {},  # "MÉTODO dataset" -> histograma (ver _registrar_latencia)
+        "sin_columnar": False,  # el Worker rechazó Parquet (415): escribir JSON
+        "por_limpiar": set(),  # datasets invalidados desde hilos de fondo (ver invalidar_dataset)
+    }
+
+def _contar_lectura(estado, tipo):
+    with estado["lock"]:
+        estado["contadores"][tipo] += 1
+
+def estadisticas_api():
+    estado = _estado_api()
+    with estado["lock"]:
+        return dict(estado["contadores"])
+
+def _api_get_condicional(endpoint):
+    # Si el Worker responde 304 se reutiliza el DataFrame ya parseado:
+    # no se transfieren bytes ni se hace trabajo de JSON/DataFrame.
+    estado = _estado_api()
+    with estado["lock"]:
+        previo = estado["validadores"].get(endpoint)
+    headers = _headers_lectura(endpoint)
+    if previo:
+        headers["If-None-Match"] = previo[0]
+
+    r = _peticion("GET", endpoint, headers=headers)
+    if r.status_code == 304 and previo:
+        _contar_lectura(estado, "304")
+        with estado["lock"]:
+            estado["validadores"].move_to_end(endpoint)
+        return previo[1]
+
+    _contar_lectura(estado, "completas")
+    if r.status_code == 404:
+        return pd.DataFrame()
+    r.raise_for_status()
+    _anotar_tramo(bytes=len(r.content))
+    df = _df_desde_respuesta(r)
+
+    etag = r.headers.get("ETag")
+    if etag:
+        with estado["lock"]:
+            estado["validadores"][endpoint] = (etag, df)
+            estado["validadores"].move_to_end(endpoint)
+            while len(estado["validadores"]) > MAX_VALIDADORES_API:
+                estado["validadores"].popitem(last=False)
+    return df
+
+def _dataset(endpoint):
+    # "ventas/2026-10/<id>" pertenece al dataset "ventas"
+    return endpoint.split("/", 1)[0]
+
+def _version_dataset(dataset):
+    estado = _estado_api()
+    with estado["lock"]:
+        return estado["versiones"].get(dataset, 0)
+
+def invalidar_dataset(endpoint):
+    # Solo se descartan las cachés de este dataset y de lo que se deriva de él;
+    # el resto (catálogos, otros rangos) sigue caliente. La versión sube en el
+    # acto (api_read ya no sirve lo viejo); desde un hilo de fondo de la app
+    # (cola, compactación) las cachés derivadas se limpian al inicio del
+    # siguiente rerun, en el hilo del script (ver aplicar_invalidaciones).
+    dataset = _dataset(endpoint)
+    estado = _estado_api()
+    with estado["lock"]:
+        estado["versiones"][dataset] = estado["versiones"].get(dataset, 0) + 1
+        if _hilo_de_fondo():
+            estado["por_limpiar"].add(dataset)
+            return
+    _limpiar_caches(dataset)
+
+def _hilo_de_fondo():
+    # Bajo `streamlit run` pero fuera del hilo de un rerun (sin ScriptRunContext)
+    return st.runtime.exists() and get_script_run_ctx(suppress_warning=True) is None
+
+def _limpiar_caches(dataset):
+    for funcion in DEPENDENCIAS_CACHE.get(dataset, []):
+        funcion.clear()
+
+def aplicar_invalidaciones():
+    estado = _estado_api()
+    with estado["lock"]:
+        pendientes, estado["por_limpiar"] = estado["por_limpiar"], set()
+    for dataset in pendientes:
+        _limpiar_caches(dataset)
+
+@medido(tipo="api", cache=True)
+def api_read(endpoint):
+    return _api_read_version(endpoint, _version_dataset(_dataset(endpoint)))
+
+@st.cache_data(ttl=60)
+def _api_read_version(endpoint, version):
+    _anotar_tramo(cache="miss")
+    try:
+        return _api_get_condicional(endpoint)
     except Exception as e:
         st.error(f"❌ Error de conexión con R2 ({endpoint}): {e}")
         return pd.DataFrame()
 
+@medido(tipo="api")
 def api_write(endpoint, data):
+    # data: la tabla completa (DataFrame o lista de dicts), o una función
+    # actual -> nueva que se aplica sobre la versión vigente del objeto y se
+    # reintenta si otro terminal escribió en medio (ver _actualizar_objeto)
+    registros = lambda d: d.to_dict("records") if isinstance(d, pd.DataFrame) else d
     try:
-        payload = data.to_dict("records") if isinstance(data, pd.DataFrame) else data
-        r = requests.put(
-            f"{WORKER_URL}/{endpoint}",
-            json=payload,
-            headers={"X-API-Key": API_KEY, "User-Agent": "Streamlit-App/1.0", "Accept": "application/json", "Content-Type": "application/json"},
-            timeout=30
-        )
-        r.raise_for_status()
-        st.cache_data.clear()
+        if callable(data):
+            _actualizar_objeto(endpoint, lambda actual: registros(data(actual)))
+        else:
+            _api_put(endpoint, registros(data))
+        invalidar_dataset(endpoint)
         return True
     except Exception as e:
         st.error(f"❌ Error guardando {endpoint}: {e}")
         return False
 
+def _ejecutar_en_paralelo(tareas):
+    # Ejecuta funciones sin argumentos en un pool conservando el contexto de
+    # Streamlit en los hilos (st.error, cachés). Devuelve resultados en orden.
+    if len(tareas) <= 1:
+        return [t() for t in tareas]
+    ctx = get_script_run_ctx()
+    if not getattr(_pila_tramos, "en_pool", False):
+        _abrir_tramos_del_rerun()
+
+    def iniciar_hilo():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        _pila_tramos.en_pool = True  # sus tramos van a la lista ya abierta
+
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_LECTURAS_PARALELAS, len(tareas)),
+        initializer=iniciar_hilo
+    ) as pool:
+        return list(pool.map(lambda t: t(), tareas))
+
+def _leer_en_paralelo(endpoints):
+    return _ejecutar_en_paralelo([lambda e=e: api_read(e) for e in endpoints])
+
 def normalizar_texto(texto):
     if not isinstance(texto, str): return ""
     texto = texto.lower().strip()
@@ -156,30 +850,68 @@ def clean_and_convert_float(value_str, default=0.0):
     try: return round(float(cleaned), 6)
     except (ValueError, TypeError): return default
 
+# Versiones por columna de clean_and_convert_float / normalizar_texto: mismos
+# resultados, pero con operaciones sobre la columna completa en vez de por celda.
+def _columna_float(serie, default=0.0):
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype(float).round(6)
+    serie = serie.astype(object)  # faltantes como NaN/None, igual que al iterar filas
+    tipos = serie.map(type)
+    es_num = tipos.isin([int, float, bool, np.float64])
+    es_txt = tipos == str
+    resultado = pd.Series(default, index=serie.index, dtype=float)
+    resultado[es_num] = serie[es_num].astype(float).round(6)
+    limpio = serie[es_txt].astype(str).str.strip().str.replace(r"[$,%]", "", regex=True)
+    resultado[es_txt] = pd.to_numeric(limpio, errors="coerce").round(6).fillna(default)
+    return resultado
+
+def _columna_texto_normalizado(serie):
+    es_txt = serie.astype(object).map(type) == str
+    texto = serie.where(es_txt, "").astype(str)
+    return (
+        texto.str.lower().str.strip()
+        .str.split().str.join(" ")
+        .str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("utf-8")
+        .str.replace(r"[^a-z0-9\s]", "", regex=True)
+    )
+
+def _como_filas(df):
+    # iterrows() en pandas 3 infiere "str" en las filas con solo texto y
+    # faltantes, y ahí los None pasan a NaN; se replica para toda la hoja
+    df = df.astype(object)
+    faltantes = df.isna()
+    solo_texto = (faltantes | (df.map(type) == str)).all(axis=1) & ~faltantes.all(axis=1)
+    return df.mask(faltantes & solo_texto.to_numpy()[:, None], np.nan)
+
+def _columna(df, nombre, default=None):
+    # Equivalente a r.get(nombre, default) para todas las filas
+    if nombre in df.columns:
+        return df[nombre].astype(object)
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
 # --- GESTIÓN DE DATOS ---
 
 # ============================================================================================================================
 # INGREDIENTES
 # ============================================================================================================================
-@st.cache_data(ttl=120)
+@medido(cache=st.cache_data(ttl=120))
 def leer_ingredientes_base():
     df = api_read(R2_INGREDIENTES)
+    if df.empty or "Ingrediente" not in df.columns.str.strip(): return []
     df.columns = df.columns.str.strip()
-
-    ingredientes = []
-    for _, r in df.iterrows():
-        if not r.get("Ingrediente"): continue
-        ingredientes.append({
-            "nombre": r["Ingrediente"],
-            "proveedor": r.get("Proveedor", ""),
-            "unidad_compra": r.get("Unidad de Compra", ""),
-            "costo_compra": clean_and_convert_float(r.get("Costo de Compra")),
-            "cantidad_compra": clean_and_convert_float(r.get("Cantidad por Unidad de Compra")),
-            "unidad_receta": r.get("Unidad Receta", ""),
-            "costo_receta": clean_and_convert_float(r.get("Costo por Unidad Receta")),
-            "nombre_normalizado": normalizar_texto(r["Ingrediente"])
-        })
-    return ingredientes
+    df = _como_filas(df)
+    df = df[df["Ingrediente"].map(bool)]
+
+    return pd.DataFrame({
+        "nombre": df["Ingrediente"].astype(object),
+        "proveedor": _columna(df, "Proveedor", ""),
+        "unidad_compra": _columna(df, "Unidad de Compra", ""),
+        "costo_compra": _columna_float(_columna(df, "Costo de Compra")),
+        "cantidad_compra": _columna_float(_columna(df, "Cantidad por Unidad de Compra")),
+        "unidad_receta": _columna(df, "Unidad Receta", ""),
+        "costo_receta": _columna_float(_columna(df, "Costo por Unidad Receta")),
+        "nombre_normalizado": _columna_texto_normalizado(df["Ingrediente"])
+    }).to_dict("records")
 
 def guardar_ingredientes_base(data):
     df = pd.DataFrame([{
@@ -196,11 +928,144 @@ def guardar_ingredientes_base(data):
 # ============================================================================================================================
 # RECETAS (Con soporte Sub-recetas y Modificadores Permitidos)
 # ============================================================================================================================
-@st.cache_data(ttl=120)
+# Motor de costos: grafo receta -> sub-recetas ordenado topológicamente. Se
+# guarda entre reruns; si sólo cambian los costos de ingredientes, únicamente
+# se recalculan las recetas que los usan (directa o indirectamente).
+@st.cache_resource
+def _motor_costos():
+    return {
+        "lock": threading.Lock(),
+        "estructura": None,  # producto -> {ingrediente: cantidad} del último grafo
+        "orden": [],  # productos en orden topológico (sub-recetas primero)
+        "usado_en": {},  # ingrediente / sub-receta -> recetas que lo contienen
+        "cortadas": set(),  # (receta, sub-receta) que cierran un ciclo: cuentan 0
+        "ciclos": [],
+        "mapa_costos": {},
+        "costos": {},
+        "recalculadas": 0,  # recetas costeadas en la última actualización
+        "matriz": None,  # ver matriz_insumos; se descarta al cambiar la estructura
+    }
+
+def _ordenar_recetas(estructura):
+    grafo = {p: {i for i in ings if i in estructura} for p, ings in estructura.items()}
+    cortadas, ciclos = set(), []
+    while True:
+        try:
+            return list(graphlib.TopologicalSorter(grafo).static_order()), cortadas, ciclos
+        except graphlib.CycleError as e:
+            # e.args[1] = [a, b, ..., a]: cada nodo es sub-receta del siguiente.
+            # Se corta una arista del ciclo y se vuelve a intentar.
+            ciclo = e.args[1]
+            ciclos.append(ciclo)
+            grafo[ciclo[1]].discard(ciclo[0])
+            cortadas.add((ciclo[1], ciclo[0]))
+
+def _costear(motor, productos):
+    # productos debe venir en orden topológico
+    estructura, mapa_costos, costos = motor["estructura"], motor["mapa_costos"], motor["costos"]
+    for p in productos:
+        total = 0
+        for ing, c in estructura[p].items():
+            val = mapa_costos.get(ing, 0)
+            if val == 0 and ing in estructura and (p, ing) not in motor["cortadas"]:
+                val = costos[ing]
+            total += val * c
+        costos[p] = total
+    motor["recalculadas"] = len(productos)
+
+def _ancestros(motor, nombres):
+    pendientes, vistos = list(nombres), set()
+    while pendientes:
+        for p in motor["usado_en"].get(pendientes.pop(), ()):
+            if p not in vistos:
+                vistos.add(p)
+                pendientes.append(p)
+    return vistos
+
+def costear_recetas(estructura, mapa_costos):
+    motor = _motor_costos()
+    with motor["lock"]:
+        if estructura != motor["estructura"]:
+            orden, cortadas, ciclos = _ordenar_recetas(estructura)
+            usado_en = {}
+            for p, ings in estructura.items():
+                for ing in ings:
+                    usado_en.setdefault(ing, []).append(p)
+            estructura = {p: dict(ings) for p, ings in estructura.items()}
+            motor.update(estructura=estructura, orden=orden, usado_en=usado_en,
+                         cortadas=cortadas, ciclos=ciclos, mapa_costos=dict(mapa_costos), costos={},
+                         matriz=None)
+            _costear(motor, orden)
+        else:
+            anterior = motor["mapa_costos"]
+            cambiados = {i for i in anterior.keys() | mapa_costos.keys() if anterior.get(i) != mapa_costos.get(i)}
+            afectadas = _ancestros(motor, cambiados)
+            motor["mapa_costos"] = dict(mapa_costos)
+            _costear(motor, [p for p in motor["orden"] if p in afectadas])
+        return dict(motor["costos"])
+
+def ciclos_recetas():
+    return list(_motor_costos()["ciclos"])
+
+def _construir_matriz(motor):
+    # Fila = producto, columna = insumo final; cada fila es la receta ya
+    # "explotada" (sub-recetas multiplicadas hasta llegar a ingredientes)
+    estructura = motor["estructura"]
+    insumos = sorted({i for ings in estructura.values() for i in ings if i not in estructura})
+    col = {i: k for k, i in enumerate(insumos)}
+    fila = {p: k for k, p in enumerate(motor["orden"])}
+    matriz = np.zeros((len(fila), len(insumos)))
+    for p in motor["orden"]:
+        for ing, c in estructura[p].items():
+            if ing not in estructura:
+                matriz[fila[p], col[ing]] += c
+            elif (p, ing) not in motor["cortadas"]:
+                matriz[fila[p]] += c * matriz[fila[ing]]
+    return pd.DataFrame(matriz, index=motor["orden"], columns=insumos)
+
+def matriz_insumos():
+    # Producto × insumo por unidad vendida. Se arma una vez por versión de las
+    # recetas (la que dejó leer_recetas en el motor) y se reutiliza.
+    leer_recetas()
+    motor = _motor_costos()
+    with motor["lock"]:
+        if motor["matriz"] is None and motor["estructura"] is not None:
+            motor["matriz"] = _construir_matriz(motor)
+        return motor["matriz"]
+
+def _matriz_de(recetas):
+    # Como matriz_insumos, pero de unas recetas dadas y sin pasar por el motor
+    estructura = {p: r["ingredientes"] for p, r in recetas.items()}
+    orden, cortadas, _ = _ordenar_recetas(estructura)
+    return _construir_matriz({"estructura": estructura, "orden": orden, "cortadas": cortadas})
+
+def consumo_insumos(unidades_por_producto, matriz=None):
+    # unidades_por_producto: Series producto -> unidades. Productos sin receta no consumen.
+    # matriz: la de _matriz_de (por defecto, matriz_insumos)
+    matriz = matriz_insumos() if matriz is None else matriz
+    if matriz is None or matriz.empty:
+        return pd.Series(dtype=float)
+    vector = unidades_por_producto.groupby(level=0).sum().reindex(matriz.index, fill_value=0)
+    return vector.to_numpy(dtype=float) @ matriz
+
+@medido(cache=st.cache_data(ttl=120))
 def leer_recetas():
-    df = api_read(R2_RECETAS)
+    recetas = _recetas_de(api_read(R2_RECETAS))
+    ingredientes = leer_ingredientes_base()
+    mapa_costos = {i["nombre"]: i["costo_receta"] for i in ingredientes}
+
+    # Cálculo de costo (sub-recetas a cualquier profundidad, ver costear_recetas)
+    costos = costear_recetas({p: r["ingredientes"] for p, r in recetas.items()}, mapa_costos)
+    for p in recetas:
+        recetas[p]["costo_total"] = costos[p]
+
+    return recetas
+
+def _recetas_de(df):
+    # La hoja de recetas ya leída, sin costos
     recetas = {}
     if df.empty or "Ingrediente" not in df.columns: return recetas
+    df = _como_filas(df)
 
     productos = [c for c in df.columns if c not in ["Ingrediente", "ModificadoresValidos"]]
     
@@ -216,44 +1081,21 @@ def leer_recetas():
     for p in productos:
         recetas[p] = {"ingredientes": {}, "costo_total": 0, "modificadores_validos": []}
 
-    ingredientes = leer_ingredientes_base()
-    mapa_costos = {i["nombre"]: i["costo_receta"] for i in ingredientes}
-
-    for _, r in df.iterrows():
-        ing = r["Ingrediente"]
-        
-        # Detectar fila de configuración de modificadores
-        if ing == "__MODS__":
-            for p in productos:
-                val = str(r.get(p, ""))
-                if val and val != "nan":
-                    recetas[p]["modificadores_validos"] = [x.strip() for x in val.split(",") if x.strip()]
-            continue
-            
-        for p in productos:
-            cant = clean_and_convert_float(r[p])
-            if cant > 0:
-                recetas[p]["ingredientes"][ing] = cant
-
-    # Cálculo de costo
-    for p in recetas:
-        for ing, c in recetas[p]["ingredientes"].items():
-            costo_u = mapa_costos.get(ing, 0)
-            if costo_u == 0 and ing in recetas:
-                pass 
-            recetas[p]["costo_total"] += costo_u * c
-            
-    # Segunda pasada (Sub-recetas)
-    for p in recetas:
-        costo_recalc = 0
-        for ing, c in recetas[p]["ingredientes"].items():
-            val = mapa_costos.get(ing, 0)
-            if val == 0 and ing in recetas:
-                 val = recetas[ing]["costo_total"]
-            costo_recalc += val * c
-        if costo_recalc > 0:
-            recetas[p]["costo_total"] = costo_recalc
-
+    # Detectar fila de configuración de modificadores
+    es_mods = df["Ingrediente"] == "__MODS__"
+    for fila in df.loc[es_mods, productos].astype(object).to_dict("records"):
+        for p, val in fila.items():
+            val = str(val)
+            if val and val != "nan":
+                recetas[p]["modificadores_validos"] = [x.strip() for x in val.split(",") if x.strip()]
+
+    # Cantidades: toda la hoja (ingrediente × producto) se limpia en una sola pasada
+    nombres = df.loc[~es_mods, "Ingrediente"].to_numpy(dtype=object)
+    bloque = df.loc[~es_mods, productos].to_numpy(dtype=object)
+    cantidades = _columna_float(pd.Series(bloque.ravel())).to_numpy().reshape(bloque.shape)
+    for j, p in enumerate(productos):
+        filas = np.flatnonzero(cantidades[:, j] > 0)
+        recetas[p]["ingredientes"] = dict(zip(nombres[filas].tolist(), cantidades[filas, j].tolist()))
     return recetas
 
 def guardar_recetas(recetas):
@@ -283,83 +1125,35 @@ def guardar_recetas(recetas):
         data.append(fila_mods)
         
     return api_write(R2_RECETAS, pd.DataFrame(data))
-    
-def descomponer_receta(producto, recetas, factor=1, acumulado=None, visitados=None):
-    if acumulado is None:
-        acumulado = {}
-
-    if visitados is None:
-        visitados = set()
-
-    if producto in visitados:
-        return acumulado  # evita ciclos reales
-
-    visitados.add(producto)
-
-    receta = recetas.get(producto)
-    if not receta:
-        acumulado[producto] = acumulado.get(producto, 0) + factor
-        visitados.remove(producto)
-        return acumulado
-
-    for ing, cant in receta["ingredientes"].items():
-        total = cant * factor
-        if ing in recetas:
-            descomponer_receta(ing, recetas, total, acumulado, visitados)
-        else:
-            acumulado[ing] = acumulado.get(ing, 0) + total
-
-    visitados.remove(producto)
-    return acumulado
-
-def descomponer_receta_unitaria(producto, recetas, acumulado=None, stack=None):
-    if acumulado is None:
-        acumulado = {}
-
-    if stack is None:
-        stack = set()
-
-    if producto in stack:
-        return acumulado  # evita ciclos
-
-    receta = recetas.get(producto)
-    if not receta:
-        acumulado[producto] = acumulado.get(producto, 0) + 1
-        return acumulado
-
-    stack.add(producto)
-
-    for ing, cant in receta["ingredientes"].items():
-        if ing in recetas:
-            sub = descomponer_receta_unitaria(ing, recetas, {}, stack)
-            for sub_ing, sub_cant in sub.items():
-                acumulado[sub_ing] = acumulado.get(sub_ing, 0) + sub_cant * cant
-        else:
-            acumulado[ing] = acumulado.get(ing, 0) + cant
-
-    stack.remove(producto)
-    return acumulado
 
 # ============================================================================================================================
 # MODIFICADORES
 # ============================================================================================================================
-@st.cache_data(ttl=120)
+@medido(cache=st.cache_data(ttl=120))
 def leer_modificadores():
-    df = api_read(R2_MODIFICADORES)
+    return _modificadores_de(api_read(R2_MODIFICADORES))
+
+def _modificadores_de(df):
+    # La hoja de modificadores ya leída
     modificadores = {}
     if df.empty: return modificadores
+    df = _como_filas(df)
     
     if "Modificador" in df.columns:
-        for mod_name, group in df.groupby("Modificador"):
-            modificadores[mod_name] = {
-                "precio_extra": float(group.iloc[0].get("Precio Extra", 0)),
-                "ingredientes": {}
-            }
-            for _, r in group.iterrows():
-                ing = r.get("Ingrediente Base")
-                cant = clean_and_convert_float(r.get("Cantidad"))
-                if ing and cant > 0:
-                    modificadores[mod_name]["ingredientes"][ing] = cant
+        # Precio: el de la primera fila de cada modificador (orden alfabético)
+        primeros = (
+            df.dropna(subset=["Modificador"])
+            .drop_duplicates("Modificador")
+            .sort_values("Modificador", kind="stable")
+        )
+        for mod_name, precio in zip(primeros["Modificador"], _columna(primeros, "Precio Extra", 0)):
+            modificadores[mod_name] = {"precio_extra": float(precio), "ingredientes": {}}
+
+        ing = _columna(df, "Ingrediente Base")
+        cant = _columna_float(_columna(df, "Cantidad"))
+        validas = df["Modificador"].notna() & ing.map(bool) & (cant > 0)
+        for mod_name, i, c in zip(df.loc[validas, "Modificador"], ing[validas], cant[validas].tolist()):
+            modificadores[mod_name]["ingredientes"][i] = c
     return modificadores
 
 def guardar_modificadores(mods_dict):
@@ -407,51 +1201,296 @@ def calcular_costo_modificador(nombre_mod, modificadores, ingredientes_base):
 # ============================================================================================================================
 # INVENTARIO
 # ============================================================================================================================
-def leer_inventario():
+def _tabla_inventario(df=None):
+    # Stock mínimo/máximo por ingrediente; su "Stock Actual" es solo el punto
+    # de partida del libro de movimientos (corte inicial). df: la hoja ya leída
     inventario = {}
-    try:
-        df = api_read(R2_INVENTARIO)
-        if df.empty: return inventario
-        for _, fila in df.iterrows():
-            nombre = str(fila.get('Ingrediente', '')).strip()
-            if not nombre: continue
-            inventario[nombre] = {
-                'stock_actual': clean_and_convert_float(fila.get('Stock Actual')),
-                'min': clean_and_convert_float(fila.get('Stock Mínimo')),
-                'max': clean_and_convert_float(fila.get('Stock Máximo'))
-            }
-    except Exception as e: st.error(f"Error inv: {e}")
+    df = api_read(R2_INVENTARIO) if df is None else df
+    if df.empty: return inventario
+    df = _como_filas(df)
+    nombres = _columna(df, 'Ingrediente', '').map(str).str.strip()
+    validas = nombres != ""
+    columnas = zip(
+        nombres[validas],
+        _columna_float(_columna(df, 'Stock Actual'))[validas].tolist(),
+        _columna_float(_columna(df, 'Stock Mínimo'))[validas].tolist(),
+        _columna_float(_columna(df, 'Stock Máximo'))[validas].tolist()
+    )
+    for nombre, stock, minimo, maximo in columnas:
+        inventario[nombre] = {'stock_actual': stock, 'min': minimo, 'max': maximo}
     return inventario
 
-def guardar_inventario(inventario_data):
+def _leer_cortes(df=None):
+    # df: el objeto ya leído (la escritura lo lee sin caché)
+    df = api_read(R2_INVENTARIO_CORTES) if df is None else df
+    if df.empty:
+        return df
+    df = df.copy()
+    df["Fecha"] = pd.to_datetime(df["Fecha"])
+    df["Stock"] = pd.to_numeric(df["Stock"], errors="coerce").fillna(0)
+    return df
+
+def _movimientos(desde, hasta, leer=None):
+    # Movimientos con desde <= Fecha < hasta; solo se leen los meses del intervalo.
+    # leer: lector sin caché para los hilos de fondo (por defecto, api_read en paralelo)
+    meses = pd.period_range(desde, hasta, freq="M").strftime("%Y-%m")
+    objetos = [f"{R2_INVENTARIO_MOVIMIENTOS}/{m}" for m in meses]
+    dfs = _leer_en_paralelo(objetos) if leer is None else [leer(o) for o in objetos]
+    dfs = [d for d in dfs if not d.empty]
+    if not dfs:
+        return pd.DataFrame({"Fecha": pd.Series(dtype="datetime64[ns]"), "Ingrediente": pd.Series(dtype=object),
+                             "Cantidad": pd.Series(dtype=float)})
+    df = pd.concat(dfs, ignore_index=True)
+    df["Fecha"] = pd.to_datetime(df["Fecha"])
+    df["Cantidad"] = pd.to_numeric(df["Cantidad"], errors="coerce").fillna(0)
+    return df[(df["Fecha"] >= desde) & (df["Fecha"] < hasta)]
+
+def _stock_corte(cortes, fecha):
+    filas = cortes[(cortes["Fecha"] == fecha) & (cortes["Ingrediente"] != "")]
+    return filas.groupby("Ingrediente")["Stock"].sum()
+
+def _corte_inicial(inventario, ahora):
+    # El "Stock Actual" de la tabla; una fila sin ingrediente marca el instante
+    # del corte aunque no haya stock
+    inicial = [{"Fecha": ahora.isoformat(), "Ingrediente": n, "Stock": round(v["stock_actual"], 4)}
+               for n, v in inventario.items()]
+    return inicial + [{"Fecha": ahora.isoformat(), "Ingrediente": "", "Stock": 0}]
+
+def _cortes_faltantes(cortes, ahora, leer=None):
+    # Un corte al inicio de cada mes que falte desde el último, plegando solo
+    # los movimientos del mes anterior. Así el stock a una fecha nunca recorre
+    # todo el libro.
+    ultimo = cortes["Fecha"].max()
+    limites = pd.date_range(ultimo, ahora.normalize().replace(day=1), freq="MS")
+    stock, previo, nuevos = _stock_corte(cortes, ultimo), ultimo, []
+    for limite in limites[limites > ultimo]:
+        movs = _movimientos(previo, limite, leer)
+        stock = stock.add(movs.groupby("Ingrediente")["Cantidad"].sum(), fill_value=0)
+        nuevos += [{"Fecha": limite.isoformat(), "Ingrediente": n, "Stock": round(v, 4)} for n, v in stock.items()]
+        nuevos.append({"Fecha": limite.isoformat(), "Ingrediente": "", "Stock": 0})
+        previo = limite
+    return nuevos
+
+def guardar_cortes(ahora=None):
+    # Persiste los cortes mensuales que falten. Corre tras la compactación de
+    # ventas, en segundo plano: lee sin st.cache_data. Mientras tanto los
+    # lectores los calculan en memoria (ver _stock_al).
+    cortes = _leer_cortes(_api_get_df(R2_INVENTARIO_CORTES))
+    if cortes.empty:
+        return 0
+    nuevos = _cortes_faltantes(cortes, ahora or pd.Timestamp.now(), _api_get_df)
+    if not nuevos:
+        return 0
+
+    def agregar(actual):
+        vistas = {pd.Timestamp(c["Fecha"]) for c in actual}
+        faltan = [c for c in nuevos if pd.Timestamp(c["Fecha"]) not in vistas]
+        return actual + faltan if faltan else None
+    _actualizar_objeto(R2_INVENTARIO_CORTES, agregar)
+    invalidar_dataset(R2_INVENTARIO_CORTES)
+    return len(nuevos)
+
+def _stock_al(hasta, leer=None):
+    # Stock con todos los movimientos anteriores a "hasta": último corte + delta.
+    # Solo lee: el corte inicial lo guarda el primer movimiento y los mensuales
+    # guardar_cortes; los que aún no están se calculan aquí. leer: lector sin
+    # caché (ver stock_al_dia); por defecto, api_read
+    hoja = lambda endpoint: None if leer is None else leer(endpoint)
+    ahora = pd.Timestamp.now()
+    cortes = _leer_cortes(hoja(R2_INVENTARIO_CORTES))
+    if cortes.empty:
+        cortes = _leer_cortes(pd.DataFrame(_corte_inicial(_tabla_inventario(hoja(R2_INVENTARIO)), ahora)))
+    else:
+        faltan = _cortes_faltantes(cortes, ahora, leer)
+        if faltan:
+            cortes = pd.concat([cortes, _leer_cortes(pd.DataFrame(faltan))], ignore_index=True)
+    previos = cortes[cortes["Fecha"] <= hasta]
+    if previos.empty:
+        # Antes del inicio del libro no hay historia: el corte inicial
+        return _stock_corte(cortes, cortes["Fecha"].min())
+    corte = previos["Fecha"].max()
+    movs = _movimientos(corte, hasta, leer)
+    return _stock_corte(cortes, corte).add(movs.groupby("Ingrediente")["Cantidad"].sum(), fill_value=0)
+
+def stock_al_dia(ingrediente):
+    # Stock de ahora leído sin cachés (lanza si falla): un ajuste se guarda
+    # como diferencia y la de leer_inventario puede tener hasta 2 min
+    return float(_stock_al(pd.Timestamp.now(), _api_get_df).get(ingrediente, 0.0))
+
+def registrar_movimientos(movimientos):
+    # Agrega al libro; lanza la excepción si falla. Cada movimiento: Fecha,
+    # Ingrediente, Cantidad (+ entra / − sale), Tipo (TIPOS_MOVIMIENTO) y
+    # Referencia. Reintentar es seguro: (Referencia, Ingrediente, Tipo) no se repite.
+    df = pd.DataFrame(movimientos)
+    if df.empty:
+        return
+    # Lectura directa, sin st.cache_data: también corre en el enviador de la cola
+    cortes = _leer_cortes(_api_get_df(R2_INVENTARIO_CORTES))
+    if cortes.empty:
+        # Primer movimiento: fija el corte inicial antes de escribir en el libro
+        inicial = _corte_inicial(_tabla_inventario(_api_get_df(R2_INVENTARIO)), pd.Timestamp.now())
+        _actualizar_objeto(R2_INVENTARIO_CORTES, lambda actual: None if actual else inicial)
+        cortes = _leer_cortes(_api_get_df(R2_INVENTARIO_CORTES))
+    fechas = pd.to_datetime(df["Fecha"])
+    if not cortes.empty:
+        # Lo anterior al inicio del libro cuenta desde el corte inicial
+        fechas = fechas.clip(lower=cortes["Fecha"].min())
+    df["Fecha"] = fechas.map(lambda f: f.isoformat())
+    df["Cantidad"] = pd.to_numeric(df["Cantidad"], errors="coerce").fillna(0).round(4)
+
+    for mes, grupo in df.groupby(fechas.dt.strftime("%Y-%m")):
+        filas = grupo.to_dict("records")
+
+        def agregar(actual, filas=filas):
+            vistos = {(m.get("Referencia"), m.get("Ingrediente"), m.get("Tipo")) for m in actual}
+            faltan = [f for f in filas if (f["Referencia"], f["Ingrediente"], f["Tipo"]) not in vistos]
+            return actual + faltan if faltan else None
+        _actualizar_objeto(f"{R2_INVENTARIO_MOVIMIENTOS}/{mes}", agregar)
+
+    # Un movimiento con fecha ya cubierta por un corte de inicio de mes lo
+    # invalida (y a los siguientes); se rehacen en la próxima lectura
+    desde = fechas.min()
+    if not cortes.empty and (cortes["Fecha"] > desde).any():
+        _actualizar_objeto(R2_INVENTARIO_CORTES, lambda actual: [c for c in actual if pd.Timestamp(c["Fecha"]) <= desde])
+    invalidar_dataset(R2_INVENTARIO)
+
+@medido(cache=st.cache_data(ttl=120))
+def leer_inventario(hasta=None):
+    # Stock al instante "hasta" (por defecto, ahora) desde el libro de movimientos
+    inventario = {}
     try:
-        datos = []
-        for nombre, data in inventario_data.items():
-            datos.append({
-                'Ingrediente': nombre,
-                'Stock Actual': round(data.get('stock_actual', 0.0), 4),
-                'Stock Mínimo': round(data.get('min', 0.0), 4),
-                'Stock Máximo': round(data.get('max', 0.0), 4),
-            })
-        return api_write(R2_INVENTARIO, pd.DataFrame(datos))
-    except Exception as e: return False
+        inventario = _tabla_inventario()
+        stock = _stock_al(pd.Timestamp(hasta) if hasta is not None else pd.Timestamp.now())
+        for nombre in inventario:
+            inventario[nombre]['stock_actual'] = 0.0
+        for nombre, cantidad in stock.items():
+            inventario.setdefault(nombre, {'min': 0.0, 'max': 0.0})['stock_actual'] = float(cantidad)
+    except Exception as e: st.error(f"Error inv: {e}")
+    return inventario
 
 # ============================================================================================================================
 # VENTAS
 # ============================================================================================================================
-@st.cache_data(ttl=120)
-def leer_ventas(f_ini=None, f_fin=None):
-    df = api_read(R2_VENTAS)
-    if df.empty:
-        return []
-
+def _fechas_venta(df):
     # --- Fecha (compatibilidad total) ---
     if "Fecha" in df.columns:
-        df["Fecha_DT"] = pd.to_datetime(df["Fecha"], dayfirst=True, errors="coerce")
-    elif "Fecha Venta" in df.columns:
-        df["Fecha_DT"] = pd.to_datetime(df["Fecha Venta"], errors="coerce")
+        return pd.to_datetime(df["Fecha"], dayfirst=True, errors="coerce")
+    if "Fecha Venta" in df.columns:
+        return pd.to_datetime(df["Fecha Venta"], errors="coerce")
+    return pd.Series(pd.NaT, index=df.index)
+
+def _particion_ventas(df):
+    return _fechas_venta(df).dt.strftime("%Y-%m").fillna(PARTICION_SIN_FECHA)
+
+def _particiones_en_rango(f_ini, f_fin):
+    return set(pd.period_range(f_ini, f_fin, freq="M").strftime("%Y-%m"))
+
+def _unir_segmentos(df_base, segmentos):
+    # Las líneas ya compactadas en la base (mismo "Id Venta") se descartan
+    ids_base = set(df_base["Id Venta"].dropna()) if "Id Venta" in df_base.columns else set()
+    nuevos = [
+        df[~df["Id Venta"].isin(ids_base)] if "Id Venta" in df.columns else df
+        for df in segmentos if not df.empty
+    ]
+    nuevos = [df for df in nuevos if not df.empty]
+    if not nuevos:
+        return df_base
+    return pd.concat([df_base] + nuevos, ignore_index=True)
+
+def _leer_ventas_crudas(f_ini=None, f_fin=None, leer=None):
+    # leer: lector sin caché (p. ej. _api_get_df), que lanza si algo falla;
+    # por defecto, api_read
+    manifiesto = api_read(R2_VENTAS_MANIFIESTO) if leer is None else leer(R2_VENTAS_MANIFIESTO)
+    for c in ["Tipo", "Objeto", "Particion"]:
+        if c not in manifiesto.columns:
+            manifiesto[c] = None
+    manifiesto["Tipo"] = manifiesto["Tipo"].fillna("segmento")
+    migrado = (manifiesto["Tipo"] == "particion").any()
+
+    # Poda por rango: solo particiones que se traslapan con [f_ini, f_fin].
+    # Los segmentos sin partición (formato anterior) se leen siempre.
+    if f_ini and f_fin:
+        en_rango = manifiesto["Particion"].isna() | manifiesto["Particion"].isin(
+            _particiones_en_rango(f_ini, f_fin)
+        )
+        manifiesto = manifiesto[en_rango]
+
+    es_particion = manifiesto["Tipo"] == "particion"
+    bases = list(manifiesto.loc[es_particion, "Objeto"])
+    segmentos = list(manifiesto.loc[~es_particion, "Objeto"])
+    if not migrado:
+        # Histórico aún sin migrar: un solo objeto "ventas" sin particionar
+        bases = [R2_VENTAS]
+
+    if leer is None:
+        dfs = _leer_en_paralelo(bases + segmentos)
     else:
-        return []
+        dfs = _ejecutar_en_paralelo([lambda o=o: leer(o) for o in bases + segmentos])
+    dfs_base = [df for df in dfs[:len(bases)] if not df.empty]
+    df_base = pd.concat(dfs_base, ignore_index=True) if dfs_base else pd.DataFrame()
+    return _unir_segmentos(df_base, dfs[len(bases):])
+
+# --- SINCRONIZACIÓN INCREMENTAL ---
+@st.cache_resource
+def _copia_ventas():
+    # Copia local de todas las líneas (crudas) compartida por las sesiones
+    return {"lock": threading.Lock(), "df": None, "ids": set(), "marca": None, "cargada": 0.0, "sin_cambios": False}
+
+def _pedir_cambios(desde=None):
+    params = {} if desde is None else {"desde": desde}
+    r = _peticion("GET", R2_VENTAS_CAMBIOS, params=params, headers=_headers_lectura(R2_VENTAS_CAMBIOS))
+    r.raise_for_status()
+    # Sin una marca válida no se sabe desde dónde seguir: None (recarga completa)
+    marca = r.headers.get("X-Marca", "").strip()
+    return _df_desde_respuesta(r), int(marca) if marca.isdigit() else None
+
+def _sincronizar_ventas(copia):
+    vencida = time.monotonic() - copia["cargada"] > RECARGA_COMPLETA_VENTAS_MIN * 60
+    marca = None
+    if copia["marca"] is not None and not vencida:
+        nuevas, marca = _pedir_cambios(copia["marca"])
+        if marca is None:
+            log.warning("%s respondió sin X-Marca válida: recarga completa", R2_VENTAS_CAMBIOS)
+    if marca is None:
+        # La marca se pide ANTES de la carga completa: lo escrito entretanto
+        # vuelve a llegar en el siguiente delta y se descarta por "Id Venta".
+        # La carga no pasa por la caché: un manifiesto cacheado de antes de la
+        # marca perdería lo que otro terminal escribió en medio.
+        _, marca = _pedir_cambios()
+        df = _leer_ventas_crudas(leer=_api_get_df)
+        copia["ids"] = set(df["Id Venta"].dropna()) if "Id Venta" in df.columns else set()
+        copia["cargada"] = time.monotonic()
+    else:
+        df = copia["df"]
+        if not nuevas.empty and "Id Venta" in nuevas.columns:
+            nuevas = nuevas[~nuevas["Id Venta"].isin(copia["ids"])]
+            copia["ids"].update(nuevas["Id Venta"].dropna())
+            df = pd.concat([df, nuevas], ignore_index=True)
+    copia["df"], copia["marca"] = df, marca
+
+def _leer_ventas(f_ini=None, f_fin=None):
+    # Con SYNC_VENTAS: copia local + delta desde la marca, en lugar de volver a
+    # bajar el rango completo cada vez que vence la caché
+    copia = _copia_ventas()
+    if SYNC_VENTAS and not copia["sin_cambios"]:
+        with copia["lock"]:
+            try:
+                _sincronizar_ventas(copia)
+            except requests.RequestException as e:
+                if getattr(e.response, "status_code", None) in (400, 404, 405, 501):
+                    copia["sin_cambios"] = True  # el Worker no implementa _cambios
+                elif copia["df"] is not None:
+                    # Sin conexión se sigue con la copia local
+                    st.error(f"❌ Error de conexión con R2 ({R2_VENTAS_CAMBIOS}): {e}")
+            if copia["df"] is not None and not copia["sin_cambios"]:
+                # Copia superficial: _normalizar_ventas añade columnas sin tocar la local
+                return copia["df"].copy(deep=False)
+    return _leer_ventas_crudas(f_ini, f_fin)
+
+def _normalizar_ventas(df, f_ini=None, f_fin=None):
+    if df.empty or ("Fecha" not in df.columns and "Fecha Venta" not in df.columns):
+        return pd.DataFrame()
+    df["Fecha_DT"] = _fechas_venta(df)
 
     df = df[df["Fecha_DT"].notna()].copy()
     df["Fecha_DT"] = df["Fecha_DT"].dt.normalize()
@@ -469,7 +1508,9 @@ def leer_ventas(f_ini=None, f_fin=None):
     ]
     for col in cols_num:
         if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+            df[col] = df[col].fillna(0)
     
     # --- Compatibilidad con histórico antiguo (CSV / Escritorio) ---
     if "Total Venta Neta" not in df.columns:
@@ -489,10 +1530,103 @@ def leer_ventas(f_ini=None, f_fin=None):
     else:
         df["Modificadores"] = [[] for _ in range(len(df))]
     
-    return df.to_dict("records")
+    return df
+
+def _con_esquema_ventas(df):
+    # Siempre las mismas columnas y tipos (ESQUEMA_VENTAS), aunque el rango
+    # venga vacío o el histórico no traiga alguna columna. "Fecha" pasa a ser
+    # la fecha ya interpretada (Fecha_DT); el texto original no se guarda.
+    df = df.drop(columns=["Fecha"], errors="ignore").rename(columns={"Fecha_DT": "Fecha"})
+    columnas = {}
+    for c, tipo in ESQUEMA_VENTAS.items():
+        if c in COLUMNAS_NUMERICAS_VENTAS:
+            columnas[c] = pd.to_numeric(_columna(df, c, 0), errors="coerce").fillna(0).astype(tipo)
+        elif c == "Linea":
+            columnas[c] = _numero_linea(_columna(df, "Id Venta")).astype(tipo)
+        elif c in df.columns:
+            columnas[c] = df[c].astype(tipo)
+        else:
+            columnas[c] = pd.Series(None, index=df.index, dtype=tipo)
+    return pd.DataFrame(columnas, index=df.index).reset_index(drop=True)
+
+def _numero_linea(ids):
+    # 0, 1, ... dentro de cada "Id Venta"; las líneas sin id cuentan como una sola venta
+    return ids.groupby(ids, dropna=False, sort=False).cumcount()
+
+def _tabla_modificadores(lineas, mods):
+    # Una fila por modificador de cada línea, en lugar de una lista de dicts
+    # por línea. mods va alineado con lineas; cada modificador lleva la clave
+    # ("Id Venta", "Linea") de su línea, no su posición.
+    posiciones, nombres, cantidades = [], [], []
+    for posicion, lista in enumerate(mods.tolist()):
+        for m in lista if isinstance(lista, list) else []:
+            if isinstance(m, dict):
+                nombre, cantidad = m.get("nombre"), clean_and_convert_float(m.get("cantidad", 1))
+            elif isinstance(m, str):
+                nombre, cantidad = m, 1.0
+            else:
+                continue
+            posiciones.append(posicion)
+            nombres.append(nombre)
+            cantidades.append(cantidad)
+    posiciones = np.array(posiciones, dtype="int64")
+    return pd.DataFrame({
+        "Id Venta": lineas["Id Venta"].iloc[posiciones].reset_index(drop=True),
+        "Linea": lineas["Linea"].to_numpy()[posiciones],
+        "Modificador": pd.Categorical(nombres),
+        "Cantidad": np.array(cantidades, dtype="float32"),
+    })
+
+def _solo_lectura(df):
+    # Vista sobre los mismos arreglos, no escribibles y sin referencias a df:
+    # escribir un valor lanza ValueError; añadir o reemplazar columnas solo
+    # cambia la vista, no la tabla compartida
+    columnas = {}
+    for c in df.columns:
+        valores = df[c].array
+        if isinstance(valores, pd.Categorical):
+            columnas[c] = pd.Categorical.from_codes(valores.codes, dtype=valores.dtype)
+        else:
+            columnas[c] = df[c].to_numpy()
+    return pd.DataFrame(columnas, index=df.index, copy=False)
+
+@medido(cache=st.cache_resource(ttl=120))
+def _ventas_en_rango(f_ini=None, f_fin=None):
+    # Un único juego de tablas por rango, compartido entre reruns y sesiones
+    # sin la copia que hace st.cache_data en cada llamada. Solo se entregan
+    # vistas de solo lectura (ver _solo_lectura).
+    df = _normalizar_ventas(_leer_ventas(f_ini, f_fin), f_ini, f_fin)
+    mods = df["Modificadores"] if "Modificadores" in df.columns else pd.Series(dtype=object)
+    lineas = _con_esquema_ventas(df)
+    return lineas, _tabla_modificadores(lineas, mods)
+
+@medido
+def leer_ventas_df(f_ini=None, f_fin=None):
+    return _solo_lectura(_ventas_en_rango(f_ini, f_fin)[0])
+
+@medido
+def leer_modificadores_ventas(f_ini=None, f_fin=None):
+    return _solo_lectura(_ventas_en_rango(f_ini, f_fin)[1])
+
+def _registros_json(df):
+    # --- LIMPIEZA JSON-SAFE (ESTA PARTE ES ORO) ---
+    def limpiar_json(v):
+        if v is None:
+            return 0
+        if isinstance(v, float):
+            if math.isnan(v) or math.isinf(v):
+                return 0
+        return v
 
-def guardar_ventas(nuevas, fecha_venta=None):
-    df_actual = api_read(R2_VENTAS)
+    return [
+        {k: limpiar_json(v) for k, v in fila.items()}
+        for fila in df.to_dict("records")
+    ]
+
+def _subir_ventas(nuevas, fecha_venta=None, id_venta=None):
+    # Sube un cobro; lanza la excepción si falla. Reintentar con el mismo
+    # id_venta es seguro: el segmento se sobrescribe con el mismo contenido y
+    # el manifiesto no repite filas de un objeto ya registrado.
     df_nuevo = pd.DataFrame(nuevas)
 
     if df_nuevo.empty:
@@ -551,285 +1685,506 @@ def guardar_ventas(nuevas, fecha_venta=None):
 
     df_nuevo.drop(columns=["Subtotal"], inplace=True, errors="ignore")
 
-    # --- UNIR HISTÓRICO ---
-    df_final = df_nuevo if df_actual.empty else pd.concat(
-        [df_actual, df_nuevo],
-        ignore_index=True
-    )
+    # --- SEGMENTO NUEVO (solo las líneas de este cobro, uno por partición) ---
+    id_venta = id_venta or uuid.uuid4().hex
+    df_nuevo["Id Venta"] = id_venta
+    creado = pd.Timestamp.now().isoformat(timespec="seconds")
+
+    filas_manifiesto = []
+    for particion, df_part in df_nuevo.groupby(_particion_ventas(df_nuevo)):
+        objeto = f"{R2_VENTAS}/{particion}/{id_venta}"
+        _api_put(objeto, _registros_json(df_part))
+        filas_manifiesto.append({
+            "Tipo": "segmento",
+            "Objeto": objeto,
+            "Particion": particion,
+            "Id Venta": id_venta,
+            "Filas": len(df_part),
+            "Creado": creado
+        })
+    def agregar(manifiesto):
+        registrados = {m.get("Objeto") for m in manifiesto}
+        faltan = [m for m in filas_manifiesto if m["Objeto"] not in registrados]
+        return manifiesto + faltan if faltan else None
+    manifiesto = _actualizar_objeto(R2_VENTAS_MANIFIESTO, agregar)
+    registrar_movimientos(_movimientos_venta(df_nuevo, id_venta))
+
+    _acumular_resumen(df_nuevo.copy())
+    invalidar_dataset(R2_VENTAS)
+    invalidar_dataset(R2_VENTAS_RESUMEN)
+    segmentos = [m for m in manifiesto if m.get("Tipo", "segmento") == "segmento"]
+    if len(segmentos) >= SEGMENTOS_MAX_SIN_COMPACTAR:
+        threading.Thread(target=compactar_ventas, daemon=True).start()
+    return True
 
-    # --- LIMPIEZA JSON-SAFE (ESTA PARTE ES ORO) ---
-    registros = df_final.to_dict("records")
+def guardar_ventas(nuevas, fecha_venta=None):
+    try:
+        return _subir_ventas(nuevas, fecha_venta)
+    except Exception as e:
+        st.error(f"❌ Error guardando {R2_VENTAS}: {e}")
+        return False
 
-    def limpiar_json(v):
-        if v is None:
-            return 0
-        if isinstance(v, float):
-            if math.isnan(v) or math.isinf(v):
-                return 0
-        return v
+# --- COLA LOCAL DE VENTAS ---
+def _cola_db():
+    # Escritura: el esquema y el modo WAL ya los dejó _enviador_cola
+    con = sqlite3.connect(COLA_VENTAS_DB, timeout=10)
+    con.execute("PRAGMA synchronous=FULL")  # el cobro está en disco al volver el INSERT
+    return con
+
+def _crear_cola():
+    with closing(sqlite3.connect(COLA_VENTAS_DB, timeout=10)) as con, con:
+        con.execute("PRAGMA journal_mode=WAL")  # queda guardado en el archivo
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS cola_ventas ("
+            "id TEXT PRIMARY KEY, creado REAL, fecha_venta TEXT, lineas TEXT, "
+            "intentos INTEGER DEFAULT 0, proximo REAL DEFAULT 0, error TEXT)"
+        )
 
-    registros_limpios = [
-        {k: limpiar_json(v) for k, v in fila.items()}
-        for fila in registros
-    ]
+def encolar_venta(nuevas, fecha_venta=None):
+    # El cobro se confirma en la cola local (milisegundos) y el enviador lo
+    # sube después. El id es la clave de idempotencia de los reintentos: es
+    # el "Id Venta" y nombra los segmentos (ver _subir_ventas).
+    enviador = _enviador_cola()
+    id_venta = uuid.uuid4().hex
+    fecha = None if fecha_venta is None else pd.to_datetime(fecha_venta).isoformat()
+    with closing(_cola_db()) as con, con:
+        con.execute(
+            "INSERT INTO cola_ventas (id, creado, fecha_venta, lineas) VALUES (?, ?, ?, ?)",
+            (id_venta, time.time(), fecha, json.dumps(nuevas, default=str))
+        )
+    enviador["evento"].set()
+    return id_venta
+
+def ventas_pendientes():
+    # (cobros en cola, último error de envío o None). Conexión de solo lectura:
+    # se consulta en cada rerun del POS
+    enviador = _enviador_cola()
+    with closing(sqlite3.connect(f"file:{COLA_VENTAS_DB}?mode=ro", uri=True, timeout=10)) as con:
+        n = con.execute("SELECT COUNT(*) FROM cola_ventas").fetchone()[0]
+        error = con.execute(
+            "SELECT error FROM cola_ventas WHERE error IS NOT NULL ORDER BY creado DESC LIMIT 1"
+        ).fetchone()
+    # Un fallo del propio enviador (p. ej. la base bloqueada) pesa más que el de un cobro
+    return n, enviador["error"] or (error[0] if error else None)
+
+def _enviar_cola():
+    # Un cobro que falla no frena a los demás; se reintenta con backoff
+    with closing(_cola_db()) as con:
+        pendientes = con.execute(
+            "SELECT id, fecha_venta, lineas, intentos FROM cola_ventas WHERE proximo <= ? ORDER BY creado",
+            (time.time(),)
+        ).fetchall()
+    for id_venta, fecha, lineas, intentos in pendientes:
+        try:
+            _subir_ventas(json.loads(lineas), fecha, id_venta)
+        except Exception as e:
+            espera = min(INTERVALO_COLA_SEG * 2 ** intentos, ESPERA_MAX_COLA_SEG)
+            with closing(_cola_db()) as con, con:
+                con.execute(
+                    "UPDATE cola_ventas SET intentos = intentos + 1, proximo = ?, error = ? WHERE id = ?",
+                    (time.time() + espera, str(e)[:500], id_venta)
+                )
+            continue
+        with closing(_cola_db()) as con, con:
+            con.execute("DELETE FROM cola_ventas WHERE id = ?", (id_venta,))
+
+@st.cache_resource
+def _enviador_cola():
+    # Un hilo por proceso vacía la cola cada INTERVALO_COLA_SEG segundos o
+    # en cuanto encolar_venta lo despierta con el evento. Corre sin sesión:
+    # sus invalidaciones se aplican en el siguiente rerun (ver invalidar_dataset).
+    _crear_cola()
+    enviador = {"evento": threading.Event(), "error": None}
+
+    def bucle():
+        while True:
+            enviador["evento"].wait(INTERVALO_COLA_SEG)
+            enviador["evento"].clear()
+            try:
+                _enviar_cola()
+                enviador["error"] = None
+            except Exception as e:
+                log.exception("Falló el envío de la cola de ventas")
+                enviador["error"] = f"{type(e).__name__}: {e}"[:500]
+
+    threading.Thread(target=bucle, daemon=True).start()
+    return enviador
+
+@st.cache_resource
+def _lock_compactacion():
+    return threading.Lock()
+
+def _ventas_legado():
+    # El objeto "ventas" histórico con un "Id Venta" fijo por posición en las
+    # líneas que no lo traen: si la migración se corta después de escribir
+    # alguna base, el reintento las reconoce y no las vuelve a agregar
+    df = _api_get_df(R2_VENTAS)
+    if df.empty:
+        return df
+    ids = df["Id Venta"].astype(object) if "Id Venta" in df.columns else pd.Series(None, index=df.index, dtype=object)
+    sin_id = ids.isna() | ids.isin(["", 0, "0"])
+    df["Id Venta"] = ids.where(~sin_id, pd.Series([f"legado-{n}" for n in range(len(df))], index=df.index))
+    return df
+
+def compactar_ventas():
+    # Integra los segmentos en la base de su partición. Corre en segundo plano
+    # (sin UI): las bases se escriben antes que el manifiesto y, mientras tanto,
+    # los lectores descartan los segmentos duplicados por su "Id Venta".
+    # La primera compactación también reparte el objeto "ventas" histórico.
+    lock = _lock_compactacion()
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        manifiesto = _api_get(R2_VENTAS_MANIFIESTO)
+        particiones = {m["Particion"] for m in manifiesto if m.get("Tipo") == "particion"}
+        segmentos = [m for m in manifiesto if m.get("Tipo", "segmento") == "segmento"]
+
+        nuevas = [_api_get_df(m["Objeto"]) for m in segmentos]
+        if not particiones:
+            nuevas.insert(0, _ventas_legado())
+        nuevas = [df for df in nuevas if not df.empty]
+        if not nuevas:
+            return True
+        df_nuevas = pd.concat(nuevas, ignore_index=True)
+
+        # Las líneas sin fecha válida van a la partición PARTICION_SIN_FECHA
+        escritas = {}
+        for particion, df_part in df_nuevas.groupby(_particion_ventas(df_nuevas)):
+            objeto = f"{R2_VENTAS}/{particion}"
+
+            def integrar(df_base, df_part=df_part):
+                if "Id Venta" in df_base.columns and "Id Venta" in df_part.columns:
+                    df_part = df_part[~df_part["Id Venta"].isin(set(df_base["Id Venta"].dropna()))]
+                return _registros_json(pd.concat([df_base, df_part], ignore_index=True))
+            filas = _actualizar_objeto(objeto, integrar, como_df=True)
+            escritas[particion] = {
+                "Tipo": "particion",
+                "Objeto": objeto,
+                "Particion": particion,
+                "Filas": len(filas),
+                "Creado": pd.Timestamp.now().isoformat(timespec="seconds")
+            }
+
+        # Releer: pudieron llegar segmentos nuevos durante la compactación
+        compactados = {m["Objeto"] for m in segmentos}
+        _actualizar_objeto(R2_VENTAS_MANIFIESTO, lambda actual: list(escritas.values()) + [
+            m for m in actual
+            if m["Objeto"] not in compactados
+            and not (m.get("Tipo") == "particion" and m["Particion"] in escritas)
+        ])
+        invalidar_dataset(R2_VENTAS)
+
+        # Ya fuera del manifiesto, los segmentos integrados se borran. Uno que
+        # no se pudo borrar queda huérfano: nadie lo lee; solo se registra.
+        for objeto in sorted(compactados):
+            try:
+                _api_delete(objeto)
+            except requests.RequestException as e:
+                log.warning("No se pudo borrar el segmento compactado %s: %s", objeto, e)
+        # De paso, los cortes de inventario de los meses cerrados
+        try:
+            guardar_cortes()
+        except Exception:
+            log.exception("No se pudieron guardar los cortes de inventario")
+        return True
+    except Exception:
+        log.exception("Falló la compactación de ventas")
+        return False
+    finally:
+        lock.release()
+
+# --- RESUMEN DIARIO ---
+def _resumir_ventas(df):
+    # df ya normalizado (ver _normalizar_ventas)
+    if df.empty:
+        return pd.DataFrame(columns=CLAVES_RESUMEN + ["Ventas", "Ganancia", "Cantidad", "Lineas"])
+    numero = lambda c: pd.to_numeric(df[c], errors="coerce").fillna(0) if c in df.columns else 0
+    texto = lambda c: df[c].fillna("").astype(str) if c in df.columns else ""
+    return pd.DataFrame({
+        "Fecha": df["Fecha_DT"].dt.strftime("%Y-%m-%d"),
+        "Particion": df["Fecha_DT"].dt.strftime("%Y-%m"),
+        "Producto": texto("Producto"),
+        "Forma Pago": texto("Forma Pago"),
+        "Ventas": numero("Total Venta Neta"),
+        "Ganancia": numero("Ganancia Neta"),
+        "Cantidad": numero("Cantidad"),
+        "Lineas": 1,
+    }).groupby(CLAVES_RESUMEN, as_index=False).sum()
+
+def _objeto_resumen(particion):
+    return f"{R2_VENTAS_RESUMEN}/{particion}"
+
+def _resumen_mes(particion):
+    mes = pd.Period(particion, freq="M")
+    ini, fin = mes.start_time.date(), mes.end_time.date()
+    return _resumir_ventas(_normalizar_ventas(_leer_ventas_crudas(ini, fin), ini, fin))
+
+def _acumular_resumen(df_nuevo):
+    # Se suma el cobro solo al resumen de su mes (escritura condicional: dos
+    # cobros simultáneos no se pisan). Un mes sin resumen no se crea aquí:
+    # reparar_resumen lo arma con todas sus ventas. Si falla, el mes deja de
+    # cuadrar con el manifiesto y reparar_resumen lo rehace.
+    nuevo = _resumir_ventas(_normalizar_ventas(df_nuevo))
+    for particion, df_mes in nuevo.groupby("Particion"):
+        def sumar(actual, df_mes=df_mes):
+            if actual.empty:
+                return None
+            resumen = pd.concat([actual, df_mes], ignore_index=True).groupby(CLAVES_RESUMEN, as_index=False).sum()
+            return _registros_json(resumen.sort_values(CLAVES_RESUMEN))
+        try:
+            _actualizar_objeto(_objeto_resumen(particion), sumar, como_df=True)
+        except Exception:
+            log.exception("No se pudo actualizar el resumen de %s; queda desactualizado", particion)
 
-    return api_write(R2_VENTAS, registros_limpios)
+@st.cache_data(ttl=120)
+def _meses_resumen(f_ini=None, f_fin=None):
+    # (meses con ventas, meses cuyo resumen falta o no cuadra con el manifiesto).
+    # Antes de la primera compactación el manifiesto no cuenta el histórico:
+    # los meses salen de las ventas y solo se detectan los que faltan.
+    manifiesto = api_read(R2_VENTAS_MANIFIESTO)
+    filas = None
+    if "Tipo" in manifiesto.columns and (manifiesto["Tipo"] == "particion").any():
+        filas = pd.to_numeric(manifiesto["Filas"], errors="coerce").fillna(0).groupby(manifiesto["Particion"]).sum()
+        particiones = set(filas.index)
+    else:
+        particiones = set(_particion_ventas(_leer_ventas_crudas(f_ini, f_fin)))
+    # Las líneas sin fecha no entran al resumen
+    particiones.discard(PARTICION_SIN_FECHA)
+    if f_ini and f_fin:
+        particiones &= _particiones_en_rango(f_ini, f_fin)
+    particiones = sorted(particiones)
+
+    guardados = _leer_en_paralelo([_objeto_resumen(p) for p in particiones])
+    desactualizadas = [
+        p for p, df in zip(particiones, guardados)
+        if df.empty or (filas is not None and filas.get(p, 0) != pd.to_numeric(df["Lineas"]).sum())
+    ]
+    return particiones, desactualizadas
+
+def reparar_resumen(f_ini=None, f_fin=None):
+    # Rehace y guarda los meses desactualizados; fuera de las cachés de
+    # lectura porque escribe en R2 e invalida. Un mes que no se pudo guardar
+    # se registra y leer_resumen_ventas lo sigue armando desde las ventas.
+    _, desactualizadas = _meses_resumen(f_ini, f_fin)
+    guardados = 0
+    for particion in desactualizadas:
+        try:
+            _api_put(_objeto_resumen(particion), _registros_json(_resumen_mes(particion).sort_values(CLAVES_RESUMEN)))
+            guardados += 1
+        except requests.RequestException:
+            log.exception("No se pudo guardar el resumen de %s", particion)
+    if guardados:
+        invalidar_dataset(R2_VENTAS_RESUMEN)
+    return guardados
+
+@medido(cache=st.cache_data(ttl=120))
+def leer_resumen_ventas(f_ini=None, f_fin=None):
+    # Solo lectura: los meses desactualizados se arman en memoria (guardarlos
+    # es cosa de reparar_resumen)
+    particiones, desactualizadas = _meses_resumen(f_ini, f_fin)
+    vigentes = [p for p in particiones if p not in desactualizadas]
+    partes = _leer_en_paralelo([_objeto_resumen(p) for p in vigentes])
+    partes += [_resumen_mes(p) for p in desactualizadas]
+    partes = [df for df in partes if not df.empty]
+    resumen = pd.concat(partes, ignore_index=True) if partes else _resumir_ventas(pd.DataFrame())
+
+    resumen = resumen.copy()
+    resumen["Fecha"] = pd.to_datetime(resumen["Fecha"])
+    for c in ["Producto", "Forma Pago"]:
+        resumen[c] = resumen[c].where(resumen[c] != "")
+    for c in ["Ventas", "Ganancia", "Cantidad", "Lineas"]:
+        resumen[c] = pd.to_numeric(resumen[c], errors="coerce").fillna(0)
+    if f_ini and f_fin:
+        resumen = resumen[(resumen["Fecha"].dt.date >= f_ini) & (resumen["Fecha"].dt.date <= f_fin)]
+    return resumen.reset_index(drop=True)
 
 #============================================================================================================================
 
+@medido(cache=st.cache_data(ttl=120))
 def leer_precios_desglose():
     precios = {}
     try:
         df = api_read(R2_PRECIOS)
         if df.empty: return precios
-        for _, row in df.iterrows():
-            producto = str(row.get('Producto', '')).strip()
-            if not producto: continue
-            precios[producto] = {
-                'precio_venta': clean_and_convert_float(row.get('Precio Venta')),
-                'margen': clean_and_convert_float(row.get('Margen Bruto')),
-                'margen_porc': clean_and_convert_float(row.get('Margen Bruto (%)'))
-            }
+        df = _como_filas(df)
+        productos = _columna(df, 'Producto', '').map(str).str.strip()
+        validas = productos != ""
+        columnas = zip(
+            productos[validas],
+            _columna_float(_columna(df, 'Precio Venta'))[validas].tolist(),
+            _columna_float(_columna(df, 'Margen Bruto'))[validas].tolist(),
+            _columna_float(_columna(df, 'Margen Bruto (%)'))[validas].tolist()
+        )
+        for producto, precio, margen, margen_porc in columnas:
+            precios[producto] = {'precio_venta': precio, 'margen': margen, 'margen_porc': margen_porc}
     except: pass
     return precios
 
+def _unidades_modificadores(lineas, mods):
+    # Unidades vendidas de cada modificador: cantidad del extra × cantidad de
+    # su línea, buscada por ("Id Venta", "Linea"); sin línea no cuenta
+    clave = lambda df: pd.MultiIndex.from_arrays([df["Id Venta"], df["Linea"]])
+    posicion = clave(lineas).get_indexer(clave(mods))
+    cantidad_linea = np.where(posicion >= 0, lineas["Cantidad"].to_numpy(dtype=float)[posicion], 0.0)
+    unidades = mods["Cantidad"].to_numpy(dtype=float) * cantidad_linea
+    return pd.Series(unidades, index=mods["Modificador"].astype(object), dtype=float).groupby(level=0).sum()
+
+def _consumo_ventas(unidades_productos, unidades_mods, catalogo=None):
+    # catalogo: (matriz, modificadores) de _catalogo_sin_cache; por defecto,
+    # los cargadores cacheados
+    matriz, modificadores = catalogo if catalogo is not None else (matriz_insumos(), None)
+
+    # Productos: recetas explotadas hasta ingredientes (incluye sub-recetas)
+    consumo = consumo_insumos(unidades_productos, matriz)
+
+    # Modificadores: sus ingredientes; si alguno es sub-receta también se explota
+    if not unidades_mods.empty:
+        matriz_mods = pd.DataFrame.from_dict(
+            {m: d["ingredientes"] for m, d in (leer_modificadores() if modificadores is None else modificadores).items()}, orient="index"
+        ).fillna(0)
+        if not matriz_mods.empty:
+            vector = unidades_mods.reindex(matriz_mods.index, fill_value=0)
+            por_ing = vector.to_numpy() @ matriz_mods
+            es_receta = por_ing.index.isin([] if matriz is None else matriz.index)
+            consumo = pd.concat([
+                consumo, por_ing[~es_receta], consumo_insumos(por_ing[es_receta], matriz)
+            ]).groupby(level=0).sum()
+    return consumo
+
+def _catalogo_sin_cache():
+    # Recetas y modificadores para descontar un cobro, leídos sin st.cache_data:
+    # un fallo lanza y el cobro sigue en la cola (una lectura cacheada vacía
+    # lo daría por enviado sin descontar nada)
+    return (_matriz_de(_recetas_de(_api_get_df(R2_RECETAS))),
+            _modificadores_de(_api_get_df(R2_MODIFICADORES)))
+
+def _movimientos_venta(df_nuevo, id_venta):
+    # Salida de inventario de un cobro: lo que consumen sus productos y extras.
+    # Se fecha el día de la venta a la hora de registro.
+    lineas = pd.DataFrame({
+        "Id Venta": id_venta,
+        "Linea": np.arange(len(df_nuevo)),
+        "Producto": df_nuevo["Producto"].to_numpy(),
+        "Cantidad": pd.to_numeric(df_nuevo["Cantidad"], errors="coerce").fillna(0).to_numpy(),
+    })
+    mods = _tabla_modificadores(lineas, df_nuevo["Modificadores"] if "Modificadores" in df_nuevo.columns else pd.Series(dtype=object))
+    consumo = _consumo_ventas(lineas.groupby("Producto")["Cantidad"].sum(), _unidades_modificadores(lineas, mods),
+                              _catalogo_sin_cache())
+    consumo = consumo[consumo != 0]
+
+    ahora = pd.Timestamp.now()
+    dia = _fechas_venta(df_nuevo).dropna()
+    fecha = (dia.iloc[0].normalize() if not dia.empty else ahora.normalize()) + (ahora - ahora.normalize())
+    return [{"Fecha": fecha, "Ingrediente": ing, "Cantidad": -cant, "Tipo": "venta", "Referencia": id_venta}
+            for ing, cant in consumo.items()]
+
 def calcular_reposicion_sugerida(fecha_inicio, fecha_fin):
-    ventas = leer_ventas(fecha_inicio, fecha_fin)
-    recetas = leer_recetas()
+    df = leer_ventas_df(fecha_inicio, fecha_fin)[["Id Venta", "Linea", "Producto", "Cantidad"]]
     ingredientes_base = leer_ingredientes_base()
+    if df.empty or not ingredientes_base:
+        return []
 
-    ingredientes_utilizados = {}
-
-    for venta in ventas:
-        producto = venta.get('Producto')
-        cantidad_vendida = clean_and_convert_float(venta.get('Cantidad', 0))
-
-        if producto in recetas:
-            for ing_nom, cant_receta in recetas[producto]['ingredientes'].items():
-                total_ing = cant_receta * cantidad_vendida
-                ingredientes_utilizados[ing_nom] = (
-                    ingredientes_utilizados.get(ing_nom, 0) + total_ing
-                )
-
-    resultado = []
-
-    for ing_nom, cant_necesaria in ingredientes_utilizados.items():
-        if cant_necesaria <= 0:
-            continue
+    consumo = _consumo_ventas(
+        df.groupby("Producto", observed=True)["Cantidad"].sum(),
+        _unidades_modificadores(df, leer_modificadores_ventas(fecha_inicio, fecha_fin))
+    )
 
-        info = next((i for i in ingredientes_base if i['nombre'] == ing_nom), None)
-        if not info:
-            continue
+    info = pd.DataFrame(ingredientes_base).drop_duplicates("nombre", keep="first").set_index("nombre")
+    df_rep = info.join(consumo.rename("necesaria"), how="inner")
+    df_rep = df_rep[df_rep["necesaria"] > 0]
+    if df_rep.empty:
+        return []
 
-        cant_compra = info['cantidad_compra']
-        porcentaje = (cant_necesaria / cant_compra * 100) if cant_compra > 0 else 0
-        costo_reposicion = cant_necesaria * info['costo_receta']
-
-        resultado.append({
-            'Ingrediente': ing_nom,
-            'Cantidad Necesaria': cant_necesaria,
-            'Unidad': info['unidad_receta'],
-            'Costo Compra Base': info['costo_compra'],
-            'Proveedor': info['proveedor'],
-            '% Unidad Compra': porcentaje,
-            'Costo Reposición': costo_reposicion
-        })
+    cant_compra = df_rep["cantidad_compra"]
+    resultado = pd.DataFrame({
+        'Ingrediente': df_rep.index,
+        'Cantidad Necesaria': df_rep["necesaria"].to_numpy(),
+        'Unidad': df_rep["unidad_receta"].to_numpy(),
+        'Costo Compra Base': df_rep["costo_compra"].to_numpy(),
+        'Proveedor': df_rep["proveedor"].to_numpy(),
+        '% Unidad Compra': np.where(cant_compra > 0, df_rep["necesaria"] / cant_compra.where(cant_compra > 0, 1) * 100, 0),
+        'Costo Reposición': (df_rep["necesaria"] * df_rep["costo_receta"]).to_numpy(),
+    })
+    return resultado.sort_values('Ingrediente').to_dict("records")
+
+# Cachés derivadas de cada dataset de R2 (ver invalidar_dataset)
+DEPENDENCIAS_CACHE = {
+    R2_INGREDIENTES: [leer_ingredientes_base, leer_recetas],
+    R2_RECETAS: [leer_recetas],
+    R2_MODIFICADORES: [leer_modificadores],
+    R2_PRECIOS: [leer_precios_desglose],
+    R2_INVENTARIO: [leer_inventario],
+    R2_VENTAS: [_ventas_en_rango, _meses_resumen, leer_resumen_ventas],
+    R2_VENTAS_RESUMEN: [_meses_resumen, leer_resumen_ventas],
+}
 
-    return sorted(resultado, key=lambda x: x['Ingrediente'])
+# Datasets que lee cada página (ver precargar_pagina)
+DATASETS_POR_PAGINA = {
+    "📊 Dashboard": [R2_VENTAS_RESUMEN],
+    "🛒 Ventas": [R2_RECETAS, R2_INGREDIENTES, R2_PRECIOS, R2_MODIFICADORES, R2_VENTAS],
+    "🔄 Reposición": [R2_VENTAS, R2_RECETAS, R2_INGREDIENTES],
+    "📦 Inventario": [R2_INVENTARIO, R2_INGREDIENTES],
+    "🧪 Ingredientes": [R2_INGREDIENTES],
+    "📝 Recetas": [R2_RECETAS, R2_INGREDIENTES, R2_MODIFICADORES],
+    "🧩 Modificadores": [R2_MODIFICADORES, R2_INGREDIENTES],
+    "💰 Precios": [R2_RECETAS, R2_INGREDIENTES, R2_PRECIOS],
+}
 
-#============================================================================================================================
-# --- PESTAÑAS Y VISTAS ---
-#============================================================================================================================
-def mostrar_dashboard(f_inicio, f_fin):
-    st.markdown('<div class="section-header">📊 Dashboard General</div>', unsafe_allow_html=True)
-    
-    ventas = leer_ventas(f_inicio, f_fin)
-    if not ventas:
-        st.warning("No hay datos para el rango seleccionado.")
-        return
+def precargar_pagina(opcion, f_inicio, f_fin):
+    # Carga en frío = la petición más lenta y no la suma de todas:
+    # 1) se descargan en paralelo los objetos crudos (de ventas, el manifiesto);
+    # 2) se ejecutan en paralelo los cargadores, que ya encuentran su api_read
+    #    en caché (leer_ventas_df además baja sus particiones en paralelo).
+    # Streamlit serializa por clave los cálculos simultáneos de una misma caché.
+    datasets = DATASETS_POR_PAGINA.get(opcion, [])
+    objetos = {R2_VENTAS: [R2_VENTAS_MANIFIESTO], R2_VENTAS_RESUMEN: [R2_VENTAS_MANIFIESTO]}
+    _leer_en_paralelo(list(dict.fromkeys(o for d in datasets for o in objetos.get(d, [d]))))
+
+    cargadores = {
+        R2_INGREDIENTES: leer_ingredientes_base,
+        R2_RECETAS: leer_recetas,
+        R2_MODIFICADORES: leer_modificadores,
+        R2_PRECIOS: leer_precios_desglose,
+        R2_INVENTARIO: leer_inventario,
+        R2_VENTAS: lambda: leer_ventas_df(f_inicio, f_fin),
+        R2_VENTAS_RESUMEN: lambda: leer_resumen_ventas(f_inicio, f_fin),
+    }
+    _ejecutar_en_paralelo([cargadores[d] for d in datasets])
 
-    df_filtered = pd.DataFrame(ventas)
-    
-    # --- KPIs ---
-    total_ventas = df_filtered['Total Venta Neta'].sum()
-    total_ganancia = df_filtered['Ganancia Neta'].sum()
-    total_transacciones = len(df_filtered)
-    
-    # METRICO NUEVO: TICKET PROMEDIO
-    ticket_promedio = total_ventas / total_transacciones if total_transacciones > 0 else 0
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Ventas Totales", f"${total_ventas:,.2f}")
-    c2.metric("Ganancia Neta", f"${total_ganancia:,.2f}")
-    c3.metric("Ticket Promedio", f"${ticket_promedio:,.2f}")
-    c4.metric("Transacciones", f"{total_transacciones}")
-    
-    st.markdown("---")
-    
-    # --- GRÁFICO 1: TENDENCIA DIARIA CON CONTROL SEMANAL ---
-    st.subheader("Tendencia de Ventas (Diario)")
-    
-    # ===============================
-    # Resumen diario
-    # ===============================
+# --- AGREGADOS DEL DASHBOARD ---
+# Funciones puras sobre leer_resumen_ventas (sin UI), medibles fuera de la app
+def _resumen_diario(resumen):
     daily_summary = (
-        df_filtered
-            .groupby(df_filtered['Fecha_DT'].dt.date)
+        resumen
+            .groupby('Fecha')
             .agg(
-                Ventas=('Total Venta Neta', 'sum'),
-                Ganancia=('Ganancia Neta', 'sum')
+                Ventas=('Ventas', 'sum'),
+                Ganancia=('Ganancia', 'sum'),
+                Cantidad=('Cantidad', 'sum')
             )
             .reset_index()
-            .rename(columns={'Fecha_DT': 'Fecha'})
     )
     
-    daily_summary['Fecha'] = pd.to_datetime(daily_summary['Fecha'])
-    
-    # ===============================
     # Definición explícita de semana (LUNES → DOMINGO)
-    # ===============================
     daily_summary['Inicio_Semana'] = daily_summary['Fecha'] - pd.to_timedelta(
         daily_summary['Fecha'].dt.weekday, unit='D'
     )
     daily_summary['Fin_Semana'] = daily_summary['Inicio_Semana'] + pd.Timedelta(days=6)
-    
-    # ===============================
-    # Medias semanales
-    # ===============================
-    weekly_means = (
-        daily_summary
-            .groupby('Inicio_Semana')
-            .agg(
-                mean_ventas=('Ventas', 'mean'),
-                mean_ganancia=('Ganancia', 'mean')
-            )
-            .reset_index()
-    )
-    
-    weekly_means['Fin_Semana'] = weekly_means['Inicio_Semana'] + pd.Timedelta(days=7)
-    
-    # ===============================
-    # Gráfico base
-    # ===============================
-    fig_daily = px.line(
-        daily_summary,
-        x='Fecha',
-        y=['Ventas', 'Ganancia'],
-        markers=True,
-        color_discrete_sequence=['#4B2840', '#F1B48B'],
-        template='plotly_white'
-    )
-    
-    # ===============================
-    # Líneas de media semanal (PUNTEADAS)
-    # ===============================
-    for _, row in weekly_means.iterrows():
-    
-        # Media semanal Ventas
-        fig_daily.add_trace(
-            go.Scatter(
-                x=[row['Inicio_Semana'], row['Fin_Semana']],
-                y=[row['mean_ventas'], row['mean_ventas']],
-                mode="lines",
-                line=dict(
-                    color="#1f77b4",
-                    width=1,
-                    dash="dot"   # <<< punteado
-                ),
-                showlegend=False,
-                hoverinfo="skip"
-            )
-        )
-    
-        # Media semanal Ganancia
-        fig_daily.add_trace(
-            go.Scatter(
-                x=[row['Inicio_Semana'], row['Fin_Semana']],
-                y=[row['mean_ganancia'], row['mean_ganancia']],
-                mode="lines",
-                line=dict(
-                    color="#2ca02c",
-                    width=1,
-                    dash="dot"   # <<< punteado
-                ),
-                showlegend=False,
-                hoverinfo="skip"
-            )
-        )
-    
-    # ===============================
-    # Líneas verticales (lunes)
-    # ===============================
-    mondays = weekly_means['Inicio_Semana']
-    
-    for monday in mondays:
-        fig_daily.add_vline(
-            x=monday,
-            line_width=1,
-            line_dash="dot",
-            line_color="gray",
-            opacity=0.5
-        )
-    
-    fig_daily.update_layout(
-        legend_title_text="Indicadores",
-        hovermode="x unified"
-    )
-    
-    st.plotly_chart(fig_daily, use_container_width=True)
+    return daily_summary
 
-    # 3. Análisis de Productos
-    st.subheader("Desempeño de Productos")
-    col_g1, col_g2 = st.columns(2)
-    
-    product_summary = df_filtered.groupby('Producto').agg(
-        Total_Venta=('Total Venta Neta', 'sum'),
-        Total_Ganancia=('Ganancia Neta', 'sum'),
+def _resumen_productos(resumen):
+    return resumen.groupby('Producto').agg(
+        Total_Venta=('Ventas', 'sum'),
+        Total_Ganancia=('Ganancia', 'sum'),
         Cantidad=('Cantidad', 'sum')
     ).reset_index()
-    
-    st.subheader("Top 10 Productos por Volumen")
-
-    top_cant = product_summary.sort_values('Cantidad', ascending=False).head(10)
-    fig_prod = px.bar(
-        top_cant,
-        x='Cantidad',
-        y='Producto',
-        orientation='h',
-        text_auto=True,
-        template='plotly_white',
-        color='Cantidad',
-        color_continuous_scale='Purples'
-    )
-    fig_prod.update_layout(yaxis={'categoryorder': 'total ascending'})
-    st.plotly_chart(fig_prod, use_container_width=True)
-    
-    st.subheader("Top 10 Productos por Ganancia")
-    
-    top_gan = product_summary.sort_values('Total_Ganancia', ascending=False).head(10)
-    fig_gan = px.bar(
-        top_gan,
-        x='Total_Ganancia',
-        y='Producto',
-        orientation='h',
-        text_auto='.2s',
-        template='plotly_white',
-        color='Total_Ganancia',
-        color_continuous_scale='Peach'
-    )
-    fig_gan.update_layout(yaxis={'categoryorder': 'total ascending'})
-    st.plotly_chart(fig_gan, use_container_width=True)
-
 
-    # --- GRÁFICO 2: PATRONES SEMANALES (SUPERPOSICIÓN) ---
-    st.subheader("🔎 Patrones Semanales")
-    st.caption(
-        "Compara el comportamiento diario entre semanas completas para detectar patrones repetitivos."
-    )
-    
-    df_patron = df_filtered.copy()
-     
-    df_patron['Inicio_Semana'] = df_patron['Fecha_DT'].apply(
-        lambda x: x - datetime.timedelta(days=x.weekday())
+def _patrones_semanales(daily_summary):
+    # (venta promedio por día de la semana, ventas semana × día de las
+    # últimas SEMANAS_MAX_PATRON semanas)
+    # Un registro por día: el resumen diario ya viene agregado
+    df_patron = daily_summary[['Fecha', 'Inicio_Semana', 'Ventas']].rename(
+        columns={'Fecha': 'Fecha_DT', 'Ventas': 'Total Venta Neta'}
     )
     # Día de la semana en español
     df_patron['Dia_Nombre'] = (
@@ -837,129 +2192,290 @@ def mostrar_dashboard(f_inicio, f_fin):
         .dt.day_name()
         .map(DIAS_ESP)
     )
-    
+
     # 1️⃣ AGRUPAR POR DÍA REAL (NO POR REGISTRO)
     ventas_diarias = (
         df_patron
         .groupby(['Fecha_DT', 'Dia_Nombre'], as_index=False)
         .agg({'Total Venta Neta': 'sum'})
     )
-    
+
     # 2️⃣ QUITAR DÍAS SIN VENTA REAL
     ventas_diarias = ventas_diarias[
         ventas_diarias['Total Venta Neta'] > 0
     ]
-    
+
     # 3️⃣ PROMEDIAR POR DÍA DE LA SEMANA
     patron_promedio = (
         ventas_diarias
         .groupby('Dia_Nombre', as_index=False)['Total Venta Neta']
         .mean()
     )
-      
+
     # Forzar orden Lunes → Domingo
     patron_promedio['Dia_Nombre'] = pd.Categorical(
         patron_promedio['Dia_Nombre'],
         categories=ORDEN_DIAS,
         ordered=True
     )
-    
+
     patron_promedio = patron_promedio.sort_values('Dia_Nombre')
 
-    
     # Etiqueta corta para leyenda
     df_patron['Semana_Label'] = df_patron['Inicio_Semana'].dt.strftime('%d/%m')
-    
+
+    # Sólo las últimas semanas: cada semana es una traza del gráfico
+    ultimas_semanas = df_patron['Inicio_Semana'].drop_duplicates().nlargest(SEMANAS_MAX_PATRON)
+
     # Agrupación
     patron_agrupado = (
-        df_patron
+        df_patron[df_patron['Inicio_Semana'].isin(ultimas_semanas)]
         .groupby(['Semana_Label', 'Dia_Nombre'], as_index=False)
         ['Total Venta Neta']
         .sum()
     )
-    
-    fig_patron = px.line(
-        patron_agrupado,
-        x='Dia_Nombre',
-        y='Total Venta Neta',
-        color='Semana_Label',
-        category_orders={'Dia_Nombre': ORDEN_DIAS},
+    return patron_promedio, patron_agrupado
+
+def _resumen_semanal(daily_summary):
+    # Agrupar forzando inicio en Lunes
+    weekly = daily_summary.groupby('Inicio_Semana').agg({
+        'Ventas': 'sum',
+        'Ganancia': 'sum',
+        'Cantidad': 'sum'
+    }).reset_index().rename(columns={
+        'Inicio_Semana': 'Semana_Inicio', 'Ventas': 'Total Venta Neta', 'Ganancia': 'Ganancia Neta'
+    }).sort_values('Semana_Inicio', ascending=False)
+
+    # Formatear columna fecha para visualización "Lun DD/MM - Dom DD/MM"
+    weekly['Periodo'] = weekly['Semana_Inicio'].apply(
+        lambda x: f"Lun {x.strftime('%d/%m')} - Dom {(x + datetime.timedelta(days=6)).strftime('%d/%m')}"
+    )
+    return weekly
+
+# --- GRÁFICAS ---
+def _resolucion_tendencia(fechas):
+    dias = (fechas.max() - fechas.min()).days + 1
+    if dias <= DIAS_MAX_TENDENCIA_DIARIA:
+        return "D"
+    return "W" if dias <= DIAS_MAX_TENDENCIA_SEMANAL else "M"
+
+def _segmentos(inicios, fines, valores):
+    # Segmentos horizontales en una sola traza: el None entre uno y otro corta la línea
+    x = np.empty(3 * len(valores), dtype=object)
+    y = np.empty(3 * len(valores), dtype=object)
+    x[0::3], x[1::3] = list(inicios), list(fines)
+    y[0::3] = y[1::3] = list(valores)
+    return x, y
+
+def _figura_tendencia(daily_summary, resolucion):
+    if resolucion == "D":
+        serie = daily_summary
+    else:
+        # Semanas de lunes a domingo (W-SUN) o meses naturales, sumados
+        periodo = daily_summary['Fecha'].dt.to_period('W-SUN' if resolucion == "W" else 'M').dt.start_time
+        serie = daily_summary.groupby(periodo)[['Ventas', 'Ganancia']].sum().reset_index()
+
+    fig = px.line(
+        serie,
+        x='Fecha',
+        y=['Ventas', 'Ganancia'],
         markers=True,
-        template='plotly_white',
-        labels={
-            'Total Venta Neta': 'Ventas ($)',
-            'Dia_Nombre': 'Día de la semana',
-            'Semana_Label': 'Semana'
-        },
-        title="Comparativa Semanal Día a Día"
+        color_discrete_sequence=['#4B2840', '#F1B48B'],
+        template='plotly_white'
     )
-    
-    fig_patron.update_layout(
-        legend_title_text="Semana (Lun)",
+    fig.update_layout(
+        legend_title_text="Indicadores",
         hovermode="x unified"
     )
-    
-    st.plotly_chart(fig_patron, use_container_width=True)
-
-
-    st.subheader("📊 Venta Promedio por Día ")
-    fig_prom = px.bar(
-        patron_promedio,
-        x='Dia_Nombre',
-        y='Total Venta Neta',
-        text_auto='.2s',
-        template='plotly_white',
-        labels={
-            'Dia_Nombre': 'Día de la semana',
-            'Total Venta Neta': 'Venta Promedio ($)'
-        },
-        color='Total Venta Neta',
-        color_continuous_scale='bluyl'
+    if resolucion != "D":
+        return fig
+
+    # Media semanal (punteada): una traza por serie, no dos por semana
+    medias = daily_summary.groupby('Inicio_Semana')[['Ventas', 'Ganancia']].mean().reset_index()
+    fin = medias['Inicio_Semana'] + pd.Timedelta(days=7)
+    for col, color in [('Ventas', "#1f77b4"), ('Ganancia', "#2ca02c")]:
+        x, y = _segmentos(medias['Inicio_Semana'], fin, medias[col])
+        fig.add_trace(go.Scatter(
+            x=x, y=y, mode="lines",
+            line=dict(color=color, width=1, dash="dot"),
+            showlegend=False, hoverinfo="skip"
+        ))
+
+    # Lunes como rejilla del eje (sin una shape por semana)
+    fig.update_xaxes(
+        tick0=medias['Inicio_Semana'].min(), dtick=7 * 24 * 60 * 60 * 1000,
+        showgrid=True, griddash="dot", gridcolor="rgba(128, 128, 128, 0.5)"
     )
+    return fig
 
-    st.plotly_chart(fig_prom, use_container_width=True)
+#============================================================================================================================
+# --- PESTAÑAS Y VISTAS ---
+#============================================================================================================================
+@medido(tipo="página")
+def mostrar_dashboard(f_inicio, f_fin):
+    st.markdown('<div class="section-header">📊 Dashboard General</div>', unsafe_allow_html=True)
+    
+    # Día × producto × forma de pago (ver leer_resumen_ventas), no líneas de venta
+    reparar_resumen(f_inicio, f_fin)
+    resumen = leer_resumen_ventas(f_inicio, f_fin)
+    if resumen.empty:
+        st.warning("No hay datos para el rango seleccionado.")
+        return
+    
+    # --- KPIs ---
+    total_ventas = resumen['Ventas'].sum()
+    total_ganancia = resumen['Ganancia'].sum()
+    total_transacciones = int(resumen['Lineas'].sum())
+    
+    # METRICO NUEVO: TICKET PROMEDIO
+    ticket_promedio = total_ventas / total_transacciones if total_transacciones > 0 else 0
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Ventas Totales", f"${total_ventas:,.2f}")
+    c2.metric("Ganancia Neta", f"${total_ganancia:,.2f}")
+    c3.metric("Ticket Promedio", f"${ticket_promedio:,.2f}")
+    c4.metric("Transacciones", f"{total_transacciones}")
+    
+    st.markdown("---")
+    
+    daily_summary = _resumen_diario(resumen)
+    
+    # --- GRÁFICO 1: TENDENCIA (DIARIA CON CONTROL SEMANAL, O SEMANAL/MENSUAL) ---
+    resolucion = _resolucion_tendencia(daily_summary['Fecha'])
+    st.subheader(f"Tendencia de Ventas ({NOMBRES_RESOLUCION[resolucion]})")
+    st.plotly_chart(_figura_tendencia(daily_summary, resolucion), use_container_width=True)
+
+    # Secciones bajo el pliegue en pestañas: con on_change="rerun" sólo se
+    # construye (y se envía al navegador) la pestaña abierta
+    tab_prod, tab_patron, tab_semanal = st.tabs(
+        ["📦 Productos", "🔎 Patrones Semanales", "🗓️ Resumen Semanal"],
+        key="dashboard_seccion", on_change="rerun"
+    )
 
+    with tab_prod:
+        if tab_prod.open:
+            # 3. Análisis de Productos
+            st.subheader("Desempeño de Productos")
+            col_g1, col_g2 = st.columns(2)
+    
+            product_summary = _resumen_productos(resumen)
+    
+            st.subheader("Top 10 Productos por Volumen")
+
+            top_cant = product_summary.sort_values('Cantidad', ascending=False).head(10)
+            fig_prod = px.bar(
+                top_cant,
+                x='Cantidad',
+                y='Producto',
+                orientation='h',
+                text_auto=True,
+                template='plotly_white',
+                color='Cantidad',
+                color_continuous_scale='Purples'
+            )
+            fig_prod.update_layout(yaxis={'categoryorder': 'total ascending'})
+            st.plotly_chart(fig_prod, use_container_width=True)
+    
+            st.subheader("Top 10 Productos por Ganancia")
+    
+            top_gan = product_summary.sort_values('Total_Ganancia', ascending=False).head(10)
+            fig_gan = px.bar(
+                top_gan,
+                x='Total_Ganancia',
+                y='Producto',
+                orientation='h',
+                text_auto='.2s',
+                template='plotly_white',
+                color='Total_Ganancia',
+                color_continuous_scale='Peach'
+            )
+            fig_gan.update_layout(yaxis={'categoryorder': 'total ascending'})
+            st.plotly_chart(fig_gan, use_container_width=True)
+
+    with tab_patron:
+        if tab_patron.open:
+            # --- GRÁFICO 2: PATRONES SEMANALES (SUPERPOSICIÓN) ---
+            st.subheader("🔎 Patrones Semanales")
+            st.caption(
+                "Compara el comportamiento diario entre semanas completas para detectar patrones repetitivos."
+            )
     
-    if not patron_promedio.empty:
-        mejor = patron_promedio.loc[
-            patron_promedio['Total Venta Neta'].idxmax()
-        ]
-        peor = patron_promedio.loc[
-            patron_promedio['Total Venta Neta'].idxmin()
-        ]
+            patron_promedio, patron_agrupado = _patrones_semanales(daily_summary)
+    
+            fig_patron = px.line(
+                patron_agrupado,
+                x='Dia_Nombre',
+                y='Total Venta Neta',
+                color='Semana_Label',
+                category_orders={'Dia_Nombre': ORDEN_DIAS},
+                markers=True,
+                template='plotly_white',
+                labels={
+                    'Total Venta Neta': 'Ventas ($)',
+                    'Dia_Nombre': 'Día de la semana',
+                    'Semana_Label': 'Semana'
+                },
+                title="Comparativa Semanal Día a Día"
+            )
     
-        st.success(
-            f"🔥 Mejor día promedio: **{mejor['Dia_Nombre']}** "
-            f"(${mejor['Total Venta Neta']:,.0f})\n\n"
-            f"🧊 Día más bajo (con ventas): **{peor['Dia_Nombre']}** "
-            f"(${peor['Total Venta Neta']:,.0f})"
-        )
+            fig_patron.update_layout(
+                legend_title_text="Semana (Lun)",
+                hovermode="x unified"
+            )
+    
+            st.plotly_chart(fig_patron, use_container_width=True)
+            if daily_summary['Inicio_Semana'].nunique() > SEMANAS_MAX_PATRON:
+                st.caption(f"Se muestran las últimas {SEMANAS_MAX_PATRON} semanas del rango.")
+
+
+            st.subheader("📊 Venta Promedio por Día ")
+            fig_prom = px.bar(
+                patron_promedio,
+                x='Dia_Nombre',
+                y='Total Venta Neta',
+                text_auto='.2s',
+                template='plotly_white',
+                labels={
+                    'Dia_Nombre': 'Día de la semana',
+                    'Total Venta Neta': 'Venta Promedio ($)'
+                },
+                color='Total Venta Neta',
+                color_continuous_scale='bluyl'
+            )
+
+            st.plotly_chart(fig_prom, use_container_width=True)
 
-    # --- TABLA: RESUMEN SEMANAL (LUNES A DOMINGO) ---
-    st.subheader("Resumen Semanal (Lunes - Domingo)")
     
-    # Agrupar forzando inicio en Lunes
-    df_filtered['Semana_Inicio'] = df_filtered['Fecha_DT'].apply(lambda x: x - datetime.timedelta(days=x.weekday()))
+            if not patron_promedio.empty:
+                mejor = patron_promedio.loc[
+                    patron_promedio['Total Venta Neta'].idxmax()
+                ]
+                peor = patron_promedio.loc[
+                    patron_promedio['Total Venta Neta'].idxmin()
+                ]
     
-    weekly = df_filtered.groupby('Semana_Inicio').agg({
-        'Total Venta Neta': 'sum',
-        'Ganancia Neta': 'sum',
-        'Cantidad': 'sum'
-    }).reset_index().sort_values('Semana_Inicio', ascending=False)
+                st.success(
+                    f"🔥 Mejor día promedio: **{mejor['Dia_Nombre']}** "
+                    f"(${mejor['Total Venta Neta']:,.0f})\n\n"
+                    f"🧊 Día más bajo (con ventas): **{peor['Dia_Nombre']}** "
+                    f"(${peor['Total Venta Neta']:,.0f})"
+                )
+
+    with tab_semanal:
+        if tab_semanal.open:
+            # --- TABLA: RESUMEN SEMANAL (LUNES A DOMINGO) ---
+            st.subheader("Resumen Semanal (Lunes - Domingo)")
     
-    # Formatear columna fecha para visualización "Lun DD/MM - Dom DD/MM"
-    weekly['Periodo'] = weekly['Semana_Inicio'].apply(
-        lambda x: f"Lun {x.strftime('%d/%m')} - Dom {(x + datetime.timedelta(days=6)).strftime('%d/%m')}"
-    )
+            weekly = _resumen_semanal(daily_summary)
     
-    st.dataframe(
-        weekly[['Periodo', 'Total Venta Neta', 'Ganancia Neta', 'Cantidad']].style.format({
-            'Total Venta Neta': '${:,.2f}', 
-            'Ganancia Neta': '${:,.2f}'
-        }), 
-        use_container_width=True, hide_index=True
-    )
+            st.dataframe(
+                weekly[['Periodo', 'Total Venta Neta', 'Ganancia Neta', 'Cantidad']].style.format({
+                    'Total Venta Neta': '${:,.2f}', 
+                    'Ganancia Neta': '${:,.2f}'
+                }), 
+                use_container_width=True, hide_index=True
+            )
 
+@medido(tipo="página")
 def mostrar_ingredientes():
     st.markdown('<div class="section-header">🧪 Gestión de Ingredientes</div>', unsafe_allow_html=True)
     ingredientes = leer_ingredientes_base()
@@ -1002,6 +2518,7 @@ def mostrar_ingredientes():
         st.dataframe(df[['nombre', 'proveedor', 'unidad_compra', 'Costo Compra', 'cantidad_compra', 'unidad_receta', 'Costo Receta']], use_container_width=True, hide_index=True)
 
 
+@medido(tipo="página")
 def mostrar_recetas():
     st.markdown('<div class="section-header">📝 Recetas y Configuración</div>', unsafe_allow_html=True)
     st.info("💡 Ahora puedes asignar qué modificadores son válidos para cada receta.")
@@ -1009,6 +2526,8 @@ def mostrar_recetas():
     recetas = leer_recetas()
     ingredientes = leer_ingredientes_base()
     modificadores = leer_modificadores()
+    for ciclo in ciclos_recetas():
+        st.warning(f"⚠️ Receta circular: {' → '.join(reversed(ciclo))}. La sub-receta que cierra el ciclo se costea en $0.")
     
     lista_opciones = [i['nombre'] for i in ingredientes] + list(recetas.keys())
     lista_opciones = sorted(list(set(lista_opciones)))
@@ -1081,6 +2600,7 @@ def mostrar_recetas():
                 st.success(f"Receta '{sel_receta}' eliminada.")
                 st.rerun()
 
+@medido(tipo="página")
 def mostrar_modificadores():
     st.markdown('<div class="section-header">🧩 Modificadores (Extras)</div>', unsafe_allow_html=True)
     st.caption("Define extras, su precio de venta y su costo real.")
@@ -1141,6 +2661,7 @@ def mostrar_modificadores():
             if c3.button("Añadir"):
                 curr["ingredientes"][add_ing] = add_cant; guardar_modificadores(mods); st.rerun()
 
+@medido(tipo="página")
 def mostrar_precios():
     st.markdown('<div class="section-header">💰 Análisis de Precios</div>', unsafe_allow_html=True)
     recetas = leer_recetas()
@@ -1168,35 +2689,77 @@ def mostrar_precios():
             st.write(f"Costo actual: ${row['Costo Producción']:.2f}")
             nuevo_precio = st.number_input("Nuevo Precio Venta:", value=float(row['Precio Venta']))
             if st.button("Actualizar Precio"):
-                todos_precios = api_read(R2_PRECIOS).to_dict("records")
-                found = False
                 margen_nuevo = nuevo_precio - row['Costo Producción']
                 margen_p_nuevo = (margen_nuevo / nuevo_precio * 100) if nuevo_precio else 0
-                for item in todos_precios:
-                    if item['Producto'] == prod_sel:
-                        item['Precio Venta'] = nuevo_precio; item['Margen Bruto'] = margen_nuevo; item['Margen Bruto (%)'] = margen_p_nuevo; found = True; break
-                if not found: todos_precios.append({'Producto': prod_sel, 'Precio Venta': nuevo_precio, 'Margen Bruto': margen_nuevo, 'Margen Bruto (%)': margen_p_nuevo})
-                api_write(R2_PRECIOS, todos_precios); st.success("Actualizado."); st.rerun()
+
+                # Sobre la versión vigente: no pisa el precio que otro terminal cambió
+                def aplicar_precio(todos_precios):
+                    found = False
+                    for item in todos_precios:
+                        if item['Producto'] == prod_sel:
+                            item['Precio Venta'] = nuevo_precio; item['Margen Bruto'] = margen_nuevo; item['Margen Bruto (%)'] = margen_p_nuevo; found = True; break
+                    if not found: todos_precios.append({'Producto': prod_sel, 'Precio Venta': nuevo_precio, 'Margen Bruto': margen_nuevo, 'Margen Bruto (%)': margen_p_nuevo})
+                    return todos_precios
+                api_write(R2_PRECIOS, aplicar_precio); st.success("Actualizado."); st.rerun()
 
     st.dataframe(df.style.format({'Costo Producción': "${:.2f}", 'Precio Venta': "${:.2f}", 'Margen $': "${:.2f}", 'Margen %': "{:.1f}%"}), use_container_width=True)
 
-def mostrar_ventas(f_inicio, f_fin):
-    st.markdown('<div class="section-header">🛒 Terminal de Ventas (POS)</div>', unsafe_allow_html=True)
-    es_admin = st.session_state.get("rol") == "admin"
-    
-    if 'carrito' not in st.session_state: st.session_state.carrito = []
-    # --- Fecha de venta (solo admin) ---
-    if es_admin:
-        fecha_venta = st.date_input(
-            "📅 Fecha de la venta",
-            value=pd.Timestamp.today().date(),
-            help="Permite registrar ventas en una fecha distinta a hoy"
-        )
-    else:
-        fecha_venta = pd.Timestamp.today().date()
-    # =========================================================
-    # 1. SECCIÓN SUPERIOR: NUEVA ORDEN (POS)
-    # =========================================================
+# --- POS: NUEVA ORDEN Y CARRITO ---
+# Fragmento: los clics de ➕/➖, cantidades y quitar del carrito vuelven a
+# ejecutar solo esta sección, no el script completo (auth, barra lateral,
+# historial y gráficas). Los botones cambian el estado en on_click, antes de
+# que corra el fragmento, así que no hace falta un st.rerun() adicional.
+# Cada línea del carrito lleva un "Id": los callbacks la buscan por él y no
+# por posición, que cambia al quitar otra línea.
+def _cambiar_extra(mod_key, delta):
+    st.session_state[mod_key] = max(0, st.session_state.get(mod_key, 0) + delta)
+
+def _cambiar_cantidad_carrito(id_item, delta):
+    for item in st.session_state.carrito:
+        if item['Id'] == id_item:
+            item['Cantidad'] = max(1, item['Cantidad'] + delta)
+
+def _quitar_del_carrito(id_item):
+    st.session_state.carrito = [item for item in st.session_state.carrito if item['Id'] != id_item]
+
+def _agregar_al_carrito(prod_sel, p_base, nombres_mods_validos, fecha_venta):
+    modificadores = leer_modificadores()
+    lista_mods_final = []
+    costo_extra_total = 0
+    for m_name in nombres_mods_validos:
+        qty = st.session_state.get(f"qty_mod_{m_name}", 0)
+        if qty > 0:
+            p_m = modificadores[m_name]["precio_extra"]
+            costo_m = calcular_costo_modificador(
+                m_name,
+                modificadores,
+                leer_ingredientes_base()
+            )
+            costo_extra_total += p_m * qty
+            lista_mods_final.append({
+                "nombre": m_name,
+                "precio": p_m,
+                "cantidad": qty,
+                "costo": costo_m
+            })
+
+    st.session_state.carrito.append({
+        'Id': uuid.uuid4().hex,
+        'Producto': prod_sel,
+        'Cantidad': st.session_state.pos_cantidad,
+        'Precio Base': p_base,
+        'Modificadores': lista_mods_final,
+        'Precio Unitario Final': p_base + costo_extra_total,
+        'Descuento %': st.session_state.pos_descuento,
+        'Es Tarjeta': st.session_state.pos_tarjeta,
+        'Fecha': pd.to_datetime(fecha_venta)
+    })
+
+    for m_name in nombres_mods_validos: st.session_state[f"qty_mod_{m_name}"] = 0
+
+@st.fragment
+@medido(tipo="fragmento")
+def _pos_orden(fecha_venta):
     st.subheader("➕ Nueva Orden")
     
     recetas = leer_recetas()
@@ -1222,83 +2785,38 @@ def mostrar_ventas(f_inicio, f_fin):
                     mod_key = f"qty_mod_{m_name}"
                     if mod_key not in st.session_state: st.session_state[mod_key] = 0
                     
-                    if c_m2.button("➖", key=f"min_{m_name}"):
-                        if st.session_state[mod_key] > 0: 
-                            st.session_state[mod_key] -= 1
-                            st.rerun()
+                    c_m2.button("➖", key=f"min_{m_name}", on_click=_cambiar_extra, args=(mod_key, -1))
                     c_m3.write(f"**{st.session_state[mod_key]}**")
-                    if c_m4.button("➕", key=f"plus_{m_name}"):
-                        st.session_state[mod_key] += 1
-                        st.rerun()
+                    c_m4.button("➕", key=f"plus_{m_name}", on_click=_cambiar_extra, args=(mod_key, 1))
 
         # Cantidad y Botón de agregar
         st.markdown("---")
         cc1, cc2 = st.columns(2)
-        cant_principal = cc1.number_input("Cantidad de productos", min_value=1, value=1, step=1)
-        desc_porc = cc2.number_input("Descuento %", min_value=0.0, max_value=100.0, step=5.0)
-        pago_tarjeta = st.checkbox("💳 Pago con Tarjeta")
-
-        if st.button("🛒 Agregar al Carrito", type="primary", use_container_width=True):
-            # ... (Lógica de compilación de modificadores idéntica a la anterior)
-            lista_mods_final = []
-            costo_extra_total = 0
-            for m_name in nombres_mods_validos:
-                qty = st.session_state.get(f"qty_mod_{m_name}", 0)
-                if qty > 0:
-                    p_m = modificadores[m_name]["precio_extra"]
-                    costo_m = calcular_costo_modificador(
-                        m_name,
-                        modificadores,
-                        leer_ingredientes_base()
-                    )
-                    costo_extra_total += p_m * qty
-                    lista_mods_final.append({
-                        "nombre": m_name,
-                        "precio": p_m,
-                        "cantidad": qty,
-                        "costo": costo_m
-                    })
-            
-            st.session_state.carrito.append({
-                'Producto': prod_sel,
-                'Cantidad': cant_principal,
-                'Precio Base': p_base,
-                'Modificadores': lista_mods_final,
-                'Precio Unitario Final': p_base + costo_extra_total,
-                'Descuento %': desc_porc,
-                'Es Tarjeta': pago_tarjeta,
-                'Fecha': pd.to_datetime(fecha_venta)
-            })
+        cc1.number_input("Cantidad de productos", min_value=1, value=1, step=1, key="pos_cantidad")
+        cc2.number_input("Descuento %", min_value=0.0, max_value=100.0, step=5.0, key="pos_descuento")
+        st.checkbox("💳 Pago con Tarjeta", key="pos_tarjeta")
 
-            for m_name in nombres_mods_validos: st.session_state[f"qty_mod_{m_name}"] = 0
-            st.rerun()
+        st.button("🛒 Agregar al Carrito", type="primary", use_container_width=True,
+                  on_click=_agregar_al_carrito, args=(prod_sel, p_base, nombres_mods_validos, fecha_venta))
 
     # --- VISTA DEL CARRITO Y COBRO ---
     if st.session_state.carrito:
         st.markdown("---")
         st.subheader("📝 Carrito de Compra")
         total_carrito = 0
-        for i, item in enumerate(st.session_state.carrito):
+        for item in st.session_state.carrito:
             subtotal = (item['Precio Unitario Final'] * item['Cantidad']) * (1 - item['Descuento %']/100)
             total_carrito += subtotal
             with st.expander(f"{item['Producto']} (x{item['Cantidad']}) - ${subtotal:.2f}"):
                 c1, c2, c3, c4 = st.columns([1,1,1,2])
-                if c1.button("➖", key=f"c_min_{i}"):
-                    if item['Cantidad'] > 1: st.session_state.carrito[i]['Cantidad'] -= 1; st.rerun()
+                c1.button("➖", key=f"c_min_{item['Id']}", on_click=_cambiar_cantidad_carrito, args=(item['Id'], -1))
                 c2.write(f"**{item['Cantidad']}**")
-                if c3.button("➕", key=f"c_plus_{i}"):
-                    st.session_state.carrito[i]['Cantidad'] += 1; st.rerun()
-                if c4.button("🗑️ Quitar", key=f"c_del_{i}"):
-                    st.session_state.carrito.pop(i); st.rerun()
+                c3.button("➕", key=f"c_plus_{item['Id']}", on_click=_cambiar_cantidad_carrito, args=(item['Id'], 1))
+                c4.button("🗑️ Quitar", key=f"c_del_{item['Id']}", on_click=_quitar_del_carrito, args=(item['Id'],))
         
         st.metric("Total a Cobrar", f"${total_carrito:.2f}")
         if st.button("✅ FINALIZAR Y REGISTRAR VENTA", type="primary", use_container_width=True):
-
-            recetas = leer_recetas()
-            precios = leer_precios_desglose()
-            desglose_precios = leer_precios_desglose()
-            modificadores = leer_modificadores()
-
+            # recetas ya se leyó arriba en esta misma ejecución del fragmento
             ventas_detalladas = []
             fecha_guardado = pd.to_datetime(fecha_venta).strftime("%d/%m/%Y")
             
@@ -1361,14 +2879,39 @@ def mostrar_ventas(f_inicio, f_fin):
                     "Total Venta Neta": total_neto
                 })
             
-            ok = guardar_ventas(ventas_detalladas, fecha_venta)
-            
-            if ok:
+            # Se confirma en la cola local; el envío a R2 sigue en segundo plano
+            try:
+                encolar_venta(ventas_detalladas, fecha_venta)
+            except sqlite3.Error as e:
+                st.error(f"No se pudo guardar la venta ❌ ({e})")
+            else:
                 st.success("Venta registrada correctamente ✅")
                 st.session_state.carrito = []
-                st.rerun()
-            else:
-                st.error("No se pudo guardar la venta ❌")
+                st.rerun()  # completo: historial y ventas pendientes
+
+@medido(tipo="página")
+def mostrar_ventas(f_inicio, f_fin):
+    st.markdown('<div class="section-header">🛒 Terminal de Ventas (POS)</div>', unsafe_allow_html=True)
+    es_admin = st.session_state.get("rol") == "admin"
+    
+    pendientes, error_envio = ventas_pendientes()
+    if pendientes or error_envio:
+        st.warning(f"⏳ {pendientes} venta(s) pendiente(s) de enviar" + (f" · último error: {error_envio}" if error_envio else ""))
+    
+    if 'carrito' not in st.session_state: st.session_state.carrito = []
+    # --- Fecha de venta (solo admin) ---
+    if es_admin:
+        fecha_venta = st.date_input(
+            "📅 Fecha de la venta",
+            value=pd.Timestamp.today().date(),
+            help="Permite registrar ventas en una fecha distinta a hoy"
+        )
+    else:
+        fecha_venta = pd.Timestamp.today().date()
+    # =========================================================
+    # 1. SECCIÓN SUPERIOR: NUEVA ORDEN (POS)
+    # =========================================================
+    _pos_orden(fecha_venta)
 
     # =========================================================
     # 2. SECCIÓN INFERIOR: HISTORIAL Y GRÁFICAS (ABAJO)
@@ -1376,26 +2919,25 @@ def mostrar_ventas(f_inicio, f_fin):
     st.markdown("<br><hr><br>", unsafe_allow_html=True) # Separador visual grande
     st.subheader("📜 Resumen de Actividad e Historial")
     
-    ventas_hist = leer_ventas(f_inicio, f_fin)
-    if ventas_hist:
-        ventas_df = pd.DataFrame(ventas_hist)
-        
+    ventas_df = leer_ventas_df(f_inicio, f_fin)
+    if not ventas_df.empty:
         if es_admin:
             with st.expander("📊 Gráficas de Resumen Rápido", expanded=True):
                 cg1, cg2 = st.columns(2)
                 # Gráfica 1
+                resumen = leer_resumen_ventas(f_inicio, f_fin)
                 with cg1:
-                    if 'Forma Pago' in ventas_df.columns:
-                        fig_pago = px.pie(ventas_df.groupby('Forma Pago')['Total Venta Neta'].sum().reset_index(), 
-                                        values='Total Venta Neta', names='Forma Pago', hole=.5, 
+                    if resumen['Forma Pago'].notna().any():
+                        fig_pago = px.pie(resumen.groupby('Forma Pago')['Ventas'].sum().reset_index(), 
+                                        values='Ventas', names='Forma Pago', hole=.5, 
                                         color_discrete_sequence=["#D4D4D4", "#95E9BF"], title="Métodos de Pago")
                         st.plotly_chart(fig_pago, use_container_width=True)
                 
                 st.divider()
                 with cg2:
                     # Gráfica 2
-                    venta_t = ventas_df['Total Venta Neta'].sum()
-                    ganancia_t = ventas_df['Ganancia Neta'].sum()
+                    venta_t = resumen['Ventas'].sum()
+                    ganancia_t = resumen['Ganancia'].sum()
                     fig_rent = px.pie(names=['Ganancia', 'Costos'], values=[ganancia_t, max(0, venta_t - ganancia_t)], 
                                      hole=.5, color_discrete_sequence=["#80A6F8", "#A2FF9A"], title="Rentabilidad")
                     st.plotly_chart(fig_rent, use_container_width=True)
@@ -1403,13 +2945,19 @@ def mostrar_ventas(f_inicio, f_fin):
         # Tabla de historial al final
         st.markdown("##### Detalle de Ventas")
         st.dataframe(ventas_df[['Fecha', 'Producto', 'Cantidad', 'Total Venta Neta', 'Forma Pago']], 
-                     use_container_width=True, hide_index=True)
+                     use_container_width=True, hide_index=True,
+                     column_config={'Fecha': st.column_config.DateColumn(format="DD/MM/YYYY")})
     else:
         st.info("No hay ventas en el rango seleccionado.")
             
+@medido(tipo="página")
 def mostrar_inventario():
     st.markdown('<div class="section-header">📦 Inventario</div>', unsafe_allow_html=True)
-    inv = leer_inventario(); ings = leer_ingredientes_base()
+    hoy = pd.Timestamp.today().date()
+    fecha_stock = st.date_input("📅 Stock al", value=hoy, max_value=hoy)
+    # Stock al cierre del día elegido: corte de inicio de mes + movimientos
+    inv = leer_inventario(None if fecha_stock == hoy else pd.Timestamp(fecha_stock) + pd.Timedelta(days=1))
+    ings = leer_ingredientes_base()
     for i in ings:
         if i['nombre'] not in inv: inv[i['nombre']] = {'stock_actual': 0.0, 'min': 0.0, 'max': 0.0}
             
@@ -1429,13 +2977,22 @@ def mostrar_inventario():
         return [f'background-color: {color}'] * len(row)
     
     st.dataframe(df.style.apply(color_row, axis=1), use_container_width=True)
-    with st.expander("📥 Registrar Entrada Manual"):
-        c1, c2, c3 = st.columns([2,1,1])
+    with st.expander("📥 Registrar Movimiento"):
+        c1, c2, c3, c4 = st.columns([2,1,1,1])
         ing_in = c1.selectbox("Ingrediente:", df['Ingrediente'].tolist())
-        cant_in = c2.number_input("Cantidad a agregar:", min_value=0.0)
-        if c3.button("Registrar Entrada"):
-            inv[ing_in]['stock_actual'] += cant_in; guardar_inventario(inv); st.success(f"Actualizado {ing_in}"); st.rerun()
+        tipo_in = c2.selectbox("Tipo:", ["Compra", "Ajuste"], help="Ajuste: cantidad contada físicamente (reemplaza el stock actual)")
+        cant_in = c3.number_input("Cantidad:", min_value=0.0)
+        if c4.button("Registrar"):
+            try:
+                delta = cant_in if tipo_in == "Compra" else cant_in - stock_al_dia(ing_in)
+                registrar_movimientos([{"Fecha": pd.Timestamp.now(), "Ingrediente": ing_in, "Cantidad": delta,
+                                        "Tipo": tipo_in.lower(), "Referencia": uuid.uuid4().hex}])
+            except Exception as e:
+                st.error(f"❌ Error guardando {R2_INVENTARIO}: {e}")
+            else:
+                st.success(f"Actualizado {ing_in}"); st.rerun()
 
+@medido(tipo="página")
 def mostrar_reposicion(f_inicio, f_fin):
     st.markdown('<div class="section-header">🔄 Reposición Sugerida</div>', unsafe_allow_html=True)
     data_reposicion = calcular_reposicion_sugerida(f_inicio, f_fin)
@@ -1457,6 +3014,29 @@ def mostrar_reposicion(f_inicio, f_fin):
 
 # --- MAIN LOOP ---
 def main():
+    # Cada rerun junta sus tramos (ver medido), incluidos los de los callbacks
+    # que ya corrieron; el panel de admin muestra los del anterior
+    st.session_state.pop("_contexto_rerun", None)
+    _abrir_tramos_del_rerun()
+    aplicar_invalidaciones()
+    perfilador = _config_perfilador()
+    muestreo = _iniciar_muestreo() if perfilador["activo"] else None
+    inicio = time.perf_counter()
+    try:
+        _rerun()
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        _cerrar_rerun(ms)
+        if muestreo:
+            pilas, detener, hilo = muestreo
+            detener.set()
+            hilo.join()
+            if pilas and ms >= perfilador["umbral_ms"]:
+                _guardar_perfil(pilas, ms)
+        if METRICAS_ARCHIVO:
+            _exportar_metricas()
+
+def _rerun():
     if not check_auth(): st.stop()
     st.sidebar.markdown("### 🍑 BonBon Peach")
     st.sidebar.markdown("#### 📅 Rango de Fechas")
@@ -1465,6 +3045,33 @@ def main():
     f_fin = st.sidebar.date_input("Fin", value=hoy)
     st.sidebar.markdown("---")
     st.sidebar.caption(f"👤 {st.session_state.usuario} ({st.session_state.rol})")
+    if st.session_state.get("rol") == "admin":
+        lecturas = estadisticas_api()
+        st.sidebar.caption(f"🔁 Lecturas R2: {lecturas['304']} sin cambios (304) · {lecturas['completas']} completas")
+        with st.sidebar.expander("⏱️ Latencia API (ms)"):
+            st.dataframe(histograma_latencias(), use_container_width=True, hide_index=True)
+        with st.sidebar.expander("🧭 Tiempos del último rerun"):
+            ultimo = st.session_state.get("tramos_ultimo_rerun")
+            if ultimo:
+                st.dataframe(tabla_tramos(ultimo["tramos"]), use_container_width=True, hide_index=True)
+                st.caption(f"Total: {ultimo['ms']:.0f} ms")
+            st.download_button("📥 Métricas (Prometheus)", data=metricas_prometheus(),
+                               file_name="metricas.prom", mime="text/plain")
+        with st.sidebar.expander("🔬 Perfilador"):
+            perfilador = _config_perfilador()
+            perfilador["activo"] = st.toggle("Perfilar reruns (todas las sesiones)", value=perfilador["activo"])
+            perfilador["umbral_ms"] = st.number_input("Guardar si el rerun tarda más de (ms)", min_value=0,
+                                                      value=perfilador["umbral_ms"], step=250)
+            perfiles = listar_perfiles()
+            if perfiles:
+                elegido = st.selectbox("Perfil guardado", perfiles)
+                perfil, base = leer_perfil(elegido), elegido.removesuffix(".json")
+                st.download_button("🔥 Flame graph (HTML)", data=flamegraph_html(perfil),
+                                   file_name=f"{base}.html", mime="text/html")
+                st.download_button("📄 Pilas (speedscope / flamegraph.pl)", data=pilas_colapsadas(perfil),
+                                   file_name=f"{base}.txt", mime="text/plain")
+            else:
+                st.caption("Sin perfiles guardados.")
 
     rol = st.session_state.get("rol", "vendedor")
     menu_opts = ["📊 Dashboard", "🛒 Ventas", "🔄 Reposición", "📦 Inventario", "🧪 Ingredientes", "📝 Recetas", "🧩 Modificadores", "💰 Precios"]
@@ -1477,6 +3084,9 @@ def main():
     st.sidebar.markdown("---")
     if st.sidebar.button("Cerrar Sesión"): st.session_state.authenticated = False; st.rerun()
 
+    st.session_state["_contexto_rerun"] = (opcion, f_inicio, f_fin)
+    precargar_pagina(opcion, f_inicio, f_fin)
+
     if opcion == "📊 Dashboard": mostrar_dashboard(f_inicio, f_fin)
     elif opcion == "🧪 Ingredientes": mostrar_ingredientes()
     elif opcion == "📝 Recetas": mostrar_recetas()
@@ -0,0 +1,346 @@
+"""K sesiones simultáneas contra un servidor `streamlit run` de app_web.py.
+
+    python -m bench.carga --sesiones 1,2,4,8 --ciclos 3 --salida carga.json
+
+Levanta un único servidor real (streamlit run, headless) contra un Worker
+local con datos sintéticos (ver bench/datos.py) y lo maneja con K clientes
+websocket, uno por hilo, que hablan el mismo protocolo que el navegador: cada
+interacción es un BackMsg con los widgets que cambiaron y termina cuando
+llega el script_finished de la corrida final (sigue los st.rerun que
+dispara). Las K sesiones comparten el proceso, sus cachés y la cola de
+ventas, como en producción.
+
+Cada sesión inicia sesión y repite su flujo. Cajero: elige productos, suma
+extras con ➕, agrega al carrito, ajusta cantidades o quita líneas y cobra.
+Administrador: abre el dashboard, cambia el rango de fechas y recorre Ventas
+y Reposición. Los widgets de un fragmento (el POS) se envían con su
+fragment_id, así que esos clics son reruns de fragmento reales y se cuentan
+aparte. El inicio de sesión no se mide; la ronda arranca cuando todas
+entraron.
+
+Por cada K reporta la latencia de rerun vista por el cliente (p50/p95),
+reruns por segundo del conjunto, CPU del proceso del servidor (100 % = un
+núcleo) y su memoria residente máxima durante la ronda. CPU y memoria se
+leen de /proc (solo Linux).
+"""
+import argparse
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.testing.v1.element_tree import parse_tree_from_messages
+from websockets.sync.client import connect
+
+from bench import datos
+from bench.entorno import API_KEY, RAIZ, escribir_secretos, iniciar, worker_local
+
+SCRIPT = os.path.join(RAIZ, "app_web.py")
+CLAVE = "carga"
+TIMEOUT_RERUN = 120
+TIMEOUT_INICIO = 600  # espera máxima a que todas las sesiones entren
+MUESTREO_S = 0.1  # cada cuánto se lee la memoria del servidor
+
+# ScriptFinishedStatus
+CORTADA_POR_RERUN = 2
+FRAGMENTO_OK = 3
+
+
+def _percentil(valores, q):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * q))] if valores else 0.0
+
+
+class Servidor:
+    # streamlit run de app_web.py en un directorio temporal con su secrets.toml
+    def __init__(self, secretos, puerto):
+        self.dir = tempfile.mkdtemp(prefix="carga_")
+        os.makedirs(os.path.join(self.dir, ".streamlit"))
+        escribir_secretos(os.path.join(self.dir, ".streamlit", "secrets.toml"), secretos)
+        self.url = f"127.0.0.1:{puerto}"
+        self.proceso = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", SCRIPT,
+             "--server.headless", "true", "--server.port", str(puerto),
+             "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false",
+             "--logger.level", "error"],
+            cwd=self.dir, stdout=subprocess.DEVNULL)
+        limite = time.monotonic() + TIMEOUT_INICIO
+        while True:
+            if self.proceso.poll() is not None:
+                raise RuntimeError(f"streamlit run terminó con código {self.proceso.returncode}")
+            try:
+                if requests.get(f"http://{self.url}/_stcore/health", timeout=1).ok:
+                    break
+            except requests.RequestException:
+                pass
+            if time.monotonic() > limite:
+                raise TimeoutError("streamlit run no respondió")
+            time.sleep(0.2)
+
+    def cpu_s(self):
+        # utime + stime del proceso (campos 14 y 15 de /proc/<pid>/stat)
+        with open(f"/proc/{self.proceso.pid}/stat", encoding="ascii") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        return (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")
+
+    def memoria_mb(self):
+        with open(f"/proc/{self.proceso.pid}/status", encoding="ascii") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+        return 0.0
+
+    def cerrar(self):
+        self.proceso.terminate()
+        try:
+            self.proceso.wait(30)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+
+
+def _boton(nodo):
+    return WidgetState(id=nodo.id, trigger_value=True)
+
+
+def _texto(nodo, valor):
+    # text_input, selectbox y radio mandan el texto de la opción
+    return WidgetState(id=nodo.id, string_value=valor)
+
+
+def _fecha(nodo, valor):
+    w = WidgetState(id=nodo.id)
+    w.string_array_value.data[:] = [valor.isoformat()]
+    return w
+
+
+class Sesion:
+    # Un navegador: su websocket y la página que le fue llegando; cada acción
+    # es un rerun medido
+    def __init__(self, ws, usuario, registro, pausa, azar):
+        self.ws = ws
+        self.usuario = usuario
+        self.registro = registro
+        self.pausa = pausa
+        self.azar = azar
+        self.deltas = []
+        self.arbol = None
+
+    def _correr(self, widgets=()):
+        # Manda el rerun y espera su script_finished; devuelve si fue de fragmento
+        fragmentos = {}
+        for m in self.deltas:
+            elemento = m.delta.new_element
+            tipo = elemento.WhichOneof("type")
+            if tipo and hasattr(getattr(elemento, tipo), "id"):
+                fragmentos[getattr(elemento, tipo).id] = m.delta.fragment_id
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.widget_states.widgets.extend(widgets)
+        # Como el navegador: un widget dentro de un fragmento solo reejecuta ese fragmento
+        msg.rerun_script.fragment_id = next((fragmentos.get(w.id, "") for w in widgets), "")
+        self.ws.send(msg.SerializeToString())
+
+        nuevos = []
+        while True:
+            m = ForwardMsg()
+            m.ParseFromString(self.ws.recv(timeout=TIMEOUT_RERUN))
+            tipo = m.WhichOneof("type")
+            if tipo == "new_session":
+                nuevos = []
+            elif tipo == "delta":
+                nuevos.append(m)
+            elif tipo == "script_finished" and m.script_finished != CORTADA_POR_RERUN:
+                break
+        if m.script_finished == FRAGMENTO_OK:
+            # El fragmento reemplaza solo sus propios elementos
+            propios = {d.delta.fragment_id for d in nuevos}
+            nuevos = [d for d in self.deltas if d.delta.fragment_id not in propios] + nuevos
+        self.deltas = nuevos
+        return m.script_finished == FRAGMENTO_OK
+
+    def _accion(self, nombre, widgets=()):
+        time.sleep(self.pausa)
+        t0 = time.perf_counter()
+        fragmento = self._correr(widgets)
+        segundos = time.perf_counter() - t0
+        self.arbol = parse_tree_from_messages(self.deltas)
+        self.registro.append((nombre, segundos, len(self.arbol.exception), fragmento))
+
+    def entrar(self):
+        self._accion("abrir")
+        usuario, clave = self.arbol.text_input[0], self.arbol.text_input[1]
+        self._accion("iniciar sesión", [_texto(usuario, self.usuario), _texto(clave, CLAVE),
+                                        _boton(self.arbol.button[0])])
+
+    def ciclo_cajero(self):
+        productos = [p for p in self.arbol.selectbox(key="pos_prod_sel").options if p.startswith("Producto")]
+        for _ in range(self.azar.randint(1, 3)):
+            producto = self.azar.choice(productos)
+            self._accion("elegir producto", [_texto(self.arbol.selectbox(key="pos_prod_sel"), producto)])
+            extras = [b.key for b in self.arbol.button if (b.key or "").startswith("plus_")]
+            for key in self.azar.sample(extras, min(len(extras), self.azar.randint(0, 2))):
+                self._accion("extra ➕", [_boton(self.arbol.button(key=key))])
+            agregar = next(b for b in self.arbol.button if b.label == "🛒 Agregar al Carrito")
+            self._accion("agregar al carrito", [_boton(agregar)])
+        # Ajustes en el carrito: cantidad ➕/➖ y, si queda más de una línea, quitar
+        carrito = [b.key for b in self.arbol.button if (b.key or "").startswith(("c_plus_", "c_min_"))]
+        for key in self.azar.sample(carrito, min(len(carrito), self.azar.randint(0, 2))):
+            self._accion("carrito ➕/➖", [_boton(self.arbol.button(key=key))])
+        quitar = [b.key for b in self.arbol.button if (b.key or "").startswith("c_del_")]
+        if len(quitar) > 1 and self.azar.random() < 0.5:
+            self._accion("quitar del carrito", [_boton(self.arbol.button(key=quitar[-1]))])
+        cobrar = next(b for b in self.arbol.button if b.label.startswith("✅ FINALIZAR"))
+        self._accion("cobrar", [_boton(cobrar)])
+
+    def ciclo_admin(self):
+        hoy = datetime.date.today()
+        self._accion("dashboard", [_texto(self.arbol.sidebar.radio[0], "📊 Dashboard")])
+        mes_anterior = (hoy.replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+        desde = self.azar.choice([hoy.replace(day=1), mes_anterior])
+        self._accion("cambiar rango", [_fecha(self.arbol.sidebar.date_input[0], desde)])
+        for pagina in ["🛒 Ventas", "🔄 Reposición"]:
+            self._accion(pagina[2:].lower(), [_texto(self.arbol.sidebar.radio[0], pagina)])
+
+
+def _sesion(i, es_admin, ciclos, pausa, servidor, semilla, inicio, resultados):
+    # Hilo de una sesión: entra (sin medir), espera a las demás y repite su flujo
+    usuario = f"admin{i}" if es_admin else f"cajero{i}"
+    registro, fallo = [], None
+    with contextlib.ExitStack() as conexion:
+        try:
+            ws = conexion.enter_context(connect(f"ws://{servidor.url}/_stcore/stream", subprotocols=["streamlit"],
+                                                max_size=None, open_timeout=TIMEOUT_RERUN))
+            s = Sesion(ws, usuario, registro, pausa, random.Random(semilla * 1000 + i))
+            s.entrar()
+        except Exception as e:
+            fallo = f"{usuario}: {e!r}"
+        registro.clear()
+        inicio.wait(TIMEOUT_INICIO)
+        if fallo is None:
+            try:
+                for _ in range(ciclos):
+                    s.ciclo_admin() if es_admin else s.ciclo_cajero()
+            except Exception as e:
+                # La página no tenía lo esperado: la sesión termina
+                fallo = f"{usuario}: {e!r} {[x.value for x in s.arbol.exception]}"
+    resultados.append({"registro": registro, "fallo": fallo})
+
+
+def correr(k, admins, ciclos, pausa, servidor, semilla):
+    # K sesiones en paralelo contra el mismo servidor; devuelve las métricas de la ronda
+    inicio, resultados = threading.Barrier(k + 1), []
+    hilos = [threading.Thread(target=_sesion, daemon=True,
+                              args=(i, i < admins, ciclos, pausa, servidor, semilla, inicio, resultados))
+             for i in range(k)]
+    for h in hilos:
+        h.start()
+    inicio.wait(TIMEOUT_INICIO)
+    cpu0, t0 = servidor.cpu_s(), time.perf_counter()
+    memoria, listo = [servidor.memoria_mb()], threading.Event()
+
+    def muestrear():
+        while not listo.wait(MUESTREO_S):
+            memoria.append(servidor.memoria_mb())
+
+    muestreo = threading.Thread(target=muestrear, daemon=True)
+    muestreo.start()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - t0
+    cpu = servidor.cpu_s() - cpu0
+    listo.set()
+    muestreo.join()
+
+    registro = [r for res in resultados for r in res["registro"]]
+    ms = [d * 1000 for _, d, *_ in registro]
+    por_accion, fragmentos = {}, {}
+    for nombre, d, _, fragmento in registro:
+        por_accion.setdefault(nombre, []).append(d * 1000)
+        fragmentos[nombre] = fragmentos.get(nombre, 0) + fragmento
+    return {
+        "sesiones": k,
+        "admins": admins,
+        "reruns": len(ms),
+        "reruns_fragmento": sum(fragmentos.values()),
+        "errores": sum(1 for _, _, e, _ in registro if e),
+        "sesiones_caidas": [res["fallo"] for res in resultados if res["fallo"]],
+        "p50_ms": round(statistics.median(ms), 1) if ms else 0.0,
+        "p95_ms": round(_percentil(ms, 0.95), 1),
+        "reruns_s": round(len(ms) / segundos, 2),
+        "cpu_servidor_%": round(cpu / segundos * 100, 1),
+        "memoria_servidor_mb": round(max(memoria), 1),
+        "acciones": {n: {"n": len(v), "fragmento": fragmentos[n],
+                         "p50_ms": round(statistics.median(v), 1), "p95_ms": round(_percentil(v, 0.95), 1)}
+                     for n, v in sorted(por_accion.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sesiones", default="1,2,4,8", help="valores de K, separados por coma")
+    parser.add_argument("--admins", type=float, default=0.25, help="fracción de sesiones de administrador")
+    parser.add_argument("--ciclos", type=int, default=3, help="cobros / recorridos por sesión")
+    parser.add_argument("--pausa-ms", type=float, default=0, help="tiempo de 'pensar' entre acciones")
+    parser.add_argument("--escala", choices=sorted(datos.ESCALAS), default="chica")
+    parser.add_argument("--latencia-ms", type=float, default=0, help="latencia simulada del Worker local")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--puerto", type=int, default=8599, help="puerto del servidor streamlit")
+    parser.add_argument("--salida", help="escribe los resultados en este JSON")
+    args = parser.parse_args()
+    valores_k = [int(k) for k in args.sesiones.split(",")]
+
+    red = worker_local.Red()
+    worker, _, app = iniciar(red=red)
+    datos.cargar(app, datos.generar(**datos.ESCALAS[args.escala], semilla=args.semilla))
+    red.latencia_ms = args.latencia_ms
+
+    usuarios = {"password": hashlib.sha256(CLAVE.encode()).hexdigest()}
+    n = max(valores_k)
+    servidor = Servidor({
+        "API_KEY": API_KEY,
+        "WORKER_URL": app.WORKER_URL,
+        "COLA_VENTAS_DB": os.path.join(tempfile.mkdtemp(prefix="carga_"), "cola_ventas.sqlite3"),
+        "users": {**{f"cajero{i}": {**usuarios, "rol": "vendedor"} for i in range(n)},
+                  **{f"admin{i}": {**usuarios, "rol": "admin"} for i in range(n)}},
+    }, args.puerto)
+
+    rondas = []
+    print(f"{'K':>3} {'reruns':>7} {'fragm.':>7} {'p50 ms':>8} {'p95 ms':>8} {'reruns/s':>9} {'CPU %':>6} "
+          f"{'RSS MB':>7} errores")
+    try:
+        for k in valores_k:
+            r = correr(k, int(k * args.admins), args.ciclos, args.pausa_ms / 1000, servidor, args.semilla)
+            rondas.append(r)
+            print(f"{k:>3} {r['reruns']:>7} {r['reruns_fragmento']:>7} {r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} "
+                  f"{r['reruns_s']:>9.2f} {r['cpu_servidor_%']:>6.0f} {r['memoria_servidor_mb']:>7.0f} "
+                  f"{r['errores']}")
+            for fallo in r["sesiones_caidas"]:
+                print("    sesión caída:", fallo)
+    finally:
+        servidor.cerrar()
+        worker.shutdown()
+
+    if args.salida:
+        informe = {
+            "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+            "parametros": {k: v for k, v in vars(args).items() if k != "salida"},
+            "rondas": rondas,
+        }
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""N terminales cobrando a la vez contra el Worker local.
+
+    python -m bench.concurrencia --terminales 8 --cobros 25
+
+Comprueba que no se pierde ninguna línea (manifiesto, líneas leídas y resumen
+diario) y mide cobros confirmados por segundo. Sale con código 1 si falta algo.
+"""
+import argparse
+import datetime
+import logging
+import sys
+import threading
+import time
+
+from bench.entorno import iniciar
+
+
+def _cobro(terminal, n):
+    return [{
+        "Fecha": "15/10/2026",
+        "Producto": f"Producto {n % 5}",
+        "Cantidad": 1,
+        "Precio Unitario": 50.0,
+        "Descuento (%)": 0,
+        "Costo Total": 20.0,
+        "Forma Pago": "Tarjeta" if terminal % 2 else "Efectivo",
+        "Modificadores": [],
+    }]
+
+
+def correr(app, almacen, terminales, cobros):
+    # Cobra terminales × cobros en paralelo y cuenta lo que quedó en el almacén
+    # El resumen del mes debe existir para que cada cobro lo actualice (una fila semilla)
+    app._api_put(app._objeto_resumen("2026-10"), [{
+        "Fecha": "2026-10-01", "Particion": "2026-10", "Producto": "Semilla", "Forma Pago": "Efectivo",
+        "Ventas": 0, "Ganancia": 0, "Cantidad": 0, "Lineas": 1,
+    }])
+
+    errores = []
+    inicio = threading.Barrier(terminales + 1)
+
+    def terminal(t):
+        inicio.wait()
+        for n in range(cobros):
+            try:
+                app._subir_ventas(_cobro(t, n), datetime.date(2026, 10, 15), f"t{t}-{n}")
+            except Exception as e:
+                errores.append(f"terminal {t} cobro {n}: {e}")
+
+    hilos = [threading.Thread(target=terminal, args=(t,)) for t in range(terminales)]
+    for h in hilos:
+        h.start()
+    inicio.wait()
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - t0
+
+    manifiesto = app.json.loads(almacen.leer(app.R2_VENTAS_MANIFIESTO)[0])
+    resumen = app.json.loads(almacen.leer(app._objeto_resumen("2026-10"))[0])
+    resultado = {
+        "esperados": terminales * cobros,
+        "segundos": segundos,
+        "errores": errores,
+        "ids": {m["Id Venta"] for m in manifiesto},
+        "lineas": sum(len(app.json.loads(almacen.leer(m["Objeto"])[0])) for m in manifiesto),
+        "en_resumen": sum(r["Lineas"] for r in resumen) - 1,
+    }
+
+    # El resumen es derivado: un incremento que agota sus reintentos se
+    # repara una vez compactado (ver reparar_resumen). La reparación también
+    # descarta la fila semilla, que no está en el manifiesto.
+    app.compactar_ventas()
+    resultado["leidas"] = len(app.leer_ventas_df())
+    app.reparar_resumen()
+    resultado["reparado"] = int(app.leer_resumen_ventas()["Lineas"].sum())
+    return resultado
+
+
+def completo(r):
+    return not r["errores"] and len(r["ids"]) == r["lineas"] == r["leidas"] == r["reparado"] == r["esperados"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terminales", type=int, default=8)
+    parser.add_argument("--cobros", type=int, default=25, help="cobros por terminal")
+    args = parser.parse_args()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    servidor, almacen, app = iniciar()
+    # Compactación desactivada: se mide el camino del cobro, no el de fondo
+    app.SEGMENTOS_MAX_SIN_COMPACTAR = 10 ** 9
+    try:
+        r = correr(app, almacen, args.terminales, args.cobros)
+    finally:
+        servidor.shutdown()
+
+    esperados, segundos = r["esperados"], r["segundos"]
+    print(f"{args.terminales} terminales × {args.cobros} cobros en {segundos:.2f} s "
+          f"→ {esperados / segundos:.1f} cobros/s")
+    print(f"manifiesto: {len(r['ids'])}/{esperados} cobros · segmentos: {r['lineas']}/{esperados} líneas · "
+          f"tras compactar: {r['leidas']}/{esperados} líneas · errores: {len(r['errores'])}")
+    print(f"resumen: {r['en_resumen']}/{esperados} líneas al cobrar, {r['reparado']}/{esperados} al leer")
+    for e in r["errores"][:10]:
+        print("  ", e)
+    ok = completo(r)
+    print("OK: no se perdió ninguna línea" if ok else "FALLO: faltan líneas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
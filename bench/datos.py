@@ -0,0 +1,182 @@
+"""Datos sintéticos con la forma de los de producción, para medir la app a escala.
+
+generar() devuelve {objeto de R2: registros} con ingredientes, recetas (con
+sub-recetas hasta la profundidad pedida), modificadores, precios, inventario y
+ventas ya compactadas en particiones mensuales con su manifiesto. Con la misma
+semilla se obtienen los mismos datos.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# Tamaños de referencia; cualquier valor se puede cambiar por separado
+ESCALAS = {
+    "chica": {"ingredientes": 40, "recetas": 20, "profundidad": 1, "modificadores": 8, "lineas": 5_000, "meses": 3},
+    "mediana": {"ingredientes": 150, "recetas": 60, "profundidad": 2, "modificadores": 20, "lineas": 50_000, "meses": 12},
+    "grande": {"ingredientes": 400, "recetas": 150, "profundidad": 3, "modificadores": 40, "lineas": 250_000, "meses": 24},
+}
+
+UNIDADES = [("kg", "g", 1000), ("L", "ml", 1000), ("pieza", "pieza", 1), ("paquete", "pieza", 12)]
+PROB_MODIFICADOR = 0.3  # líneas con al menos un extra
+PESO_DIA = [0.8, 0.8, 0.9, 1.0, 1.3, 1.6, 1.4]  # lunes → domingo
+COMISION_TARJETA = 3.5 * 1.16
+
+
+def _ingredientes(rng, n):
+    filas = []
+    for i in range(n):
+        compra, receta, factor = UNIDADES[rng.integers(len(UNIDADES))]
+        costo = round(float(rng.uniform(20, 600)), 2)
+        filas.append({
+            "Ingrediente": f"Ingrediente {i:04d}",
+            "Proveedor": f"Proveedor {rng.integers(1, 11)}",
+            "Unidad de Compra": compra,
+            "Costo de Compra": costo,
+            "Cantidad por Unidad de Compra": factor,
+            "Unidad Receta": receta,
+            "Costo por Unidad Receta": round(costo / factor, 4),
+        })
+    return filas
+
+
+def _recetas(rng, ingredientes, n, profundidad, modificadores):
+    # Nivel 0: solo ingredientes. Nivel k: ingredientes y 1-2 recetas de
+    # niveles anteriores. Los productos que se venden son los del último nivel.
+    nombres_ing = [i["Ingrediente"] for i in ingredientes]
+    por_pieza = {i["Ingrediente"] for i in ingredientes if i["Unidad Receta"] == "pieza"}
+    niveles = [min(k * (profundidad + 1) // max(n, 1), profundidad) for k in range(n)]
+    recetas, por_nivel = {}, {}
+    for k, nivel in enumerate(niveles):
+        nombre = f"Producto {k:03d}" if nivel == profundidad else f"Base {k:03d}"
+        elegidos = rng.choice(nombres_ing, size=min(int(rng.integers(3, 9)), len(nombres_ing)), replace=False)
+        # Gramos / mililitros, o 1-2 piezas
+        ings = {str(i): float(rng.integers(1, 3)) if i in por_pieza else round(float(rng.uniform(5, 250)), 2)
+                for i in elegidos}
+        previas = [r for nv in range(nivel) for r in por_nivel.get(nv, [])]
+        if previas:
+            for sub in rng.choice(previas, size=min(int(rng.integers(1, 3)), len(previas)), replace=False):
+                ings[str(sub)] = round(float(rng.uniform(0.1, 1.5)), 3)
+        validos = []
+        if modificadores and nivel == profundidad:
+            validos = list(rng.choice(modificadores, size=min(int(rng.integers(0, 5)), len(modificadores)), replace=False))
+        recetas[nombre] = {"ingredientes": ings, "modificadores_validos": [str(m) for m in validos]}
+        por_nivel.setdefault(nivel, []).append(nombre)
+
+    # Tabla ancha: una fila por ingrediente, una columna por producto (ver guardar_recetas)
+    filas = []
+    for ing in sorted({i for r in recetas.values() for i in r["ingredientes"]}):
+        filas.append({"Ingrediente": ing, **{p: r["ingredientes"].get(ing, "") for p, r in recetas.items()}})
+    filas.append({"Ingrediente": "__MODS__", **{p: ",".join(r["modificadores_validos"]) for p, r in recetas.items()}})
+    return recetas, por_nivel[profundidad], filas
+
+
+def _modificadores(rng, ingredientes, n):
+    filas, precios = [], {}
+    for k in range(n):
+        nombre = f"Extra {k:02d}"
+        precios[nombre] = float(rng.choice([5, 10, 15, 20, 25]))
+        for ing in rng.choice([i["Ingrediente"] for i in ingredientes], size=int(rng.integers(1, 4)), replace=False):
+            filas.append({"Modificador": nombre, "Precio Extra": precios[nombre],
+                          "Ingrediente Base": str(ing), "Cantidad": round(float(rng.uniform(5, 60)), 2)})
+    return precios, filas
+
+
+def _ventas(rng, productos, recetas, precios, precios_mods, lineas, meses, hasta):
+    fin = pd.Timestamp(hasta)
+    inicio = (fin - pd.DateOffset(months=meses - 1)).replace(day=1)
+    dias = pd.date_range(inicio, fin, freq="D")
+    peso = np.array([PESO_DIA[d.weekday()] for d in dias])
+
+    # Tickets de 1-4 líneas: todas comparten fecha, forma de pago e "Id Venta"
+    por_ticket = rng.integers(1, 5, size=lineas)
+    ticket = np.repeat(np.arange(lineas), por_ticket)[:lineas]
+    n_tickets = ticket[-1] + 1
+    fecha_ticket = rng.choice(len(dias), size=n_tickets, p=peso / peso.sum())
+    tarjeta_ticket = rng.random(n_tickets) < 0.45
+
+    producto = rng.choice(productos, size=lineas)
+    cantidad = rng.choice([1, 1, 1, 1, 2, 2, 3], size=lineas)
+    descuento = np.where(rng.random(lineas) < 0.1, rng.choice([5, 10, 15], size=lineas), 0)
+    con_mods = rng.random(lineas) < PROB_MODIFICADOR
+
+    filas = []
+    for i in range(lineas):
+        p, c, t = str(producto[i]), int(cantidad[i]), ticket[i]
+        mods = []
+        validos = recetas[p]["modificadores_validos"]
+        if con_mods[i] and validos:
+            for m in rng.choice(validos, size=int(rng.integers(1, len(validos) + 1)), replace=False):
+                mods.append({"nombre": str(m), "precio": precios_mods[m], "cantidad": int(rng.integers(1, 3)),
+                             "costo": round(precios_mods[m] * 0.3, 2)})
+        precio = precios[p]
+        extra = sum(m["precio"] * m["cantidad"] for m in mods) * c
+        bruto = precio * c + extra
+        desc = bruto * descuento[i] / 100
+        subtotal = bruto - desc
+        forma = "Tarjeta" if tarjeta_ticket[t] else "Efectivo"
+        comision = subtotal * COMISION_TARJETA / 100 if forma == "Tarjeta" else 0.0
+        neta = subtotal - comision
+        costo = precio * 0.35 * c + sum(m["costo"] * m["cantidad"] for m in mods) * c
+        filas.append({
+            "Fecha": dias[fecha_ticket[t]].strftime("%d/%m/%Y"),
+            "Producto": p,
+            "Modificadores": mods,
+            "Cantidad": c,
+            "Precio Unitario": precio,
+            "Total Venta Bruto": round(bruto, 2),
+            "Descuento (%)": int(descuento[i]),
+            "Descuento ($)": round(desc, 2),
+            "Costo Total": round(costo, 2),
+            "Ganancia Bruta": round(bruto - costo, 2),
+            "Comision ($)": round(comision, 2),
+            "Ganancia Neta": round(neta - costo, 2),
+            "Forma Pago": forma,
+            "Total Venta Neta": round(neta, 2),
+            "Id Venta": f"sint-{t:07d}",
+        })
+    return filas
+
+
+def generar(ingredientes=150, recetas=60, profundidad=2, modificadores=20, lineas=50_000, meses=12,
+            hasta=None, semilla=0):
+    rng = np.random.default_rng(semilla)
+    hasta = hasta or datetime.date.today()
+
+    tabla_ing = _ingredientes(rng, ingredientes)
+    precios_mods, tabla_mods = _modificadores(rng, tabla_ing, modificadores)
+    detalle, productos, tabla_recetas = _recetas(rng, tabla_ing, recetas, profundidad, sorted(precios_mods))
+    precios = {p: float(rng.choice(np.arange(35, 125, 5))) for p in detalle}
+    tabla_precios = [{"Producto": p, "Precio Venta": v, "Margen Bruto": round(v * 0.65, 2), "Margen Bruto (%)": 65.0}
+                     for p, v in precios.items()]
+    tabla_inv = [{"Ingrediente": i["Ingrediente"], "Stock Actual": float(rng.integers(0, 50) * i["Cantidad por Unidad de Compra"]),
+                  "Stock Mínimo": 5.0 * i["Cantidad por Unidad de Compra"],
+                  "Stock Máximo": 60.0 * i["Cantidad por Unidad de Compra"]} for i in tabla_ing]
+
+    objetos = {
+        "ingredientes": tabla_ing,
+        "recetas": tabla_recetas,
+        "modificadores": tabla_mods,
+        "precios": tabla_precios,
+        "inventario": tabla_inv,
+    }
+
+    # Ventas como las deja compactar_ventas: una base por mes y el manifiesto
+    ventas = _ventas(rng, productos, detalle, precios, precios_mods, lineas, meses, hasta)
+    creado = pd.Timestamp.now().isoformat(timespec="seconds")
+    manifiesto = []
+    for particion, filas in pd.Series(ventas).groupby(
+        pd.to_datetime([v["Fecha"] for v in ventas], format="%d/%m/%Y").strftime("%Y-%m")
+    ):
+        objeto = f"ventas/{particion}"
+        objetos[objeto] = filas.tolist()
+        manifiesto.append({"Tipo": "particion", "Objeto": objeto, "Particion": particion,
+                           "Filas": len(filas), "Creado": creado})
+    objetos["ventas/_manifiesto"] = manifiesto
+    return objetos
+
+
+def cargar(app, objetos):
+    # Se suben por la API de la app: respeta FORMATO_VENTAS (JSON o Parquet)
+    for clave, registros in objetos.items():
+        app._api_put(clave, registros)
@@ -0,0 +1,58 @@
+"""Carga app_web.py contra un Worker local, sin streamlit run ni secrets.toml."""
+import importlib
+import os
+import sys
+import tempfile
+
+import streamlit.config
+import streamlit.logger
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import worker_local  # noqa: E402
+
+API_KEY = "bench"
+
+
+def cargar_app(url, **secretos):
+    # st.secrets se lee de un TOML temporal; app_web se importa una sola vez
+    # por proceso, así que los secretos valen para toda la corrida
+    ruta = os.path.join(tempfile.mkdtemp(prefix="bench_"), "secrets.toml")
+    escribir_secretos(ruta, {"API_KEY": API_KEY, "WORKER_URL": url, "users": {"bench": "-"}, **secretos})
+    streamlit.config.set_option("secrets.files", [ruta])
+    # Fuera de streamlit run cada llamada a st.* avisa que no hay contexto
+    streamlit.logger.set_log_level("error")
+    return importlib.import_module("app_web")
+
+
+def escribir_secretos(ruta, valores):
+    # secrets.toml: escalares arriba y cada dict como tabla (users.cajero0, ...)
+    lineas = []
+
+    def tabla(prefijo, d):
+        lineas.extend(f"{k} = {_toml(v)}" for k, v in d.items() if not isinstance(v, dict))
+        for k, v in d.items():
+            if isinstance(v, dict):
+                lineas.append(f"[{prefijo}{k}]")
+                tabla(f"{prefijo}{k}.", v)
+
+    tabla("", valores)
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write("\n".join(lineas) + "\n")
+
+
+def _toml(v):
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (int, float)):
+        return str(v)
+    return '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def iniciar(red=None, **secretos):
+    # (servidor, almacén, app_web) con el Worker local ya escuchando;
+    # red: worker_local.Red con la latencia / errores a simular
+    almacen = worker_local.Almacen()
+    servidor, url = worker_local.iniciar(api_key=API_KEY, almacen=almacen, red=red)
+    return servidor, almacen, cargar_app(url, **secretos)
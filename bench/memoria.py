@@ -0,0 +1,80 @@
+"""Memoria de las ventas cargadas: DataFrame anterior contra el tipado actual.
+
+    python -m bench.memoria
+    python -m bench.memoria --escala chica mediana grande --salida memoria.json
+
+Genera las ventas de cada escala (ver bench/datos.py, semilla fija), las sube a
+un Worker local y compara memory_usage(deep=True) de:
+  anterior: las líneas normalizadas tal como llegan del JSON (textos como
+            object, "Fecha" en texto más "Fecha_DT", modificadores como lista
+            de dicts por línea);
+  actual:   leer_ventas_df() + leer_modificadores_ventas() (ver ESQUEMA_VENTAS).
+memory_usage(deep=True) no cuenta los dicts dentro de las listas de
+modificadores: la cifra anterior es un mínimo.
+"""
+import argparse
+import json
+import logging
+
+import pandas as pd
+
+from bench import datos
+from bench.entorno import iniciar, worker_local
+
+
+def _mb(df):
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def medir(app, servidor, escala, semilla):
+    parametros = datos.ESCALAS[escala]
+    objetos = datos.generar(**parametros, semilla=semilla)
+    servidor.RequestHandlerClass.almacen = worker_local.Almacen()
+    app.st.cache_data.clear()
+    app.st.cache_resource.clear()
+    datos.cargar(app, {k: v for k, v in objetos.items() if k.startswith(app.R2_VENTAS)})
+
+    anterior = app._normalizar_ventas(app._leer_ventas_crudas())
+    lineas, mods = app.leer_ventas_df(), app.leer_modificadores_ventas()
+    return {
+        "lineas": len(lineas),
+        "modificadores": len(mods),
+        "anterior_mb": round(_mb(anterior), 2),
+        "actual_mb": round(_mb(lineas) + _mb(mods), 2),
+        "columnas_anterior_mb": (anterior.memory_usage(deep=True, index=False) / 2 ** 20).round(3).to_dict(),
+        "columnas_actual_mb": (lineas.memory_usage(deep=True, index=False) / 2 ** 20).round(3).to_dict(),
+        "tabla_modificadores_mb": round(_mb(mods), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", nargs="+", choices=sorted(datos.ESCALAS), default=["chica", "mediana"])
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--detalle", action="store_true", help="memoria por columna")
+    parser.add_argument("--salida", help="escribe el informe en este JSON")
+    args = parser.parse_args()
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    servidor, _, app = iniciar()
+    try:
+        informe = {escala: medir(app, servidor, escala, args.semilla) for escala in args.escala}
+    finally:
+        servidor.shutdown()
+
+    for escala, r in informe.items():
+        print(f"{escala}: {r['lineas']} líneas, {r['modificadores']} modificadores · "
+              f"anterior {r['anterior_mb']:.1f} MB → actual {r['actual_mb']:.1f} MB "
+              f"({r['anterior_mb'] / max(r['actual_mb'], 1e-9):.1f}×)")
+        if args.detalle:
+            print(pd.DataFrame({"anterior MB": pd.Series(r["columnas_anterior_mb"]),
+                                "actual MB": pd.Series(r["columnas_actual_mb"])}).fillna(0).to_string())
+            print(f"  + tabla de modificadores: {r['tabla_modificadores_mb']:.3f} MB")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"pandas": pd.__version__, "semilla": args.semilla, "escalas": informe}, f,
+                      ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
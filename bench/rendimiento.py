@@ -0,0 +1,177 @@
+"""Tiempos de las funciones críticas de app_web.py con datos sintéticos.
+
+    python -m bench.rendimiento --escala mediana --salida resultados.json
+    python -m bench.rendimiento --escala mediana --comparar resultados.json
+
+Genera los datos (ver bench/datos.py), los sube a un Worker local y mide cada
+función varias veces. "frío" = sin cachés de Streamlit (descarga y parseo);
+"caliente" = segunda llamada con la caché llena. El JSON de --salida sirve de
+base para --comparar, que sale con código 1 si alguna medición empeora más que
+la tolerancia.
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+from bench import datos
+from bench.entorno import iniciar, worker_local
+
+
+def _medir(funcion, repeticiones, preparar=None):
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    return {
+        "n": len(tiempos),
+        "mediana_ms": round(statistics.median(tiempos), 2),
+        "p95_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 2),
+        "min_ms": round(tiempos[0], 2),
+    }
+
+
+def _cobro(recetas, fecha, n):
+    # Un ticket de 3 líneas como el que arma el POS
+    productos = [p for p, r in recetas.items() if p.startswith("Producto")] or list(recetas)
+    return [{
+        "Fecha": fecha.strftime("%d/%m/%Y"),
+        "Producto": productos[(n + k) % len(productos)],
+        "Modificadores": [],
+        "Cantidad": 1,
+        "Precio Unitario": 50.0,
+        "Descuento (%)": 0,
+        "Costo Total": 20.0,
+        "Forma Pago": "Efectivo",
+    } for k in range(3)]
+
+
+def medir(app, f_ini, f_fin, repeticiones):
+    st = app.st
+
+    def en_frio():
+        st.cache_data.clear()
+        st.cache_resource.clear()
+
+    resultados = {}
+    resultados["leer_ventas_df (frío)"] = _medir(lambda: app.leer_ventas_df(f_ini, f_fin), repeticiones, en_frio)
+    resultados["leer_ventas_df (caliente)"] = _medir(lambda: app.leer_ventas_df(f_ini, f_fin), repeticiones)
+    resultados["leer_recetas (frío)"] = _medir(app.leer_recetas, repeticiones, en_frio)
+    resultados["leer_recetas (caliente)"] = _medir(app.leer_recetas, repeticiones)
+
+    # Reposición: con las lecturas ya en caché se mide el cálculo
+    app.calcular_reposicion_sugerida(f_ini, f_fin)
+    resultados["calcular_reposicion_sugerida"] = _medir(
+        lambda: app.calcular_reposicion_sugerida(f_ini, f_fin), repeticiones
+    )
+
+    # Dashboard: lectura del resumen diario y los agregados de mostrar_dashboard.
+    # Antes se arman y guardan los resúmenes mensuales (una vez por instalación).
+    app.reparar_resumen()
+    resultados["leer_resumen_ventas (frío)"] = _medir(
+        lambda: app.leer_resumen_ventas(f_ini, f_fin), repeticiones, en_frio
+    )
+    resumen = app.leer_resumen_ventas(f_ini, f_fin)
+
+    def agregados():
+        diario = app._resumen_diario(resumen)
+        app._figura_tendencia(diario, app._resolucion_tendencia(diario["Fecha"]))
+        app._resumen_productos(resumen)
+        app._patrones_semanales(diario)
+        app._resumen_semanal(diario)
+    agregados()  # la primera figura carga plotly
+    resultados["mostrar_dashboard (agregados)"] = _medir(agregados, repeticiones)
+
+    # Escritura al final: cada cobro invalida las cachés de ventas
+    recetas = app.leer_recetas()
+    cobros = iter(range(repeticiones))
+    resultados["guardar_ventas"] = _medir(
+        lambda: app.guardar_ventas(_cobro(recetas, f_fin, next(cobros)), f_fin), repeticiones
+    )
+    return resultados
+
+
+def _comparar(resultados, base, tolerancia):
+    # Medianas que empeoran más que tolerancia (%) respecto a la base
+    peores = []
+    for nombre, r in resultados.items():
+        previo = base.get("resultados", {}).get(nombre)
+        if previo and previo["mediana_ms"] > 0:
+            cambio = (r["mediana_ms"] / previo["mediana_ms"] - 1) * 100
+            r["cambio_%"] = round(cambio, 1)
+            if cambio > tolerancia:
+                peores.append(nombre)
+    return peores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", choices=sorted(datos.ESCALAS), default="mediana")
+    for param in datos.ESCALAS["mediana"]:
+        parser.add_argument(f"--{param}", type=int, help="reemplaza el valor de la escala")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--formato", choices=["json", "parquet"], default="json", help="FORMATO_VENTAS")
+    parser.add_argument("--latencia-ms", type=float, default=0, help="latencia simulada del Worker local")
+    parser.add_argument("--ancho-banda-kbps", type=float, default=0, help="0 = sin límite")
+    parser.add_argument("--salida", help="escribe los resultados en este JSON")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--tolerancia", type=float, default=20.0, help="%% de empeoramiento admitido")
+    args = parser.parse_args()
+
+    parametros = {k: getattr(args, k) if getattr(args, k) is not None else v for k, v in datos.ESCALAS[args.escala].items()}
+    hasta = datetime.date.today()
+    t0 = time.perf_counter()
+    objetos = datos.generar(**parametros, hasta=hasta, semilla=args.semilla)
+    generacion = time.perf_counter() - t0
+
+    red = worker_local.Red()
+    servidor, _, app = iniciar(red=red, FORMATO_VENTAS=args.formato)
+    # Compactación desactivada: guardar_ventas mide solo el camino del cobro
+    app.SEGMENTOS_MAX_SIN_COMPACTAR = 10 ** 9
+    datos.cargar(app, objetos)
+    # La red simulada solo afecta a las mediciones, no a la carga de datos
+    red.latencia_ms, red.kbps = args.latencia_ms, args.ancho_banda_kbps
+    f_ini = (pd.Timestamp(hasta) - pd.DateOffset(months=parametros["meses"] - 1)).replace(day=1).date()
+    try:
+        resultados = medir(app, f_ini, hasta, args.repeticiones)
+    finally:
+        servidor.shutdown()
+
+    informe = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "escala": args.escala,
+        "parametros": {**parametros, "semilla": args.semilla, "formato": args.formato,
+                       "latencia_ms": args.latencia_ms, "ancho_banda_kbps": args.ancho_banda_kbps},
+        "entorno": {"python": platform.python_version(), "pandas": pd.__version__, "maquina": platform.machine()},
+        "generacion_s": round(generacion, 2),
+        "resultados": resultados,
+    }
+    peores = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            peores = _comparar(resultados, json.load(f), args.tolerancia)
+
+    print(f"escala {args.escala}: {parametros} · datos generados en {generacion:.1f} s")
+    for nombre, r in resultados.items():
+        cambio = f"  ({r['cambio_%']:+.1f} %)" if "cambio_%" in r else ""
+        print(f"  {nombre:<34} mediana {r['mediana_ms']:>9.1f} ms · p95 {r['p95_ms']:>9.1f} ms{cambio}")
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+    if peores:
+        print(f"Empeoran más de {args.tolerancia:g} %: {', '.join(peores)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""app_web.py contra un Worker local (worker_local.py) en un puerto efímero.
+
+app_web se importa una sola vez por proceso (ver bench/entorno.py); cada test
+recibe un almacén vacío y las cachés de Streamlit limpias.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.entorno import iniciar, worker_local  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def entorno():
+    cola = os.path.join(tempfile.mkdtemp(prefix="tests_"), "cola_ventas.sqlite3")
+    servidor, _, app = iniciar(COLA_VENTAS_DB=cola)
+    yield servidor, app
+    servidor.shutdown()
+
+
+@pytest.fixture
+def almacen(entorno):
+    servidor, _ = entorno
+    servidor.RequestHandlerClass.almacen = worker_local.Almacen()
+    return servidor.RequestHandlerClass.almacen
+
+
+@pytest.fixture
+def app(entorno, almacen):
+    _, app = entorno
+    app.st.cache_data.clear()
+    app.st.cache_resource.clear()
+    return app
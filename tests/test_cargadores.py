@@ -0,0 +1,215 @@
+"""Paridad de los cargadores vectorizados con las versiones por fila (iterrows).
+
+Las funciones *_referencia son las del baseline, con el DataFrame como
+argumento en lugar de api_read. Las hojas de prueba llevan importes con "$" y
+",", porcentajes, celdas vacías o nulas, espacios y acentos; las filas con solo
+texto y nulos cubren la inferencia "str" de iterrows() en pandas 3, que
+convierte sus None en NaN.
+"""
+import math
+
+import pytest
+
+INGREDIENTES = [
+    {"Ingrediente": "Azúcar Glass", " Proveedor ": "Dulcería López", "Unidad de Compra": "kg",
+     "Costo de Compra": "$1,250.50", "Cantidad por Unidad de Compra": "1,000", "Unidad Receta": "g",
+     "Costo por Unidad Receta": "$1.2505"},
+    {"Ingrediente": "  Jalapeño  en  Rajas ", " Proveedor ": "", "Unidad de Compra": "lata",
+     "Costo de Compra": 38, "Cantidad por Unidad de Compra": 1, "Unidad Receta": "pieza",
+     "Costo por Unidad Receta": 38},
+    {"Ingrediente": "Crème Fraîche", " Proveedor ": None, "Unidad de Compra": None,
+     "Costo de Compra": "", "Cantidad por Unidad de Compra": None, "Unidad Receta": "ml",
+     "Costo por Unidad Receta": "0.35"},
+    {"Ingrediente": "Harina", " Proveedor ": "Molino", "Unidad de Compra": "kg",
+     "Costo de Compra": "no sé", "Cantidad por Unidad de Compra": "1000", "Unidad Receta": "g",
+     "Costo por Unidad Receta": 0.028},
+    {"Ingrediente": "", " Proveedor ": "Fantasma", "Unidad de Compra": "kg",
+     "Costo de Compra": 1, "Cantidad por Unidad de Compra": 1, "Unidad Receta": "g",
+     "Costo por Unidad Receta": 1},
+]
+
+# Tabla ancha: ingrediente × producto; "Betún" es sub-receta de "Pastel"
+RECETAS = [
+    {"Ingrediente": "Azúcar Glass", "Betún": "120", "Pastel": "", "Café": None},
+    {"Ingrediente": "Crème Fraîche", "Betún": "$80.5", "Pastel": 0, "Café": "30"},
+    {"Ingrediente": "Harina", "Betún": None, "Pastel": "1,200", "Café": ""},
+    {"Ingrediente": "Betún", "Betún": "", "Pastel": "0.5", "Café": "x"},
+    {"Ingrediente": "  Jalapeño  en  Rajas ", "Betún": "", "Pastel": "", "Café": 1},
+    {"Ingrediente": "__MODS__", "Betún": None, "Pastel": "Extra Betún, Vela ,", "Café": "Leche Vegetal"},
+]
+
+MODIFICADORES = [
+    {"Modificador": "Vela", "Precio Extra": 5, "Ingrediente Base": "", "Cantidad": 0},
+    {"Modificador": "Extra Betún", "Precio Extra": 15.5, "Ingrediente Base": "Betún", "Cantidad": "0.25"},
+    {"Modificador": "Extra Betún", "Precio Extra": 15.5, "Ingrediente Base": "Azúcar Glass", "Cantidad": "10"},
+    {"Modificador": "Leche Vegetal", "Precio Extra": 12, "Ingrediente Base": "Crème Fraîche", "Cantidad": "$20"},
+    {"Modificador": "Leche Vegetal", "Precio Extra": 12, "Ingrediente Base": None, "Cantidad": 3},
+    {"Modificador": None, "Precio Extra": 1, "Ingrediente Base": "Harina", "Cantidad": 1},
+    {"Modificador": "Salsa", "Precio Extra": "8", "Ingrediente Base": "Jalapeño", "Cantidad": None},
+]
+
+INVENTARIO = [
+    {"Ingrediente": "Azúcar Glass", "Stock Actual": "2,500", "Stock Mínimo": "500", "Stock Máximo": "$5,000"},
+    {"Ingrediente": " Harina ", "Stock Actual": 12.25, "Stock Mínimo": "", "Stock Máximo": None},
+    {"Ingrediente": "Crème Fraîche", "Stock Actual": "", "Stock Mínimo": "10%", "Stock Máximo": 40},
+    {"Ingrediente": "Jalapeño", "Stock Actual": "7", "Stock Mínimo": None, "Stock Máximo": ""},
+    {"Ingrediente": "", "Stock Actual": 99, "Stock Mínimo": 1, "Stock Máximo": 2},
+    {"Ingrediente": None, "Stock Actual": 99, "Stock Mínimo": 1, "Stock Máximo": 2},
+]
+
+PRECIOS = [
+    {"Producto": "Pastel", "Precio Venta": "$450.00", "Margen Bruto": "$210.5", "Margen Bruto (%)": "46.8%"},
+    {"Producto": " Café ", "Precio Venta": 45, "Margen Bruto": "", "Margen Bruto (%)": None},
+    {"Producto": "Betún", "Precio Venta": "1,000", "Margen Bruto": "n/d", "Margen Bruto (%)": 12.5},
+    {"Producto": "Té Chai", "Precio Venta": "$40", "Margen Bruto": None, "Margen Bruto (%)": "12%"},
+    {"Producto": "", "Precio Venta": 1, "Margen Bruto": 1, "Margen Bruto (%)": 1},
+]
+
+
+# --- Referencias: baseline por fila ---
+def ingredientes_referencia(app, df):
+    df.columns = df.columns.str.strip()
+    ingredientes = []
+    for _, r in df.iterrows():
+        if not r.get("Ingrediente"): continue
+        ingredientes.append({
+            "nombre": r["Ingrediente"],
+            "proveedor": r.get("Proveedor", ""),
+            "unidad_compra": r.get("Unidad de Compra", ""),
+            "costo_compra": app.clean_and_convert_float(r.get("Costo de Compra")),
+            "cantidad_compra": app.clean_and_convert_float(r.get("Cantidad por Unidad de Compra")),
+            "unidad_receta": r.get("Unidad Receta", ""),
+            "costo_receta": app.clean_and_convert_float(r.get("Costo por Unidad Receta")),
+            "nombre_normalizado": app.normalizar_texto(r["Ingrediente"])
+        })
+    return ingredientes
+
+
+def recetas_referencia(app, df, mapa_costos):
+    recetas = {}
+    if df.empty or "Ingrediente" not in df.columns: return recetas
+    productos = [c for c in df.columns if c not in ["Ingrediente", "ModificadoresValidos"]]
+    for p in productos:
+        recetas[p] = {"ingredientes": {}, "costo_total": 0, "modificadores_validos": []}
+    for _, r in df.iterrows():
+        ing = r["Ingrediente"]
+        if ing == "__MODS__":
+            for p in productos:
+                val = str(r.get(p, ""))
+                if val and val != "nan":
+                    recetas[p]["modificadores_validos"] = [x.strip() for x in val.split(",") if x.strip()]
+            continue
+        for p in productos:
+            cant = app.clean_and_convert_float(r[p])
+            if cant > 0:
+                recetas[p]["ingredientes"][ing] = cant
+    for p in recetas:
+        for ing, c in recetas[p]["ingredientes"].items():
+            recetas[p]["costo_total"] += mapa_costos.get(ing, 0) * c
+    # Segunda pasada (sub-recetas de un nivel)
+    for p in recetas:
+        costo_recalc = 0
+        for ing, c in recetas[p]["ingredientes"].items():
+            val = mapa_costos.get(ing, 0)
+            if val == 0 and ing in recetas:
+                val = recetas[ing]["costo_total"]
+            costo_recalc += val * c
+        if costo_recalc > 0:
+            recetas[p]["costo_total"] = costo_recalc
+    return recetas
+
+
+def modificadores_referencia(app, df):
+    modificadores = {}
+    if df.empty: return modificadores
+    if "Modificador" in df.columns:
+        for mod_name, group in df.groupby("Modificador"):
+            modificadores[mod_name] = {
+                "precio_extra": float(group.iloc[0].get("Precio Extra", 0)),
+                "ingredientes": {}
+            }
+            for _, r in group.iterrows():
+                ing = r.get("Ingrediente Base")
+                cant = app.clean_and_convert_float(r.get("Cantidad"))
+                if ing and cant > 0:
+                    modificadores[mod_name]["ingredientes"][ing] = cant
+    return modificadores
+
+
+def inventario_referencia(app, df):
+    inventario = {}
+    for _, fila in df.iterrows():
+        nombre = str(fila.get('Ingrediente', '')).strip()
+        if not nombre: continue
+        inventario[nombre] = {
+            'stock_actual': app.clean_and_convert_float(fila.get('Stock Actual')),
+            'min': app.clean_and_convert_float(fila.get('Stock Mínimo')),
+            'max': app.clean_and_convert_float(fila.get('Stock Máximo'))
+        }
+    return inventario
+
+
+def precios_referencia(app, df):
+    precios = {}
+    for _, row in df.iterrows():
+        producto = str(row.get('Producto', '')).strip()
+        if not producto: continue
+        precios[producto] = {
+            'precio_venta': app.clean_and_convert_float(row.get('Precio Venta')),
+            'margen': app.clean_and_convert_float(row.get('Margen Bruto')),
+            'margen_porc': app.clean_and_convert_float(row.get('Margen Bruto (%)'))
+        }
+    return precios
+
+
+# --- Comparación ---
+def _igual(a, b):
+    # Estructura, tipos y valores idénticos; NaN solo es igual a NaN
+    if isinstance(a, dict) and isinstance(b, dict):
+        return list(a) == list(b) and all(_igual(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_igual(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a):
+        return math.isnan(b)
+    return a == b and type(a) is type(b)
+
+
+@pytest.fixture
+def hojas(app):
+    for endpoint, filas in [(app.R2_INGREDIENTES, INGREDIENTES), (app.R2_RECETAS, RECETAS),
+                            (app.R2_MODIFICADORES, MODIFICADORES), (app.R2_INVENTARIO, INVENTARIO),
+                            (app.R2_PRECIOS, PRECIOS)]:
+        app._api_put(endpoint, filas)
+    # La misma hoja que recibe el cargador, parseada aparte para la referencia
+    return lambda endpoint: app._api_get_df(endpoint)
+
+
+def test_ingredientes(app, hojas):
+    assert _igual(app.leer_ingredientes_base(), ingredientes_referencia(app, hojas(app.R2_INGREDIENTES)))
+
+
+def test_recetas(app, hojas):
+    mapa = {i["nombre"]: i["costo_receta"] for i in ingredientes_referencia(app, hojas(app.R2_INGREDIENTES))}
+    esperado = recetas_referencia(app, hojas(app.R2_RECETAS), mapa)
+    assert esperado["Pastel"]["ingredientes"]["Betún"] == 0.5  # la fixture sí ejercita sub-recetas
+    assert _igual(app.leer_recetas(), esperado)
+
+
+def test_modificadores(app, hojas):
+    assert _igual(app.leer_modificadores(), modificadores_referencia(app, hojas(app.R2_MODIFICADORES)))
+
+
+def test_inventario(app, hojas):
+    # Sin movimientos en el libro el stock es el de la tabla (corte inicial)
+    assert _igual(app.leer_inventario(), inventario_referencia(app, hojas(app.R2_INVENTARIO)))
+
+
+def test_precios(app, hojas):
+    assert _igual(app.leer_precios_desglose(), precios_referencia(app, hojas(app.R2_PRECIOS)))
+
+
+def test_hojas_vacias(app):
+    assert app.leer_ingredientes_base() == []
+    assert app.leer_recetas() == {}
+    assert app.leer_modificadores() == {}
+    assert app.leer_precios_desglose() == {}
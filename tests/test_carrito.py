@@ -0,0 +1,11 @@
+def test_callbacks_del_carrito_usan_el_id_de_la_linea(app):
+    app.st.session_state.clear()
+    app.st.session_state.carrito = [{"Id": "a", "Producto": "Producto 1", "Cantidad": 1},
+                                     {"Id": "b", "Producto": "Producto 2", "Cantidad": 1}]
+    # Botones dibujados con el carrito de dos líneas; se quita la primera y
+    # luego llega el clic de ➕ de la segunda
+    app._quitar_del_carrito("a")
+    app._cambiar_cantidad_carrito("b", 1)
+    app._quitar_del_carrito("a")  # doble clic: ya no está
+    assert app.st.session_state.carrito == [{"Id": "b", "Producto": "Producto 2", "Cantidad": 2}]
+    app.st.session_state.clear()
@@ -0,0 +1,94 @@
+import datetime
+import json
+import threading
+import time
+from contextlib import closing
+
+import requests
+
+FECHA = datetime.date(2026, 10, 15)
+
+
+def _cobro():
+    return [{
+        "Fecha": "15/10/2026", "Producto": "Producto 1", "Cantidad": 1, "Precio Unitario": 50.0,
+        "Descuento (%)": 0, "Costo Total": 20.0, "Forma Pago": "Efectivo", "Modificadores": [],
+    }]
+
+
+def _esperar(condicion, segundos=5):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite
+        time.sleep(0.02)
+
+
+def test_fallo_del_enviador_se_reporta(app, monkeypatch):
+    def falla():
+        raise RuntimeError("base bloqueada")
+    monkeypatch.setattr(app, "_enviar_cola", falla)
+    enviador = app._enviador_cola()
+    enviador["evento"].set()
+    _esperar(lambda: enviador["error"])
+    assert app.ventas_pendientes()[1] == "RuntimeError: base bloqueada"
+
+    # Una pasada buena lo limpia
+    monkeypatch.setattr(app, "_enviar_cola", lambda: None)
+    enviador["evento"].set()
+    _esperar(lambda: enviador["error"] is None)
+    assert app.ventas_pendientes() == (0, None)
+
+
+def test_esquema_de_la_cola_se_crea_una_vez(app, monkeypatch):
+    llamadas = []
+    crear = app._crear_cola
+    monkeypatch.setattr(app, "_crear_cola", lambda: llamadas.append(1) or crear())
+    monkeypatch.setattr(app, "_enviar_cola", lambda: None)  # que no se vacíe mientras se cuenta
+    app.encolar_venta(_cobro(), FECHA)
+    for _ in range(3):
+        assert app.ventas_pendientes()[0] >= 1
+    assert len(llamadas) == 1
+    with closing(app._cola_db()) as con, con:  # que no lo suba un enviador de otro test
+        con.execute("DELETE FROM cola_ventas")
+
+
+def test_invalidacion_desde_hilo_de_fondo_espera_al_rerun(app, monkeypatch):
+    app._subir_ventas(_cobro(), FECHA, "a")
+    assert len(app.leer_ventas_df()) == 1
+
+    monkeypatch.setattr(app, "_hilo_de_fondo", lambda: True)
+    app._subir_ventas(_cobro(), FECHA, "b")
+    assert app.R2_VENTAS in app._estado_api()["por_limpiar"]
+    assert len(app.leer_ventas_df()) == 1  # sin tocar las cachés desde el hilo
+
+    monkeypatch.setattr(app, "_hilo_de_fondo", lambda: False)
+    app.aplicar_invalidaciones()
+    assert not app._estado_api()["por_limpiar"]
+    assert len(app.leer_ventas_df()) == 2
+
+
+def test_fallo_al_leer_recetas_deja_el_cobro_en_cola(app, almacen, monkeypatch):
+    app._api_put(app.R2_RECETAS, [{"Ingrediente": "Harina", "Producto 1": 2}])
+    app.leer_recetas()  # catálogo caliente en la caché: el envío no debe usarlo
+    enviador = {"evento": threading.Event(), "error": None}
+    app._crear_cola()
+    monkeypatch.setattr(app, "_enviador_cola", lambda: enviador)  # sin hilo: el test envía
+
+    leer = app._api_get_df
+    def falla_recetas(endpoint):
+        if endpoint == app.R2_RECETAS:
+            raise requests.ConnectionError("sin red")
+        return leer(endpoint)
+    monkeypatch.setattr(app, "_api_get_df", falla_recetas)
+    app.encolar_venta(_cobro(), FECHA)
+    app._enviar_cola()
+    assert app.ventas_pendientes()[0] == 1
+    assert almacen.leer(f"{app.R2_INVENTARIO_MOVIMIENTOS}/2026-10") is None
+
+    monkeypatch.setattr(app, "_api_get_df", leer)
+    with closing(app._cola_db()) as con, con:
+        con.execute("UPDATE cola_ventas SET proximo = 0")
+    app._enviar_cola()
+    assert app.ventas_pendientes() == (0, None)
+    movimientos = json.loads(almacen.leer(f"{app.R2_INVENTARIO_MOVIMIENTOS}/2026-10")[0])
+    assert [(m["Ingrediente"], m["Cantidad"]) for m in movimientos] == [("Harina", -2.0)]
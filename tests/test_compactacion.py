@@ -0,0 +1,71 @@
+import datetime
+
+import pandas as pd
+import requests
+
+FECHA = datetime.date(2026, 10, 15)
+
+
+def _cobro(producto="Producto 1", fecha="15/10/2026"):
+    return [{
+        "Fecha": fecha, "Producto": producto, "Cantidad": 1, "Precio Unitario": 50.0,
+        "Descuento (%)": 0, "Costo Total": 20.0, "Forma Pago": "Efectivo", "Modificadores": [],
+    }]
+
+
+def test_unir_segmentos_descarta_solo_las_lineas_ya_compactadas(app):
+    base = pd.DataFrame({"Id Venta": ["a", "b"], "Producto": ["x", "y"]})
+    # Un segmento puede mezclar líneas ya integradas y nuevas
+    segmento = pd.DataFrame({"Id Venta": ["b", "c"], "Producto": ["y", "z"]})
+    unidas = app._unir_segmentos(base, [segmento, pd.DataFrame()])
+    assert unidas["Id Venta"].tolist() == ["a", "b", "c"]
+
+
+def test_compactar_borra_los_segmentos_integrados(app, almacen, monkeypatch):
+    monkeypatch.setattr(app, "SEGMENTOS_MAX_SIN_COMPACTAR", 10 ** 9)
+    for n in range(3):
+        app._subir_ventas(_cobro(), FECHA, f"v{n}")
+    segmentos = [f"ventas/2026-10/v{n}" for n in range(3)]
+    assert all(almacen.leer(s) for s in segmentos)
+
+    assert app.compactar_ventas()
+    assert not any(almacen.leer(s) for s in segmentos)
+    manifiesto = app._api_get(app.R2_VENTAS_MANIFIESTO)
+    assert [m["Objeto"] for m in manifiesto] == ["ventas/2026-10"]
+    assert len(app._leer_ventas_crudas()) == 3
+
+
+def test_lineas_sin_fecha_valida_sobreviven_a_la_compactacion(app, almacen, monkeypatch):
+    monkeypatch.setattr(app, "SEGMENTOS_MAX_SIN_COMPACTAR", 10 ** 9)
+    app._subir_ventas(_cobro(), FECHA, "ok")
+    app._subir_ventas(_cobro(fecha="32/13/2026"), FECHA, "rara")
+    assert almacen.leer(f"ventas/{app.PARTICION_SIN_FECHA}/rara")
+
+    assert app.compactar_ventas()
+    manifiesto = {m["Objeto"]: m for m in app._api_get(app.R2_VENTAS_MANIFIESTO)}
+    assert set(manifiesto) == {"ventas/2026-10", f"ventas/{app.PARTICION_SIN_FECHA}"}
+    crudas = app._leer_ventas_crudas()
+    assert sorted(crudas["Id Venta"]) == ["ok", "rara"]
+    # Sin fecha no cuenta en el resumen ni dispara su reconstrucción
+    assert app.leer_resumen_ventas()["Lineas"].sum() == 1
+
+
+def test_migracion_del_historico_se_puede_reintentar(app, almacen, monkeypatch):
+    app._api_put(app.R2_VENTAS, [
+        {**_cobro()[0], "Fecha": "03/09/2026"}, {**_cobro()[0], "Fecha": "15/10/2026"},
+        {**_cobro()[0], "Fecha": "15/10/2026"}, {**_cobro("Producto 2")[0], "Fecha": "20/10/2026"},
+    ])
+    actualizar = app._actualizar_objeto
+    def falla_manifiesto(endpoint, *args, **kwargs):
+        if endpoint == app.R2_VENTAS_MANIFIESTO:
+            raise requests.ConnectionError("sin red")
+        return actualizar(endpoint, *args, **kwargs)
+    monkeypatch.setattr(app, "_actualizar_objeto", falla_manifiesto)
+    assert not app.compactar_ventas()
+    assert almacen.leer("ventas/2026-10")  # las bases ya se escribieron
+
+    monkeypatch.setattr(app, "_actualizar_objeto", actualizar)
+    assert app.compactar_ventas()
+    crudas = app._leer_ventas_crudas()
+    assert len(crudas) == 4
+    assert sorted(crudas["Id Venta"]) == [f"legado-{n}" for n in range(4)]
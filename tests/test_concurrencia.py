@@ -0,0 +1,17 @@
+from bench import concurrencia
+
+
+def test_terminales_en_paralelo_no_pierden_lineas(app, almacen, monkeypatch):
+    # bench/concurrencia.py en pequeño: 4 terminales × 5 cobros
+    monkeypatch.setattr(app, "SEGMENTOS_MAX_SIN_COMPACTAR", 10 ** 9)
+    r = concurrencia.correr(app, almacen, terminales=4, cobros=5)
+
+    assert r["errores"] == []
+    assert r["ids"] == {f"t{t}-{n}" for t in range(4) for n in range(5)}
+    assert r["lineas"] == r["leidas"] == r["reparado"] == 20
+    assert concurrencia.completo(r)
+
+    # Tras compactar, el manifiesto solo tiene la partición del mes, sin segmentos sueltos
+    manifiesto = app.json.loads(almacen.leer(app.R2_VENTAS_MANIFIESTO)[0])
+    assert {m.get("Tipo", "segmento") for m in manifiesto} == {"particion"}
+    assert sum(m["Filas"] for m in manifiesto) == 20
@@ -0,0 +1,42 @@
+ESTRUCTURA = {
+    "Masa": {"Harina": 2, "Agua": 1},
+    "Relleno": {"Queso": 0.5},
+    "Pizza": {"Masa": 1, "Relleno": 2, "Salsa": 0.1},
+    "Combo": {"Pizza": 2, "Refresco": 1},
+}
+COSTOS = {"Harina": 10, "Agua": 1, "Queso": 40, "Salsa": 30, "Refresco": 15}
+
+
+def test_sub_recetas_a_varios_niveles(app):
+    costos = app.costear_recetas(ESTRUCTURA, COSTOS)
+    assert costos["Masa"] == 21
+    assert costos["Relleno"] == 20
+    assert costos["Pizza"] == 21 + 2 * 20 + 3
+    assert costos["Combo"] == 2 * 64 + 15
+    assert app.ciclos_recetas() == []
+
+
+def test_ciclo_se_reporta_y_no_rompe_el_costeo(app):
+    estructura = {"A": {"B": 1, "X": 1}, "B": {"A": 1, "Y": 1}, "C": {"A": 2}}
+    costos = app.costear_recetas(estructura, {"X": 5, "Y": 7})
+    [ciclo] = app.ciclos_recetas()
+    assert set(ciclo) == {"A", "B"}
+    # Una de las dos aristas del ciclo cuenta 0: la otra receta suma la primera
+    assert sorted([costos["A"], costos["B"]]) in ([5, 12], [7, 12])
+    assert costos["C"] == 2 * costos["A"]
+
+
+def test_solo_se_recalculan_las_recetas_que_usan_el_insumo(app):
+    app.costear_recetas(ESTRUCTURA, COSTOS)
+    assert app._motor_costos()["recalculadas"] == len(ESTRUCTURA)
+
+    costos = app.costear_recetas(ESTRUCTURA, {**COSTOS, "Queso": 50})
+    assert app._motor_costos()["recalculadas"] == 3  # Relleno, Pizza y Combo; Masa no
+    assert costos["Masa"] == 21
+    assert costos["Relleno"] == 25
+    assert costos["Combo"] == 2 * (21 + 2 * 25 + 3) + 15
+
+    app.costear_recetas(ESTRUCTURA, {**COSTOS, "Queso": 50, "Refresco": 20})
+    assert app._motor_costos()["recalculadas"] == 1
+    app.costear_recetas(ESTRUCTURA, {**COSTOS, "Queso": 50, "Refresco": 20})
+    assert app._motor_costos()["recalculadas"] == 0
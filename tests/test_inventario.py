@@ -0,0 +1,53 @@
+import json
+
+import pandas as pd
+
+
+def _movimiento(fecha, cantidad, referencia, ingrediente="Harina"):
+    return {"Fecha": pd.Timestamp(fecha), "Ingrediente": ingrediente, "Cantidad": cantidad,
+            "Tipo": "venta", "Referencia": referencia}
+
+
+def _fechas_cortes(almacen, app):
+    return sorted({c["Fecha"][:10] for c in json.loads(almacen.leer(app.R2_INVENTARIO_CORTES)[0])})
+
+
+def test_leer_inventario_no_escribe(app, almacen):
+    app._api_put(app.R2_INVENTARIO, [{"Ingrediente": "Harina", "Stock Actual": 10, "Stock Mínimo": 1, "Stock Máximo": 20}])
+    assert app.leer_inventario()["Harina"]["stock_actual"] == 10.0
+    assert almacen.leer(app.R2_INVENTARIO_CORTES) is None
+
+    # El primer movimiento fija el corte inicial
+    app.registrar_movimientos([_movimiento(pd.Timestamp.now(), -4, "a")])
+    assert almacen.leer(app.R2_INVENTARIO_CORTES) is not None
+    assert app.leer_inventario()["Harina"]["stock_actual"] == 6.0
+
+
+def test_cortes_mensuales_en_memoria_hasta_guardarlos(app, almacen):
+    app._api_put(app.R2_INVENTARIO_CORTES, [
+        {"Fecha": "2026-08-10T00:00:00", "Ingrediente": "Harina", "Stock": 10},
+        {"Fecha": "2026-08-10T00:00:00", "Ingrediente": "", "Stock": 0},
+    ])
+    app.registrar_movimientos([_movimiento("2026-08-20", -2, "a"), _movimiento("2026-09-15", -3, "b")])
+
+    assert app.leer_inventario()["Harina"]["stock_actual"] == 5.0
+    assert app.leer_inventario("2026-09-01")["Harina"]["stock_actual"] == 8.0
+    assert _fechas_cortes(almacen, app) == ["2026-08-10"]
+
+    assert app.guardar_cortes(pd.Timestamp("2026-10-16")) == 4
+    assert _fechas_cortes(almacen, app) == ["2026-08-10", "2026-09-01", "2026-10-01"]
+    assert app.guardar_cortes(pd.Timestamp("2026-10-16")) == 0
+    assert app.leer_inventario()["Harina"]["stock_actual"] == 5.0
+
+
+def test_ajuste_usa_el_stock_sin_cache(app, monkeypatch):
+    app._api_put(app.R2_INVENTARIO, [{"Ingrediente": "Harina", "Stock Actual": 10, "Stock Mínimo": 1, "Stock Máximo": 20}])
+    app.registrar_movimientos([_movimiento(pd.Timestamp.now(), -4, "a")])
+    assert app.leer_inventario()["Harina"]["stock_actual"] == 6.0
+
+    # Otro terminal descuenta: esta caché no se entera
+    with monkeypatch.context() as m:
+        m.setattr(app, "invalidar_dataset", lambda endpoint: None)
+        app.registrar_movimientos([_movimiento(pd.Timestamp.now(), -3, "b")])
+    assert app.leer_inventario()["Harina"]["stock_actual"] == 6.0
+    assert app.stock_al_dia("Harina") == 3.0
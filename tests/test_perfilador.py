@@ -0,0 +1,31 @@
+import threading
+import time
+
+
+def test_perfiles_del_mismo_segundo_no_se_pisan(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "PERFILES_DIR", str(tmp_path))
+    app.st.session_state.clear()
+    for _ in range(3):
+        app._guardar_perfil({"_rerun;main": 1}, 1500.0)
+    assert len(app.listar_perfiles()) == 3
+
+
+def test_muestras_fuera_de_rerun_se_descartan(app, monkeypatch):
+    monkeypatch.setattr(app, "INTERVALO_MUESTREO_MS", 1)
+    listo, fin = threading.Event(), threading.Event()
+
+    def fuera_de_rerun():
+        listo.set()
+        fin.wait(5)
+    hilo = threading.Thread(target=fuera_de_rerun)
+    hilo.start()
+    listo.wait()
+    pilas, detener = {}, threading.Event()
+    muestreo = threading.Thread(target=app._muestrear, args=(hilo.ident, pilas, detener))
+    muestreo.start()
+    time.sleep(0.05)
+    detener.set()
+    muestreo.join()
+    fin.set()
+    hilo.join()
+    assert pilas == {}
@@ -0,0 +1,63 @@
+import datetime
+import json
+import logging
+
+import requests
+
+FECHA = datetime.date(2026, 10, 15)
+
+
+def _cobro(fecha="15/10/2026", producto="Producto 1"):
+    return [{
+        "Fecha": fecha, "Producto": producto, "Cantidad": 1, "Precio Unitario": 50.0,
+        "Descuento (%)": 0, "Costo Total": 20.0, "Forma Pago": "Efectivo", "Modificadores": [],
+    }]
+
+
+def _lineas(almacen, app, particion):
+    return sum(r["Lineas"] for r in json.loads(almacen.leer(app._objeto_resumen(particion))[0]))
+
+
+def test_leer_resumen_no_escribe(app, almacen):
+    app._subir_ventas(_cobro(), FECHA, "a")
+    app._subir_ventas(_cobro("03/09/2026"), FECHA, "b")
+    assert app.leer_resumen_ventas()["Lineas"].sum() == 2
+    assert not [c for c in almacen.objetos if c.startswith(app.R2_VENTAS_RESUMEN)]
+
+    assert app.reparar_resumen() == 2
+    assert _lineas(almacen, app, "2026-09") == _lineas(almacen, app, "2026-10") == 1
+
+
+def test_cobro_actualiza_solo_el_resumen_de_su_mes(app, almacen):
+    app._subir_ventas(_cobro(), FECHA, "a")
+    app._subir_ventas(_cobro("03/09/2026"), FECHA, "b")
+    app.reparar_resumen()
+    septiembre = almacen.leer(app._objeto_resumen("2026-09"))
+
+    app._subir_ventas(_cobro(producto="Producto 2"), FECHA, "c")
+    assert almacen.leer(app._objeto_resumen("2026-09")) == septiembre
+    assert _lineas(almacen, app, "2026-10") == 2
+    assert app.reparar_resumen() == 0
+    assert app.leer_resumen_ventas()["Lineas"].sum() == 3
+
+
+def test_fallo_al_acumular_se_registra_y_se_repara(app, almacen, monkeypatch, caplog):
+    app._subir_ventas(_cobro(), FECHA, "a")
+    assert app.compactar_ventas()
+    app.reparar_resumen()
+
+    actualizar = app._actualizar_objeto
+    def falla_resumen(endpoint, *args, **kwargs):
+        if endpoint.startswith(app.R2_VENTAS_RESUMEN):
+            raise requests.ConnectionError("sin red")
+        return actualizar(endpoint, *args, **kwargs)
+    monkeypatch.setattr(app, "_actualizar_objeto", falla_resumen)
+    with caplog.at_level(logging.ERROR, logger="bonbon_peach"):
+        app._subir_ventas(_cobro(), FECHA, "b")
+    assert "2026-10" in caplog.text
+
+    # El mes ya no cuadra con el manifiesto: se lee bien y se rehace al reparar
+    assert app._meses_resumen() == (["2026-10"], ["2026-10"])
+    assert app.leer_resumen_ventas()["Lineas"].sum() == 2
+    assert app.reparar_resumen() == 1
+    assert _lineas(almacen, app, "2026-10") == 2
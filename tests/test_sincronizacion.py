@@ -0,0 +1,102 @@
+import datetime
+
+import pytest
+
+FECHA = datetime.date(2026, 10, 15)
+
+
+def _cobro(producto="Producto 1"):
+    return [{
+        "Fecha": "15/10/2026", "Producto": producto, "Cantidad": 1, "Precio Unitario": 50.0,
+        "Descuento (%)": 0, "Costo Total": 20.0, "Forma Pago": "Efectivo", "Modificadores": [],
+    }]
+
+
+@pytest.fixture
+def cargas(app, monkeypatch):
+    # Cuenta las cargas completas (las que no son delta)
+    llamadas = []
+    original = app._leer_ventas_crudas
+    def contar(*args, **kwargs):
+        llamadas.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(app, "_leer_ventas_crudas", contar)
+    return llamadas
+
+
+def _ids(copia):
+    return sorted(copia["df"]["Id Venta"])
+
+
+def test_delta_se_agrega_y_descarta_repetidos(app, cargas):
+    copia = app._copia_ventas()
+    app._subir_ventas(_cobro(), FECHA, "a")
+    app._sincronizar_ventas(copia)
+    assert _ids(copia) == ["a"] and len(cargas) == 1
+
+    app._subir_ventas(_cobro(), FECHA, "b")
+    app._sincronizar_ventas(copia)
+    assert _ids(copia) == ["a", "b"] and len(cargas) == 1
+
+    # Un reintento reescribe el mismo segmento: el delta lo trae de nuevo
+    app._subir_ventas(_cobro(), FECHA, "b")
+    app._sincronizar_ventas(copia)
+    assert _ids(copia) == ["a", "b"] and len(cargas) == 1
+
+
+def test_lo_escrito_durante_la_carga_completa_no_se_duplica(app, monkeypatch):
+    copia = app._copia_ventas()
+    original = app._leer_ventas_crudas
+    def con_cobro_en_medio(*args, **kwargs):
+        # Llega después de pedir la marca, antes de leer el histórico
+        app._subir_ventas(_cobro(), FECHA, "b")
+        return original(*args, **kwargs)
+    app._subir_ventas(_cobro(), FECHA, "a")
+    monkeypatch.setattr(app, "_leer_ventas_crudas", con_cobro_en_medio)
+    app._sincronizar_ventas(copia)
+    monkeypatch.setattr(app, "_leer_ventas_crudas", original)
+    assert _ids(copia) == ["a", "b"]
+
+    app._sincronizar_ventas(copia)
+    assert _ids(copia) == ["a", "b"]
+
+
+@pytest.mark.parametrize("marca", [None, "", "abc", "-1"])
+def test_sin_marca_valida_recarga_completa(app, cargas, monkeypatch, marca):
+    copia = app._copia_ventas()
+    app._subir_ventas(_cobro(), FECHA, "a")
+    app._sincronizar_ventas(copia)
+
+    peticion = app._peticion
+    def sin_marca(metodo, endpoint, **kwargs):
+        r = peticion(metodo, endpoint, **kwargs)
+        if endpoint == app.R2_VENTAS_CAMBIOS:
+            del r.headers["X-Marca"]
+            if marca is not None:
+                r.headers["X-Marca"] = marca
+        return r
+    monkeypatch.setattr(app, "_peticion", sin_marca)
+    app._subir_ventas(_cobro(), FECHA, "b")
+    app._sincronizar_ventas(copia)
+    assert _ids(copia) == ["a", "b"]
+    assert len(cargas) == 2 and copia["marca"] is None
+
+
+def test_recarga_completa_no_usa_el_manifiesto_cacheado(app, monkeypatch):
+    copia = app._copia_ventas()
+    app._subir_ventas(_cobro(), FECHA, "a")
+    app._sincronizar_ventas(copia)
+    app.leer_resumen_ventas()  # el manifiesto queda en la caché de este terminal
+
+    # Otro terminal cobra: este proceso no invalida sus cachés
+    def otro_terminal(id_venta):
+        with monkeypatch.context() as m:
+            m.setattr(app, "invalidar_dataset", lambda endpoint: None)
+            app._subir_ventas(_cobro(), FECHA, id_venta)
+
+    otro_terminal("b")
+    copia["cargada"] = float("-inf")  # toca recarga completa
+    app._sincronizar_ventas(copia)
+    otro_terminal("c")
+    app._sincronizar_ventas(copia)
+    assert _ids(copia) == ["a", "b", "c"]
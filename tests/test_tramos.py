@@ -0,0 +1,56 @@
+import threading
+import types
+
+import pytest
+
+
+@pytest.fixture
+def sesion(app, monkeypatch):
+    # Hilo del script simulado: get_script_run_ctx devuelve un contexto falso
+    contexto = types.SimpleNamespace(fragment_ids_this_run=[])
+    monkeypatch.setattr(app, "get_script_run_ctx", lambda suppress_warning=False: contexto)
+    app.st.session_state.clear()
+    yield contexto
+    app.st.session_state.clear()
+
+
+def _nombres(app):
+    return [t["Tramo"] for t in app.st.session_state["tramos_ultimo_rerun"]["tramos"]]
+
+
+def test_tramos_de_callbacks_entran_en_el_rerun(app, sesion, monkeypatch):
+    monkeypatch.setattr(app, "_rerun", lambda: app.leer_modificadores())
+    app.leer_recetas()  # un callback: corre antes de main
+    app.main()
+    assert _nombres(app) == ["leer_recetas", "leer_modificadores"]
+    assert "_tramos_rerun" not in app.st.session_state
+
+
+def test_rerun_de_fragmento_publica_sus_tramos(app, sesion):
+    @app.medido(tipo="fragmento")
+    def fragmento():
+        app.leer_recetas()
+
+    sesion.fragment_ids_this_run = ["f"]
+    app.leer_modificadores()  # callback del fragmento
+    fragmento()
+    assert _nombres(app) == ["leer_modificadores", "fragmento"]
+    assert [h["Tramo"] for h in app.st.session_state["tramos_ultimo_rerun"]["tramos"][1]["hijos"]] == ["leer_recetas"]
+    assert "_tramos_rerun" not in app.st.session_state
+
+
+def test_hilos_en_paralelo_juntan_en_la_lista_del_script(app, sesion, monkeypatch):
+    barrera = threading.Barrier(3)
+
+    @app.medido
+    def tarea():
+        barrera.wait(5)  # que los tres cierren su tramo a la vez
+
+    # Leerla no la crea: la abre el hilo del script antes de lanzar el pool
+    assert app._tramos_del_rerun() is None
+    assert "_tramos_rerun" not in app.st.session_state
+
+    monkeypatch.setattr(app, "add_script_run_ctx", lambda hilo, ctx: hilo)  # el contexto falso ya es global
+    monkeypatch.setattr(app, "_rerun", lambda: app._ejecutar_en_paralelo([tarea] * 3))
+    app.main()
+    assert _nombres(app) == ["tarea"] * 3
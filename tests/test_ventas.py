@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+FECHA = datetime.date(2026, 10, 15)
+
+
+def _cobro(producto="Producto 1", mods=()):
+    return [{
+        "Fecha": "15/10/2026", "Producto": producto, "Cantidad": 2, "Precio Unitario": 50.0,
+        "Descuento (%)": 0, "Costo Total": 20.0, "Forma Pago": "Efectivo",
+        "Modificadores": [{"nombre": m, "precio": 5.0, "cantidad": 1, "costo": 1.0} for m in mods],
+    }]
+
+
+def test_tablas_de_ventas_son_de_solo_lectura(app):
+    app._subir_ventas(_cobro(mods=["Vela"]), FECHA, "a")
+    lineas = app.leer_ventas_df()
+    mods = app.leer_modificadores_ventas()
+
+    with pytest.raises(ValueError):
+        lineas.loc[0, "Cantidad"] = 99
+    with pytest.raises(ValueError):
+        lineas.loc[0, "Producto"] = "Producto 1"
+    with pytest.raises(ValueError):
+        mods.loc[0, "Cantidad"] = 99
+
+    # Columnas nuevas o reemplazadas quedan en la vista, no en la caché compartida
+    lineas["Extra"] = 1
+    lineas["Cantidad"] = lineas["Cantidad"] * 10
+    otra = app.leer_ventas_df()
+    assert "Extra" not in otra.columns
+    assert otra["Cantidad"].tolist() == [2]
+
+
+def test_modificadores_enlazados_por_venta_y_linea(app):
+    app._subir_ventas(_cobro(mods=["Vela"]), FECHA, "a")
+    app._subir_ventas(_cobro("Producto 2") + _cobro("Producto 3", mods=["Vela", "Chispas"]), FECHA, "b")
+    lineas = app.leer_ventas_df()
+    mods = app.leer_modificadores_ventas()
+
+    assert lineas[["Id Venta", "Linea"]].astype(str).values.tolist() == [["a", "0"], ["b", "0"], ["b", "1"]]
+    assert mods[["Id Venta", "Linea"]].astype(str).values.tolist() == [["a", "0"], ["b", "1"], ["b", "1"]]
+    # La clave no depende de la posición: vale igual con las líneas reordenadas
+    unidades = app._unidades_modificadores(lineas.iloc[::-1], mods)
+    assert unidades.to_dict() == {"Chispas": 2.0, "Vela": 4.0}
+
+
+def test_importes_en_float64_y_cantidades_en_float32(app):
+    app._subir_ventas(_cobro(), FECHA, "a")
+    tipos = app.leer_ventas_df().dtypes
+    assert str(tipos["Cantidad"]) == "float32"
+    assert all(str(tipos[c]) == "float64" for c in app.COLUMNAS_NUMERICAS_VENTAS if c != "Cantidad")
+
+
+def test_reposicion_con_sub_receta_y_modificadores(app):
+    app._api_put(app.R2_INGREDIENTES, [
+        {"Ingrediente": i, "Unidad de Compra": "kg", "Costo de Compra": costo * 1000,
+         "Cantidad por Unidad de Compra": 1000, "Unidad Receta": "g", "Costo por Unidad Receta": costo}
+        for i, costo in [("Harina", 0.02), ("Agua", 0.001), ("Queso", 0.2)]
+    ])
+    app._api_put(app.R2_RECETAS, [
+        {"Ingrediente": "Harina", "Masa": 200, "Pizza": ""},
+        {"Ingrediente": "Agua", "Masa": 100, "Pizza": ""},
+        {"Ingrediente": "Masa", "Masa": "", "Pizza": 1},
+        {"Ingrediente": "Queso", "Masa": "", "Pizza": 50},
+    ])
+    # Un extra de ingrediente y otro que es la sub-receta
+    app._api_put(app.R2_MODIFICADORES, [
+        {"Modificador": "Extra Queso", "Precio Extra": 5, "Ingrediente Base": "Queso", "Cantidad": 30},
+        {"Modificador": "Doble Masa", "Precio Extra": 8, "Ingrediente Base": "Masa", "Cantidad": 1},
+    ])
+    app._subir_ventas(_cobro("Pizza", mods=["Extra Queso", "Doble Masa"]), FECHA, "a")
+
+    sugerida = {r["Ingrediente"]: r for r in app.calcular_reposicion_sugerida(FECHA, FECHA)}
+    # 2 pizzas: (200 + 200) g de harina, (100 + 100) g de agua y (50 + 30) g de queso cada una
+    assert {i: r["Cantidad Necesaria"] for i, r in sugerida.items()} == {"Agua": 400.0, "Harina": 800.0, "Queso": 160.0}
+    assert sugerida["Harina"]["% Unidad Compra"] == pytest.approx(80.0)
+    assert sugerida["Queso"]["Costo Reposición"] == pytest.approx(32.0)
@@ -0,0 +1,298 @@
+"""Worker local: sustituto de la API de R2 para probar y medir sin el Worker real.
+
+    python worker_local.py --puerto 8787 --api-key prueba --directorio datos_r2
+
+y en .streamlit/secrets.toml:
+
+    WORKER_URL = "http://127.0.0.1:8787/api"
+    API_KEY = "prueba"
+
+Implementa lo que usa app_web.py: GET/PUT/DELETE de objetos JSON o Parquet, ETag e
+If-None-Match, escrituras condicionales (If-Match / If-None-Match: *, 412 si
+la versión no coincide), cuerpos gzip y la consulta incremental "ventas/_cambios".
+
+Con --directorio los objetos se guardan en archivos (uno por objeto, más el
+diario de ventas) y sobreviven a reinicios; sin él viven en memoria. Para
+reproducir una red real: --latencia-ms / --jitter-ms por petición,
+--ancho-banda-kbps para los cuerpos y --tasa-errores (con --semilla) para
+responder --codigo-error a una fracción de las peticiones.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import pandas as pd
+
+TIPO_JSON = "application/json"
+TIPO_PARQUET = "application/vnd.apache.parquet"
+PREFIJO = "/api/"
+CAMBIOS_VENTAS = "ventas/_cambios"
+# "ventas/AAAA-MM/<id>" (o "ventas/sin-fecha/<id>"): segmento de un cobro (ver guardar_ventas)
+SEGMENTO_VENTAS = re.compile(r"^ventas/(\d{4}-\d{2}|sin-fecha)/[^/]+$")
+EXTENSIONES = {TIPO_JSON: ".json", TIPO_PARQUET: ".parquet"}
+DIARIO = "_diario.jsonl"
+
+
+def _registros(cuerpo, tipo):
+    if tipo.startswith(TIPO_PARQUET):
+        return json.loads(pd.read_parquet(io.BytesIO(cuerpo)).to_json(orient="records"))
+    data = json.loads(cuerpo or b"[]")
+    return data if isinstance(data, list) else []
+
+
+class Conflicto(Exception):
+    pass
+
+
+class Almacen:
+    # Objetos por clave y diario de líneas de venta: cada PUT de un segmento
+    # suma sus líneas con una marca creciente. Las bases de partición que
+    # escribe la compactación no pasan por el diario (ya se contaron).
+    # Con directorio, cada objeto es un archivo (clave con "/" escapada: una
+    # clave puede ser prefijo de otra) y el diario se agrega a _diario.jsonl.
+    def __init__(self, directorio=None):
+        self.lock = threading.Lock()
+        self.objetos = {}  # clave -> (cuerpo, content_type, etag)
+        self.diario = []  # (marca, líneas del segmento)
+        self.marca = 0
+        self.generacion = 0  # forma parte del ETag: cambia en cada escritura
+        self.directorio = directorio
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+            self._cargar()
+
+    def _etag(self, cuerpo):
+        self.generacion += 1
+        return f'"{self.generacion}-{hashlib.md5(cuerpo).hexdigest()[:12]}"'
+
+    def _cargar(self):
+        for nombre in sorted(os.listdir(self.directorio)):
+            base, ext = os.path.splitext(nombre)
+            tipo = next((t for t, e in EXTENSIONES.items() if e == ext), None)
+            if tipo is None:
+                continue
+            with open(os.path.join(self.directorio, nombre), "rb") as f:
+                cuerpo = f.read()
+            self.objetos[unquote(base)] = (cuerpo, tipo, self._etag(cuerpo))
+        ruta = os.path.join(self.directorio, DIARIO)
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                for linea in f:
+                    entrada = json.loads(linea)
+                    self.diario.append((entrada["marca"], entrada["lineas"]))
+            self.marca = self.diario[-1][0] if self.diario else 0
+
+    def _ruta(self, clave, tipo):
+        tipo_base = TIPO_PARQUET if tipo.startswith(TIPO_PARQUET) else TIPO_JSON
+        return os.path.join(self.directorio, quote(clave, safe="") + EXTENSIONES[tipo_base])
+
+    def _persistir(self, clave, cuerpo, tipo, lineas):
+        # Escritura atómica (archivo temporal + rename); se llama con el lock tomado
+        ruta = self._ruta(clave, tipo)
+        for otra in EXTENSIONES.values():
+            vieja = os.path.splitext(ruta)[0] + otra
+            if vieja != ruta and os.path.exists(vieja):
+                os.remove(vieja)
+        with open(ruta + ".tmp", "wb") as f:
+            f.write(cuerpo)
+        os.replace(ruta + ".tmp", ruta)
+        if lineas:
+            with open(os.path.join(self.directorio, DIARIO), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"marca": self.marca, "lineas": lineas}) + "\n")
+
+    def leer(self, clave):
+        with self.lock:
+            return self.objetos.get(clave)
+
+    def escribir(self, clave, cuerpo, tipo, si_coincide=None, si_no_existe=False):
+        # Comparar-y-escribir atómico: si_coincide es el ETag que leyó el cliente
+        lineas = _registros(cuerpo, tipo) if SEGMENTO_VENTAS.match(clave) else None
+        with self.lock:
+            previo = self.objetos.get(clave)
+            if si_no_existe and previo is not None:
+                raise Conflicto(clave)
+            if si_coincide is not None and (previo is None or previo[2] != si_coincide):
+                raise Conflicto(clave)
+            etag = self._etag(cuerpo)
+            self.objetos[clave] = (cuerpo, tipo, etag)
+            if lineas:
+                self.marca += 1
+                self.diario.append((self.marca, lineas))
+            if self.directorio:
+                self._persistir(clave, cuerpo, tipo, lineas)
+        return etag
+
+    def borrar(self, clave):
+        # False si no existía. Las líneas que ya entraron al diario se quedan.
+        with self.lock:
+            previo = self.objetos.pop(clave, None)
+            if previo is not None and self.directorio:
+                os.remove(self._ruta(clave, previo[1]))
+        return previo is not None
+
+    def cambios(self, desde=None):
+        with self.lock:
+            if desde is None:
+                return [], self.marca
+            return [l for marca, lineas in self.diario if marca > desde for l in lineas], self.marca
+
+
+class Red:
+    # Condiciones de red simuladas en cada petición: espera fija + jitter,
+    # transferencia del cuerpo a kbps y errores aleatorios reproducibles
+    def __init__(self, latencia_ms=0, jitter_ms=0, kbps=0, tasa_errores=0.0, codigo_error=503, semilla=None):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.kbps = kbps  # 0 = sin límite
+        self.tasa_errores = tasa_errores
+        self.codigo_error = codigo_error
+        self.lock = threading.Lock()
+        self.azar = random.Random(semilla)
+
+    def falla(self):
+        with self.lock:
+            return self.azar.random() < self.tasa_errores
+
+    def transferir(self, n_bytes):
+        if self.kbps and n_bytes:
+            time.sleep(n_bytes * 8 / (self.kbps * 1000))
+
+    def esperar(self, n_bytes=0):
+        with self.lock:
+            jitter = self.azar.uniform(0, self.jitter_ms)
+        if self.latencia_ms or jitter:
+            time.sleep((self.latencia_ms + jitter) / 1000)
+        self.transferir(n_bytes)
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    almacen = None
+    api_key = None
+    red = None
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo=b"", headers=None):
+        if self.red:
+            self.red.esperar(len(cuerpo))
+        self.send_response(codigo)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _json(self, codigo, data, headers=None):
+        self._responder(codigo, json.dumps(data).encode("utf-8"), {"Content-Type": TIPO_JSON, **(headers or {})})
+
+    def _clave(self):
+        # None si la petición no es válida o se simula un error (ya respondida)
+        if self.red and self.red.falla():
+            self._json(self.red.codigo_error, {"error": "error simulado"})
+            return None
+        if self.api_key and self.headers.get("X-API-Key") != self.api_key:
+            self._json(401, {"error": "API key inválida"})
+            return None
+        url = urlsplit(self.path)
+        if not url.path.startswith(PREFIJO):
+            self._json(404, {"error": "ruta desconocida"})
+            return None
+        return url.path[len(PREFIJO):], parse_qs(url.query)
+
+    def do_GET(self):
+        peticion = self._clave()
+        if peticion is None:
+            return
+        clave, params = peticion
+
+        if clave == CAMBIOS_VENTAS:
+            try:
+                desde = int(params["desde"][0]) if "desde" in params else None
+            except ValueError:
+                return self._json(400, {"error": "'desde' debe ser entero"})
+            lineas, marca = self.almacen.cambios(desde)
+            return self._json(200, lineas, {"X-Marca": str(marca)})
+
+        objeto = self.almacen.leer(clave)
+        if objeto is None:
+            return self._json(404, {"error": "no existe"})
+        cuerpo, tipo, etag = objeto
+        if self.headers.get("If-None-Match") == etag:
+            return self._responder(304, headers={"ETag": etag})
+        if tipo.startswith(TIPO_PARQUET) and TIPO_PARQUET not in self.headers.get("Accept", ""):
+            # El cliente no negocia Parquet: se entrega como JSON
+            cuerpo, tipo = json.dumps(_registros(cuerpo, tipo)).encode("utf-8"), TIPO_JSON
+        self._responder(200, cuerpo, {"Content-Type": tipo, "ETag": etag})
+
+    def do_PUT(self):
+        # El cuerpo se lee siempre, aunque la respuesta sea un error
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.red:
+            self.red.transferir(len(cuerpo))
+        peticion = self._clave()
+        if peticion is None:
+            return
+        clave, _ = peticion
+        if self.headers.get("Content-Encoding") == "gzip":
+            cuerpo = gzip.decompress(cuerpo)
+        tipo = self.headers.get("Content-Type", TIPO_JSON)
+        try:
+            etag = self.almacen.escribir(
+                clave, cuerpo, tipo,
+                si_coincide=self.headers.get("If-Match"),
+                si_no_existe=self.headers.get("If-None-Match") == "*",
+            )
+        except Conflicto:
+            return self._json(412, {"error": "la versión no coincide"})
+        except ValueError as e:
+            return self._json(400, {"error": str(e)})
+        self._json(200, {"ok": True}, {"ETag": etag})
+
+
+    def do_DELETE(self):
+        peticion = self._clave()
+        if peticion is None:
+            return
+        clave, _ = peticion
+        if not self.almacen.borrar(clave):
+            return self._json(404, {"error": "no existe"})
+        self._json(200, {"ok": True})
+
+
+def iniciar(puerto=0, api_key=None, almacen=None, red=None):
+    # Arranca el servidor en un hilo; devuelve (servidor, url base para WORKER_URL)
+    manejador = type("Manejador", (_Manejador,), {"almacen": almacen or Almacen(), "api_key": api_key, "red": red})
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}{PREFIJO.rstrip('/')}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--puerto", type=int, default=8787)
+    parser.add_argument("--api-key", default=None, help="si se indica, se exige en X-API-Key")
+    parser.add_argument("--directorio", default=None, help="guarda los objetos en archivos (si no, en memoria)")
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0, help="se suma a la latencia, uniforme en [0, jitter]")
+    parser.add_argument("--ancho-banda-kbps", type=float, default=0, help="0 = sin límite")
+    parser.add_argument("--tasa-errores", type=float, default=0.0, help="fracción de peticiones que fallan")
+    parser.add_argument("--codigo-error", type=int, default=503)
+    parser.add_argument("--semilla", type=int, default=None, help="para repetir la misma secuencia de errores")
+    args = parser.parse_args()
+    red = Red(args.latencia_ms, args.jitter_ms, args.ancho_banda_kbps, args.tasa_errores, args.codigo_error, args.semilla)
+    servidor, url = iniciar(args.puerto, args.api_key, Almacen(args.directorio), red)
+    print(f"Worker local en {url}" + (f" · datos en {args.directorio}" if args.directorio else ""))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()